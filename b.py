@@ -1,12 +1,77 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException, Header, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-import vertexai
-from vertexai.generative_models import GenerativeModel, Part
-from typing import Dict, Any
-import io
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from vertexai.generative_models import Part
+from contextlib import AsyncExitStack, asynccontextmanager, nullcontext
+from types import MappingProxyType
+from typing import Dict, Any, AsyncIterator, Awaitable, Callable, Mapping, Optional, Tuple, TypeVar
+import asyncio
+import datetime
+import json
+import math
+import os
+import time
+from catalog import CatalogEntry, ReferenceCatalog, SkuSpec, references_bytes, sku_references
+from engine import InspectionEngine, create_model
+from ensemble import EnsembleResult, build_ensemble, parse_weights
+from job_queue import LANES, Job, QueueFullError, deliver_callback, queue_from_env, validate_callback_url
+from metrics import HTTP_REQUESTS, HTTP_SECONDS, IN_FLIGHT, REGISTRY, VERDICTS, counter, gauge, record_usage, span, stage
+from model_backends import BACKEND
+from resilient_client import CircuitOpenError, ResilientModel, is_retryable
+from preprocessing import PreprocessedImage, UnsupportedImageError, preprocess_image, settings_fingerprint, sniff_mime_type
+from prescreen import Prescreener, prescreener_from_env
+from profiles import DEFAULT_PROFILE, PromptProfile, get_profile
+from reference_index import ReferenceIndex
+from result_cache import bytes_digest, cache_from_env
+from result_sink import sink_from_env
+from schemas import CRITERIA, AnalysisResult, VerdictStreamParser
 
-app = FastAPI()
+# Inference concurrency and backpressure settings, overridable per deployment
+MAX_IN_FLIGHT = int(os.getenv("ANALYZE_MAX_IN_FLIGHT", "8"))
+QUEUE_TIMEOUT_SECONDS = float(os.getenv("ANALYZE_QUEUE_TIMEOUT_SECONDS", "2"))
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("ANALYZE_REQUEST_TIMEOUT_SECONDS", "60"))
+RETRY_AFTER_SECONDS = int(os.getenv("ANALYZE_RETRY_AFTER_SECONDS", "5"))
+
+CONTEXT_CACHE_ENABLED = os.getenv("CONTEXT_CACHE_ENABLED", "1").lower() in ("1", "true", "yes")
+CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("CONTEXT_CACHE_TTL_SECONDS", "3600"))
+
+# Profiles whose context caches are built when a SKU is loaded, besides the SKU's own
+WARM_PROFILES = [name for name in os.getenv("ANALYZE_WARM_PROFILES", DEFAULT_PROFILE).split(",") if name]
+
+# Asynchronous job queue: its own worker pool, decoupled from the synchronous in-flight limit
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_MAX_DEPTH = int(os.getenv("JOB_QUEUE_MAX_DEPTH", "10000"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the model client once per worker; SKU reference bundles load on first use
+    app.state.ready = False
+    app.state.reload_lock = asyncio.Lock()
+    app.state.inference_slots = asyncio.Semaphore(MAX_IN_FLIGHT)
+    app.state.model = None
+    app.state.result_cache = cache_from_env()
+    app.state.catalog = ReferenceCatalog(build_catalog_entry)
+    app.state.result_sink = sink_from_env()
+    app.state.job_queue = queue_from_env()
+    app.state.job_wakeup = asyncio.Event()
+    await run_in_threadpool(warm_up, app)
+    job_workers = [asyncio.create_task(job_worker()) for _ in range(JOB_WORKERS)]
+    yield
+    app.state.ready = False
+    # Interrupted jobs stop renewing their leases; once those lapse, any worker sharing the database requeues them
+    for task in job_workers:
+        task.cancel()
+    await asyncio.gather(*job_workers, return_exceptions=True)
+    app.state.job_queue.close()
+    # Drain buffered verdict records before exit
+    await run_in_threadpool(app.state.result_sink.close)
+    await run_in_threadpool(app.state.catalog.close)
+    await run_in_threadpool(app.state.result_cache.close)
+
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware with more permissive settings
 app.add_middleware(
@@ -17,103 +82,648 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all headers
 )
 
-class AnalysisResult(BaseModel):
-    analysis: str
-    overall_assessment: str
-
-def initialize_model() -> GenerativeModel:
-    vertexai.init(project="fresh-span-400217", location="us-central1")
-    return GenerativeModel("gemini-1.5-flash-001")
-
-def load_reference_materials() -> Dict[str, Part]:
-    reference_materials = {
-        "video": Part.from_uri(
-            mime_type="video/mp4",
-            uri="gs://ngk-ai/NGK SILKFR8A6 Laser Iridium Spark Plug-Video quick Manual.mp4"
-        ),
-        "document": Part.from_uri(
-            mime_type="application/pdf",
-            uri="gs://ngk-ai/NGK SILKFR8A6 Laser Iridium Spark Plug.pdf"
-        )
-    }
-    
-    for i in range(1, 23):
-        uri = f"gs://ngk-ai/NGK SILKFR8A6 Laser Iridium Spark Plug_Image{i}.jpeg"
-        reference_materials[f"reference_image_{i}"] = Part.from_uri(mime_type="image/jpeg", uri=uri)
-    
-    return reference_materials
-
-def create_anomaly_detection_prompt(uploaded_image: Part, reference_materials: Dict[str, Part]) -> list[Any]:
-    prompt = [
-        """Analyze the uploaded spark plug image for these major issues:
-        1. Black Marks: Look for noticeable black marks or discolorations.
-        2. Missing Branding: Check if the "NGK" branding and model number are absent or unreadable.
-        3. Missing Parts: Verify all essential parts are present (hexagonal nut, insulator, metal shell, precious metal tip).
-        4. Nut Bending: Look for significant bending or distortion of the hexagonal nut.
-        5. Tip Condition: Examine the precious metal tip for blur, damage, wear, melting, or deformation.
-
-        For each criterion, state if it's normal or if there's an issue. Describe detected anomalies in detail.
-        Provide a summary of all detected major anomalies.
-        Conclude with an overall assessment: 'PASS' if no major issues, 'FAIL' if any major issues detected.
-        """
-    ]
-    
-    prompt.append(uploaded_image)
-    prompt.extend(reference_materials.values())
-    with open("prompt.txt", "w") as f:
-        f.write(str(prompt))
-    
-    return prompt
-
-def detect_anomalies(model: GenerativeModel, uploaded_image: Part, reference_materials: Dict[str, Part]) -> AnalysisResult:
-    prompt = create_anomaly_detection_prompt(uploaded_image, reference_materials)
-    
-    generation_config = {
-        "max_output_tokens": 2048,
-        "temperature": 0.2,
-        "top_p": 0.8,
-    }
-    
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
     try:
-        response = model.generate_content(
-            prompt,
-            generation_config=generation_config,
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template, not raw path, to keep series bounded; streams are timed to their first byte
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        HTTP_REQUESTS.inc(route=path, method=request.method, status=status)
+        HTTP_SECONDS.observe(time.perf_counter() - started, route=path, method=request.method)
+
+# Read at scrape time from the stats the catalog, prescreeners, model client and job queue already keep
+def result_cache_samples() -> Dict[Tuple[str, ...], float]:
+    stats = app.state.result_cache.stats()
+    return {("hit",): stats["hits"], ("disk_hit",): stats["disk_hits"], ("miss",): stats["misses"]}
+
+def prescreen_samples() -> Dict[Tuple[str, ...], float]:
+    samples = {}
+    for entry in app.state.catalog.loaded():
+        if entry.prescreener is not None:
+            stats = entry.prescreener.stats.snapshot()
+            samples[(entry.spec.sku, "passed")] = stats["passed"]
+            samples[(entry.spec.sku, "escalated")] = stats["escalated"]
+    return samples
+
+def catalog_samples() -> Dict[Tuple[str, ...], float]:
+    stats = app.state.catalog.stats()
+    return {(event,): stats[event] for event in ("loads", "hits", "evictions")}
+
+def model_client_stats() -> Dict[str, Any]:
+    model = app.state.model
+    return model.stats() if isinstance(model, ResilientModel) else {}
+
+def model_client_samples() -> Dict[Tuple[str, ...], float]:
+    stats = model_client_stats()
+    return {(name,): stats[name] for name in ("calls", "retries", "failovers", "hedges", "hedge_wins", "circuit_rejections") if name in stats}
+
+def breaker_samples() -> Dict[Tuple[str, ...], float]:
+    targets = model_client_stats().get("targets", {})
+    return {(target, state): 1.0 if current == state else 0.0 for target, current in targets.items() for state in ("closed", "half_open", "open")}
+
+def job_queue_samples() -> Dict[Tuple[str, ...], float]:
+    return {(lane,): depth for lane, depth in app.state.job_queue.metrics()["depth_by_lane"].items()}
+
+def job_wait_samples() -> Dict[Tuple[str, ...], float]:
+    metrics = app.state.job_queue.metrics()
+    return {(quantile,): metrics[key] for quantile, key in (("0.5", "wait_p50_seconds"), ("0.95", "wait_p95_seconds")) if metrics[key] is not None}
+
+counter("spark_plug_result_cache_lookups_total", "Result cache lookups by outcome", ["outcome"], callback=result_cache_samples)
+gauge("spark_plug_result_cache_hit_ratio", "Share of result cache lookups served from the cache",
+      callback=lambda: {(): app.state.result_cache.stats()["hit_ratio"]})
+counter("spark_plug_prescreen_decisions_total", "Local pre-screen outcomes", ["sku", "decision"], callback=prescreen_samples)
+counter("spark_plug_model_client_events_total", "Model client calls, retries, failovers and hedges", ["event"], callback=model_client_samples)
+gauge("spark_plug_model_circuit_state", "Circuit breaker state per model target", ["target", "state"], callback=breaker_samples)
+gauge("spark_plug_job_queue_depth", "Queued inspection jobs per lane", ["lane"], callback=job_queue_samples)
+gauge("spark_plug_job_wait_seconds", "Recent job queue wait time", ["quantile"], callback=job_wait_samples)
+gauge("spark_plug_reference_materials", "Reference parts loaded per SKU", ["sku"],
+      callback=lambda: {(entry.spec.sku,): len(entry.engine.reference_materials) for entry in app.state.catalog.loaded()})
+counter("spark_plug_catalog_events_total", "SKU bundle loads, LRU hits and evictions", ["event"], callback=catalog_samples)
+gauge("spark_plug_catalog_loaded_bytes", "Estimated memory held by loaded SKU bundles",
+      callback=lambda: {(): app.state.catalog.stats()["loaded_bytes"]})
+
+counter("spark_plug_result_sink_records_total", "Verdict records handed to the result sink", ["outcome"],
+        callback=lambda: {(outcome,): value for outcome, value in app.state.result_sink.stats().items() if outcome != "pending"})
+gauge("spark_plug_result_sink_pending", "Verdict records buffered for the result sink",
+      callback=lambda: {(): app.state.result_sink.stats()["pending"]})
+
+def record_verdict(
+    image_digest: str,
+    sku: str,
+    profile: str,
+    result: AnalysisResult,
+    source: str,
+    seconds: float,
+    prompt: Optional[str] = None,
+    **extra: Any,
+):
+    VERDICTS.inc(profile=profile, verdict=result.overall_assessment or "UNKNOWN", source=source)
+    # Only enqueues; the sink's own thread does the disk write
+    app.state.result_sink.write({
+        "ts": round(time.time(), 3),
+        "image": image_digest,
+        "sku": sku,
+        "profile": profile,
+        "prompt": prompt,
+        "verdict": result.overall_assessment,
+        "confidence": result.confidence,
+        "criteria": {name: getattr(result.criteria, name).status for name in CRITERIA} if result.criteria else None,
+        "source": source,
+        "latency_ms": round(seconds * 1000, 1),
+        **extra,
+    })
+
+def load_sku_index(spec: SkuSpec) -> Optional[ReferenceIndex]:
+    if not spec.index_path or not os.path.exists(spec.index_path):
+        return None
+    return ReferenceIndex.load(spec.index_path)
+
+def build_catalog_entry(spec: SkuSpec) -> CatalogEntry:
+    # Every SKU shares the worker's model client and result cache; only the references differ
+    engine = InspectionEngine(
+        result_cache=app.state.result_cache,
+        # Stub and cassette backends have no server-side cache to bind to
+        context_caching=CONTEXT_CACHE_ENABLED and BACKEND == "vertex",
+        context_cache_ttl=datetime.timedelta(seconds=CONTEXT_CACHE_TTL_SECONDS),
+        model_factory=lambda: app.state.model,
+        reference_loader=lambda: MappingProxyType(sku_references(spec)),
+        reference_top_k=spec.top_k,
+        index_loader=lambda: load_sku_index(spec),
+        always_include=spec.always_include,
+        cache_namespace=spec.sku,
+    )
+    engine.warm_up(dict.fromkeys([spec.profile] + WARM_PROFILES))
+
+    prescreener = None
+    if spec.prescreen_dir:
+        prescreener = Prescreener.from_directory(
+            spec.prescreen_dir,
+            pass_hash_distance=spec.prescreen_pass_hash_distance,
+            min_similarity=spec.prescreen_min_similarity,
         )
+    elif spec.sku == app.state.catalog.default_sku:
+        # PRESCREEN_REFERENCE_DIR predates the catalog and describes the default plug model
+        prescreener = prescreener_from_env()
+    size_bytes = references_bytes(engine.reference_materials)
+    if engine.reference_index is not None:
+        size_bytes += engine.reference_index.descriptors.nbytes
+    if prescreener is not None:
+        stats = prescreener.stats
+        engine.observers.append(lambda profile, result, seconds: stats.record_model(seconds))
+        size_bytes += prescreener.hashes.nbytes + prescreener.embeddings.nbytes
+    return CatalogEntry(spec, engine, prescreener, size_bytes)
+
+def warm_up(app: FastAPI):
+    app.state.model = create_model()
+    app.state.catalog.prewarm()
+    app.state.ready = True
+
+def resolve_profile(name: str, structured_only: bool = False) -> PromptProfile:
+    try:
+        profile = get_profile(name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if structured_only and not profile.structured:
+        raise HTTPException(status_code=400, detail=f"Profile '{name}' does not produce structured verdicts")
+    return profile
 
-        analysis = response.text
-        overall_assessment = "PASS" if "PASS" in analysis else "FAIL"
+@asynccontextmanager
+async def held_sku(sku: Optional[str]) -> AsyncIterator[CatalogEntry]:
+    catalog: ReferenceCatalog = app.state.catalog
+    try:
+        catalog.manifest.spec(sku)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # A SKU that isn't loaded yet is built here, off the event loop. Holding the entry keeps an
+    # LRU eviction from dropping its context caches while this request still uses them
+    entry = await run_in_threadpool(catalog.acquire, sku)
+    try:
+        yield entry
+    finally:
+        await run_in_threadpool(catalog.release, entry)
+
+T = TypeVar("T")
 
-        return AnalysisResult(analysis=analysis, overall_assessment=overall_assessment)
+async def bounded_inference(call: Awaitable[T]) -> T:
+    # Applies the request deadline and maps model failures onto HTTP statuses
+    try:
+        return await asyncio.wait_for(call, timeout=REQUEST_TIMEOUT_SECONDS)
+    except HTTPException:
+        raise
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"Anomaly detection timed out after {REQUEST_TIMEOUT_SECONDS:g}s")
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after) or 1)})
     except Exception as e:
+        if is_retryable(e):
+            # Quota or backend trouble that outlasted the client's retries; the caller can try again
+            raise HTTPException(
+                status_code=503,
+                detail=f"Model backend unavailable: {str(e)}",
+                headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+            )
         raise HTTPException(status_code=500, detail=f"Error in anomaly detection: {str(e)}")
 
+async def detect_anomalies(
+    engine: InspectionEngine,
+    profile: PromptProfile,
+    uploaded_image: Part,
+    references: Mapping[str, Part],
+) -> AnalysisResult:
+    return await bounded_inference(engine.inspect_async(profile, uploaded_image, references=references))
+
+def upload_digest(image_digest: str) -> str:
+    # Preprocessing settings change what the model sees, so they are part of the cache key
+    return f"{image_digest}|{settings_fingerprint()}"
+
+async def prepare_upload(content: bytes) -> PreprocessedImage:
+    try:
+        with stage("preprocess"):
+            return await run_in_threadpool(preprocess_image, content)
+    except UnsupportedImageError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+
+@asynccontextmanager
+async def inference_slot():
+    slots: asyncio.Semaphore = app.state.inference_slots
+    try:
+        await asyncio.wait_for(slots.acquire(), timeout=QUEUE_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=503,
+            detail="Inference capacity saturated, retry later",
+            headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+        )
+    IN_FLIGHT.inc()
+    try:
+        yield
+    finally:
+        IN_FLIGHT.dec()
+        slots.release()
+
 @app.get("/health")
 async def health_check():
-    return {"status": "ok"}
+    if not getattr(app.state, "ready", False):
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    skus = {}
+    for entry in app.state.catalog.loaded():
+        engine = entry.engine
+        skus[entry.spec.sku] = {
+            "profile": entry.spec.profile,
+            "reference_materials": len(engine.reference_materials),
+            "context_caching": engine.context_caching and not engine.subset_selection,
+            "reference_subset": {
+                "indexed": len(engine.reference_index.names),
+                "top_k": engine.reference_top_k,
+            } if engine.subset_selection else None,
+            "prescreen": entry.prescreener.stats.snapshot() if entry.prescreener is not None else None,
+        }
+    return {
+        "status": "ok",
+        "catalog": app.state.catalog.stats(),
+        "skus": skus,
+        "result_cache": app.state.result_cache.stats(),
+        "model_client": model_client_stats() or None,
+        "jobs": await run_in_threadpool(app.state.job_queue.metrics),
+        "result_sink": app.state.result_sink.stats(),
+    }
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    # Callback metrics touch SQLite, so render off the event loop
+    return PlainTextResponse(await run_in_threadpool(REGISTRY.render), media_type="text/plain; version=0.0.4")
+
+@app.post("/reload")
+async def reload_reference_materials(reinitialize_model: bool = False):
+    # Re-reads the catalog manifest too, so new SKUs can be served without a restart
+    async with app.state.reload_lock:
+        try:
+            if reinitialize_model:
+                app.state.model = await run_in_threadpool(create_model)
+            summary = await run_in_threadpool(app.state.catalog.reload, reinitialize_model)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error reloading reference materials: {str(e)}")
+    return {"status": "reloaded", **summary}
+
+async def inspect_upload(
+    content: bytes,
+    profile: PromptProfile,
+    entry: CatalogEntry,
+    bypass: bool = False,
+    slot: Callable[[], Any] = nullcontext,
+) -> Tuple[AnalysisResult, Dict[str, str]]:
+    # Cache, pre-screen, then the model; shared by /analyze/ and the job workers
+    engine: InspectionEngine = entry.engine
+    sku = entry.spec.sku
+    image_digest = bytes_digest(content)
+    headers: Dict[str, str] = {"X-SKU": sku}
+
+    if not bypass:
+        started = time.perf_counter()
+        with stage("cache_lookup"):
+            cached = await run_in_threadpool(engine.cached_result, profile, upload_digest(image_digest))
+        if cached is not None:
+            record_verdict(image_digest, sku, profile.name, cached, "cache", time.perf_counter() - started)
+            headers["X-Cache"] = "HIT"
+            return cached, headers
+
+    upload = await prepare_upload(content)
+    if not bypass:
+        prescreener = entry.prescreener
+        if prescreener is not None:
+            with stage("prescreen"):
+                screened = await run_in_threadpool(prescreener.screen, upload.image)
+            headers["X-Prescreen"] = screened.decision
+            if not screened.escalate:
+                result = AnalysisResult(analysis=screened.summary(), overall_assessment="PASS")
+                record_verdict(image_digest, sku, profile.name, result, "prescreen", screened.seconds)
+                return result, headers
+
+    with stage("part_build"):
+        uploaded_image = Part.from_data(data=upload.data, mime_type=upload.mime_type)
+    # Pick the references closest to the upload's pose from the already decoded image
+    with stage("reference_select"):
+        references = await run_in_threadpool(engine.references_for, upload.image)
+
+    async with slot():
+        started = time.perf_counter()
+        analysis_result = await detect_anomalies(engine, profile, uploaded_image, references)
+        model_seconds = time.perf_counter() - started
+
+    record_verdict(
+        image_digest, sku, profile.name, analysis_result, "model", model_seconds,
+        prompt=engine.prompt_fingerprint(profile, references),
+    )
+    with stage("cache_store"):
+        await run_in_threadpool(engine.store_result, profile, upload_digest(image_digest), analysis_result)
+    headers["X-Cache"] = "BYPASS" if bypass else "MISS"
+    return analysis_result, headers
+
+async def keep_lease(job_id: str):
+    queue = app.state.job_queue
+    while True:
+        await asyncio.sleep(queue.lease_seconds / 3)
+        if not await run_in_threadpool(queue.renew, job_id):
+            return
+
+async def run_job(job: Job):
+    queue = app.state.job_queue
+    lease = asyncio.ensure_future(keep_lease(job.id))
+    try:
+        try:
+            async with held_sku(job.sku) as entry:
+                result, _ = await inspect_upload(job.payload, get_profile(job.profile), entry)
+        except HTTPException as e:
+            # A lost lease means another worker owns the job now; leave it to that one
+            if not await run_in_threadpool(queue.renew, job.id):
+                return
+            # Saturation and timeouts are worth another attempt later; bad uploads are not
+            requeued = await run_in_threadpool(queue.fail, job.id, str(e.detail), e.status_code in (503, 504))
+            if requeued:
+                return
+        except Exception as e:
+            if not await run_in_threadpool(queue.renew, job.id):
+                return
+            await run_in_threadpool(queue.fail, job.id, str(e))
+        else:
+            if not await run_in_threadpool(queue.complete, job.id, result.model_dump_json()):
+                return
+    finally:
+        lease.cancel()
+
+    if job.callback_url:
+        finished = await run_in_threadpool(queue.get, job.id)
+        callback_status = await run_in_threadpool(deliver_callback, job.callback_url, finished.to_dict())
+        await run_in_threadpool(queue.set_callback_status, job.id, callback_status)
+
+async def job_worker():
+    queue = app.state.job_queue
+    wakeup: asyncio.Event = app.state.job_wakeup
+    last_prune = 0.0
+    while True:
+        try:
+            job = await run_in_threadpool(queue.claim)
+            if job is None:
+                if time.monotonic() - last_prune > 3600:
+                    last_prune = time.monotonic()
+                    await run_in_threadpool(queue.prune, JOB_RETENTION_SECONDS)
+                wakeup.clear()
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout=JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await run_job(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Keep the worker alive; the job goes back to the queue once its lease expires
+            print(f"Job worker error: {e}")
+            await asyncio.sleep(JOB_POLL_SECONDS)
+
+@app.post("/jobs", status_code=202)
+async def create_job(
+    response: Response,
+    file: UploadFile = File(...),
+    profile: Optional[str] = Query(default=None),
+    sku: Optional[str] = Query(default=None),
+    lane: str = Query(default="normal"),
+    callback_url: Optional[str] = Form(default=None),
+    idempotency_key: Optional[str] = Header(default=None),
+):
+    try:
+        # Pin the SKU and its profile now so later manifest edits don't change queued jobs
+        spec = app.state.catalog.manifest.spec(sku)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    profile = resolve_profile(profile or spec.profile).name
+    if lane not in LANES:
+        raise HTTPException(status_code=400, detail=f"Unknown lane '{lane}', expected one of: {', '.join(LANES)}")
+    if callback_url:
+        try:
+            validate_callback_url(callback_url)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    content = await file.read()
+    try:
+        mime_type = sniff_mime_type(content)
+    except UnsupportedImageError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+
+    queue = app.state.job_queue
+    try:
+        job, created = await run_in_threadpool(
+            queue.enqueue, content, mime_type, profile, lane, idempotency_key, callback_url, spec.sku,
+            JOB_QUEUE_MAX_DEPTH,
+        )
+    except QueueFullError:
+        raise HTTPException(
+            status_code=503,
+            detail="Job queue is full, retry later",
+            headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+        )
+    if created:
+        app.state.job_wakeup.set()
+    else:
+        # Same idempotency key: hand back the original job instead of inspecting twice
+        response.status_code = 200
+    response.headers["Location"] = f"/jobs/{job.id}"
+    return job.to_dict()
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await run_in_threadpool(app.state.job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job '{job_id}'")
+    return job.to_dict()
 
 @app.options("/analyze")
 async def options_analyze():
     return {}  # This is needed for CORS preflight requests
 
 @app.post("/analyze/", response_model=AnalysisResult)
-async def analyze_spark_plug(file: UploadFile = File(...)):
+async def analyze_spark_plug(
+    response: Response,
+    file: UploadFile = File(...),
+    profile: Optional[str] = Query(default=None),
+    sku: Optional[str] = Query(default=None),
+    x_cache_bypass: Optional[str] = Header(default=None),
+):
     if not file:
         raise HTTPException(status_code=400, detail="No file uploaded")
-    
+    if not getattr(app.state, "ready", False):
+        raise HTTPException(status_code=503, detail="Model is still warming up")
+    async with held_sku(sku) as entry:
+        prompt_profile = resolve_profile(profile or entry.spec.profile)
+
+        try:
+            with span("analyze", profile=prompt_profile.name, sku=entry.spec.sku):
+                with stage("upload_read"):
+                    content = await file.read()
+                bypass = x_cache_bypass is not None and x_cache_bypass.lower() in ("1", "true", "yes")
+                analysis_result, headers = await inspect_upload(content, prompt_profile, entry, bypass, inference_slot)
+            response.headers.update(headers)
+            return analysis_result
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
+
+@app.post("/analyze/ensemble", response_model=EnsembleResult)
+async def analyze_spark_plug_ensemble(
+    response: Response,
+    file: UploadFile = File(...),
+    profiles: Optional[str] = Query(default=None, description="Comma-separated profiles; defaults to ENSEMBLE_PROFILES"),
+    weights: Optional[str] = Query(default=None, description="profile=weight pairs, e.g. strict=1,refined=2"),
+    fail_quorum: Optional[float] = Query(default=None),
+    sku: Optional[str] = Query(default=None),
+    x_cache_bypass: Optional[str] = Header(default=None),
+):
+    if not getattr(app.state, "ready", False):
+        raise HTTPException(status_code=503, detail="Model is still warming up")
+    try:
+        ensemble = build_ensemble(
+            [name for name in profiles.split(",") if name] if profiles else None,
+            parse_weights(weights) if weights is not None else None,
+            fail_quorum,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    async with held_sku(sku) as entry:
+        engine: InspectionEngine = entry.engine
+
+        with span("analyze_ensemble", profiles=ensemble.name, sku=entry.spec.sku):
+            with stage("upload_read"):
+                content = await file.read()
+            image_digest = bytes_digest(content)
+            bypass = x_cache_bypass is not None and x_cache_bypass.lower() in ("1", "true", "yes")
+            # No pre-screen here: the point of an ensemble is to hear from every prompt
+            upload = await prepare_upload(content)
+            with stage("part_build"):
+                uploaded_image = Part.from_data(data=upload.data, mime_type=upload.mime_type)
+            with stage("reference_select"):
+                references = await run_in_threadpool(engine.references_for, upload.image)
+
+            # Each profile sent to the model takes its own slot; cached votes take none
+            started = time.perf_counter()
+            result = await bounded_inference(ensemble.run(
+                engine, uploaded_image, references,
+                image_digest=None if bypass else upload_digest(image_digest),
+                slot=inference_slot,
+            ))
+            seconds = time.perf_counter() - started
+
+    sources = {vote.source for vote in result.votes.values() if vote.overall_assessment is not None}
+    record_verdict(
+        image_digest, entry.spec.sku, ensemble.name, result, "cache" if sources == {"cache"} else "model", seconds,
+        votes={name: vote.overall_assessment or vote.source for name, vote in result.votes.items()},
+        split=result.disagreement.split,
+    )
+    response.headers.update({
+        "X-SKU": entry.spec.sku,
+        "X-Ensemble-Split": "1" if result.disagreement.split else "0",
+    })
+    return result
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+async def stream_analysis(
+    stack: AsyncExitStack,
+    entry: CatalogEntry,
+    profile: PromptProfile,
+    uploaded_image: Part,
+    references: Mapping[str, Part],
+    image_digest: str,
+) -> AsyncIterator[str]:
+    engine: InspectionEngine = entry.engine
+    started = time.perf_counter()
+
+    def elapsed_ms() -> float:
+        return round((time.perf_counter() - started) * 1000, 1)
+
+    parser = VerdictStreamParser()
+    last_chunk = None
     try:
-        content = await file.read()
-        image = io.BytesIO(content)
-        
-        uploaded_image = Part.from_data(data=image.getvalue(), mime_type=file.content_type)
-        
-        model = initialize_model()
-        reference_materials = load_reference_materials()
-        
-        analysis_result = detect_anomalies(model, uploaded_image, reference_materials)
-        
-        return analysis_result
+        chunks = await asyncio.wait_for(
+            engine.generate_async(profile, uploaded_image, stream=True, references=references),
+            timeout=REQUEST_TIMEOUT_SECONDS,
+        )
+        iterator = chunks.__aiter__()
+        while True:
+            remaining = REQUEST_TIMEOUT_SECONDS - (time.perf_counter() - started)
+            try:
+                chunk = await asyncio.wait_for(iterator.__anext__(), timeout=max(remaining, 0.001))
+            except StopAsyncIteration:
+                break
+            last_chunk = chunk
+            for event, data in parser.feed(chunk.text):
+                yield sse_event(event, {**data, "elapsed_ms": elapsed_ms()})
+
+        # Token counts ride on the final chunk
+        record_usage(last_chunk)
+        with stage("parse", profile=profile.name):
+            analysis_result = profile.parse(parser.buffer)
+        model_seconds = time.perf_counter() - started
+        engine.notify(profile, analysis_result, model_seconds)
+        record_verdict(
+            image_digest, entry.spec.sku, profile.name, analysis_result, "model", model_seconds,
+            prompt=engine.prompt_fingerprint(profile, references),
+        )
+        yield sse_event("result", {**analysis_result.model_dump(), "elapsed_ms": elapsed_ms()})
+        await run_in_threadpool(engine.store_result, profile, upload_digest(image_digest), analysis_result)
+    except asyncio.TimeoutError:
+        yield sse_event("error", {"detail": f"Anomaly detection timed out after {REQUEST_TIMEOUT_SECONDS:g}s"})
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
+        yield sse_event("error", {"detail": f"Error in anomaly detection: {str(e)}", "retryable": is_retryable(e) or isinstance(e, CircuitOpenError)})
+    finally:
+        await stack.aclose()
+
+@app.post("/analyze/stream")
+async def analyze_spark_plug_stream(
+    file: UploadFile = File(...),
+    profile: Optional[str] = Query(default=None),
+    sku: Optional[str] = Query(default=None),
+    x_cache_bypass: Optional[str] = Header(default=None),
+):
+    if not getattr(app.state, "ready", False):
+        raise HTTPException(status_code=503, detail="Model is still warming up")
+    # The entry and, later, the inference slot stay held until stream_analysis closes the stack
+    stack = AsyncExitStack()
+    entry = await stack.enter_async_context(held_sku(sku))
+    try:
+        # Early per-criterion events need the JSON verdict format
+        prompt_profile = resolve_profile(profile or entry.spec.profile, structured_only=True)
+        engine: InspectionEngine = entry.engine
+
+        with stage("upload_read"):
+            content = await file.read()
+        image_digest = bytes_digest(content)
+        headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-SKU": entry.spec.sku}
+
+        bypass = x_cache_bypass is not None and x_cache_bypass.lower() in ("1", "true", "yes")
+        result = None
+        started = time.perf_counter()
+        if not bypass:
+            with stage("cache_lookup"):
+                result = await run_in_threadpool(engine.cached_result, prompt_profile, upload_digest(image_digest))
+        upload = await prepare_upload(content) if result is None else None
+        if not bypass:
+            decided_by, seconds = "cache", time.perf_counter() - started
+            if result is None and entry.prescreener is not None:
+                with stage("prescreen"):
+                    screened = await run_in_threadpool(entry.prescreener.screen, upload.image)
+                if not screened.escalate:
+                    result = AnalysisResult(analysis=screened.summary(), overall_assessment="PASS")
+                    decided_by, seconds = "prescreen", screened.seconds
+            if result is not None:
+                record_verdict(image_digest, entry.spec.sku, prompt_profile.name, result, decided_by, seconds)
+                async def immediate() -> AsyncIterator[str]:
+                    yield sse_event("verdict", {"overall_assessment": result.overall_assessment, "decided_by": decided_by, "elapsed_ms": 0.0})
+                    yield sse_event("result", {**result.model_dump(), "elapsed_ms": 0.0})
+                await stack.aclose()
+                return StreamingResponse(immediate(), media_type="text/event-stream", headers=headers)
+
+        with stage("part_build"):
+            uploaded_image = Part.from_data(data=upload.data, mime_type=upload.mime_type)
+        with stage("reference_select"):
+            references = await run_in_threadpool(engine.references_for, upload.image)
+        # Hold the inference slot for the lifetime of the stream, but reject with 503 before it starts
+        await stack.enter_async_context(inference_slot())
+        return StreamingResponse(
+            stream_analysis(stack, entry, prompt_profile, uploaded_image, references, image_digest),
+            media_type="text/event-stream",
+            headers=headers,
+        )
+    except BaseException:
+        await stack.aclose()
+        raise
 
 if __name__ == "__main__":
     import uvicorn
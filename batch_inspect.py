@@ -0,0 +1,265 @@
+import argparse
+import glob
+import hashlib
+import json
+import mimetypes
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from vertexai.generative_models import Part
+
+from batched_prompt import BatchSizeTuner
+from engine import InspectionEngine
+from metrics import percentile
+from preprocessing import IMAGE_EXTENSIONS
+from profiles import PROFILES, PromptProfile, get_profile
+from resilient_client import CircuitOpenError, is_retryable
+from schemas import AnalysisResult
+
+class RateLimiter:
+    def __init__(self, rate_per_second: float):
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+class RetryBudget:
+    def __init__(self, total: int):
+        self.remaining = total
+        self._lock = threading.Lock()
+
+    def take(self, count: int = 1) -> bool:
+        with self._lock:
+            if self.remaining < count:
+                return False
+            self.remaining -= count
+            return True
+
+def is_image(path: str) -> bool:
+    return path.lower().endswith(IMAGE_EXTENSIONS)
+
+def list_gcs_prefix(uri: str) -> List[str]:
+    from google.cloud import storage
+
+    bucket_name, _, prefix = uri[len("gs://"):].partition("/")
+    blobs = storage.Client().list_blobs(bucket_name, prefix=prefix)
+    return [f"gs://{bucket_name}/{blob.name}" for blob in blobs if is_image(blob.name)]
+
+def collect_sources(source: str) -> List[str]:
+    if source.startswith("gs://"):
+        if is_image(source):
+            return [source]
+        return list_gcs_prefix(source)
+    if os.path.isdir(source):
+        paths = glob.glob(os.path.join(source, "**", "*"), recursive=True)
+        return sorted(p for p in paths if is_image(p))
+    if any(ch in source for ch in "*?["):
+        return sorted(p for p in glob.glob(source, recursive=True) if is_image(p))
+    if is_image(source):
+        return [source]
+    # Anything else is treated as a manifest: one path or gs:// URI per line
+    with open(source) as f:
+        lines = [line.strip() for line in f]
+    return [line for line in lines if line and not line.startswith("#")]
+
+def load_image_part(source: str) -> Part:
+    mime_type = mimetypes.guess_type(source)[0] or "image/jpeg"
+    if source.startswith("gs://"):
+        return Part.from_uri(mime_type=mime_type, uri=source)
+    with open(source, "rb") as f:
+        return Part.from_data(data=f.read(), mime_type=mime_type)
+
+def result_path(output_dir: str, source: str) -> str:
+    name = os.path.splitext(os.path.basename(source))[0]
+    digest = hashlib.sha1(source.encode()).hexdigest()[:12]
+    return os.path.join(output_dir, f"{name}-{digest}.json")
+
+def call_with_retries(
+    call: Callable[[], Any], rate_limiter: RateLimiter, retry_budget: RetryBudget, max_retries: int, client_attempts: int = 1
+) -> Any:
+    # The model client already retries transient errors up to client_attempts times; this loop only waits out
+    # failures that outlasted it, charging every attempt the client spent to the batch-wide budget
+    attempt = 0
+    while True:
+        rate_limiter.wait()
+        try:
+            return call()
+        except Exception as e:
+            attempt += 1
+            retryable = is_retryable(e) or isinstance(e, CircuitOpenError)
+            if not retryable or attempt > max_retries or not retry_budget.take(client_attempts):
+                raise
+            time.sleep(min(30.0, 2 ** attempt) * random.uniform(0.5, 1.0))
+
+def inspect_group(
+    sources: List[str],
+    profile: PromptProfile,
+    engine: InspectionEngine,
+    rate_limiter: RateLimiter,
+    retry_budget: RetryBudget,
+    max_retries: int,
+    tuner: Optional[BatchSizeTuner],
+) -> List[Dict[str, Any]]:
+    candidates = [load_image_part(source) for source in sources]
+    client_attempts = getattr(engine.model, "max_attempts", 1)
+
+    def single_call(candidate: Part) -> AnalysisResult:
+        return call_with_retries(
+            lambda: engine.inspect(profile, candidate),
+            rate_limiter, retry_budget, max_retries, client_attempts,
+        )
+
+    started = time.perf_counter()
+    if len(candidates) == 1:
+        results = [single_call(candidates[0])]
+    else:
+        # Not retried as a whole: the client retries the packed call, and any per-image
+        # fallback already goes through single_call's own retries
+        rate_limiter.wait()
+        results = engine.inspect_many(profile, candidates, tuner, single_call)
+    # Latency of a packed call is shared by every image in it
+    latency = (time.perf_counter() - started) / len(candidates)
+    return [
+        {
+            "source": source,
+            **result.model_dump(),
+            "latency_seconds": latency,
+            "images_per_call": len(candidates),
+        }
+        for source, result in zip(sources, results)
+    ]
+
+def write_json(path: str, payload: Dict[str, Any]):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(payload, f, indent=2)
+    os.replace(tmp_path, path)
+
+def run_batch(
+    sources: List[str],
+    profile_name: str,
+    output_dir: str,
+    workers: int = 8,
+    rate_per_second: float = 0.0,
+    max_retries: int = 3,
+    retry_budget: int = 100,
+    images_per_call: int = 1,
+) -> Dict[str, Any]:
+    profile = get_profile(profile_name)
+    os.makedirs(output_dir, exist_ok=True)
+
+    pending = deque(s for s in sources if not os.path.exists(result_path(output_dir, s)))
+    total_pending = len(pending)
+    skipped = len(sources) - total_pending
+    print(f"{len(sources)} images found, {skipped} already inspected, {total_pending} to go")
+
+    engine = InspectionEngine()
+    engine.warm_up()
+    rate_limiter = RateLimiter(rate_per_second)
+    budget = RetryBudget(retry_budget)
+    tuner = BatchSizeTuner(initial=images_per_call, maximum=images_per_call * 2) if images_per_call > 1 else None
+
+    latencies: List[float] = []
+    counts = {"PASS": 0, "FAIL": 0, "ERROR": 0}
+    errors: Dict[str, str] = {}
+    lock = threading.Lock()
+    started = time.perf_counter()
+
+    def record(source: str, result: Optional[Dict[str, Any]], error: Optional[Exception] = None):
+        with lock:
+            done = len(latencies) + counts["ERROR"] + 1
+            if result is None:
+                counts["ERROR"] += 1
+                errors[source] = str(error)
+                print(f"[{done}/{total_pending}] ERROR {source}: {error}")
+                return
+            result["profile"] = profile_name
+            # Written as soon as each image finishes so a crashed run can resume
+            write_json(result_path(output_dir, source), result)
+            counts[result["overall_assessment"]] += 1
+            latencies.append(result["latency_seconds"])
+            print(f"[{done}/{total_pending}] {result['overall_assessment']} {source}")
+
+    def worker():
+        while True:
+            with lock:
+                if not pending:
+                    return
+                size = tuner.size if tuner is not None else 1
+                group = [pending.popleft() for _ in range(min(size, len(pending)))]
+            try:
+                results = inspect_group(group, profile, engine, rate_limiter, budget, max_retries, tuner)
+            except Exception as e:
+                for source in group:
+                    record(source, None, e)
+                continue
+            for result in results:
+                record(result["source"], result)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in [executor.submit(worker) for _ in range(workers)]:
+            future.result()
+
+    summary = {
+        "profile": profile_name,
+        "total": len(sources),
+        "skipped": skipped,
+        "inspected": len(latencies),
+        "pass": counts["PASS"],
+        "fail": counts["FAIL"],
+        "errors": counts["ERROR"],
+        "wall_seconds": time.perf_counter() - started,
+        "final_images_per_call": tuner.size if tuner is not None else 1,
+        "latency_seconds": {
+            "p50": percentile(latencies, 50),
+            "p90": percentile(latencies, 90),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": max(latencies) if latencies else None,
+        },
+        "failed_sources": errors,
+    }
+    write_json(os.path.join(output_dir, "summary.json"), summary)
+    return summary
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Inspect a batch of spark plug images")
+    parser.add_argument("source", help="Local directory, glob, manifest file, image path or gs:// prefix")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="refined")
+    parser.add_argument("--output-dir", default=os.path.join("spark_plug_analysis_results", "batch"))
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=0.0, help="Max model calls per second (0 = unlimited)")
+    parser.add_argument("--max-retries", type=int, default=3, help="Retries per image after the model client's own retries give up")
+    parser.add_argument("--retry-budget", type=int, default=100, help="Model attempts, counting the client's retries, that retried calls may use across the whole batch")
+    parser.add_argument("--images-per-call", type=int, default=1,
+                        help="Pack up to this many images into one model call against a single copy of the references")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    summary = run_batch(
+        collect_sources(args.source),
+        args.profile,
+        args.output_dir,
+        workers=args.workers,
+        rate_per_second=args.rate,
+        max_retries=args.max_retries,
+        retry_budget=args.retry_budget,
+        images_per_call=args.images_per_call,
+    )
+    print(f"Batch inspection complete: {summary['pass']} PASS, {summary['fail']} FAIL, {summary['errors']} errors. "
+          f"Summary saved in {args.output_dir}/summary.json")
@@ -0,0 +1,126 @@
+import json
+import re
+import threading
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence
+
+from vertexai.generative_models import GenerativeModel, Part
+
+from schemas import VERDICT_RESPONSE_SCHEMA, AnalysisResult, parse_structured_verdict
+
+BATCH_INSTRUCTIONS = """You will now be given {count} candidate spark plug images, each introduced by a line "CANDIDATE <n>:", followed by the reference materials.
+        Inspect every candidate independently using the guidelines above. Do not let one candidate influence the verdict of another.
+
+        Respond with a JSON array containing exactly {count} objects, one per candidate and in candidate order:
+        [{{"candidate": 1, "analysis": "<findings for this candidate>", "overall_assessment": "PASS" or "FAIL"}}, ...]
+        Return only the JSON array.
+        """
+
+STRUCTURED_BATCH_INSTRUCTIONS = """You will now be given {count} candidate spark plug images, each introduced by a line "CANDIDATE <n>:", followed by the reference materials.
+        Inspect every candidate independently using the guidelines above. Do not let one candidate influence the verdict of another.
+
+        Respond with a JSON array containing exactly {count} verdicts, one per candidate and in candidate order.
+        Set "candidate" in each verdict to the number of the candidate it describes.
+        """
+
+# One per-image verdict per candidate, tagged with the candidate it belongs to
+BATCHED_VERDICT_RESPONSE_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {"candidate": {"type": "INTEGER"}, **VERDICT_RESPONSE_SCHEMA["properties"]},
+        "required": ["candidate"] + VERDICT_RESPONSE_SCHEMA["required"],
+    },
+}
+
+MAX_OUTPUT_TOKENS = 8192
+
+def create_batched_prompt(
+    profile_prompt: str, candidates: Sequence[Part], reference_materials: Mapping[str, Part], structured: bool = False
+) -> List[Any]:
+    instructions = STRUCTURED_BATCH_INSTRUCTIONS if structured else BATCH_INSTRUCTIONS
+    prompt: List[Any] = [profile_prompt, instructions.format(count=len(candidates))]
+    for i, candidate in enumerate(candidates, 1):
+        prompt.append(f"CANDIDATE {i}:")
+        prompt.append(candidate)
+    prompt.append("REFERENCE MATERIALS:")
+    prompt.extend(reference_materials.values())
+    return prompt
+
+def batched_generation_config(generation_config: Dict[str, Any], count: int, structured: bool = False) -> Dict[str, Any]:
+    config = dict(generation_config)
+    if structured:
+        config["response_schema"] = BATCHED_VERDICT_RESPONSE_SCHEMA
+    else:
+        config.pop("response_schema", None)
+    config["max_output_tokens"] = min(MAX_OUTPUT_TOKENS, generation_config.get("max_output_tokens", 2048) * count)
+    config["response_mime_type"] = "application/json"
+    return config
+
+def parse_batched_response(text: str, count: int, structured: bool = False) -> List[AnalysisResult]:
+    text = re.sub(r"^```(?:json)?\s*|\s*```$", "", text.strip())
+    items = json.loads(text)
+    if not isinstance(items, list) or len(items) != count:
+        raise ValueError(f"Expected {count} verdicts, got {len(items) if isinstance(items, list) else type(items).__name__}")
+
+    by_candidate: Dict[int, AnalysisResult] = {}
+    for item in items:
+        candidate = int(item["candidate"])
+        if not 1 <= candidate <= count:
+            raise ValueError(f"Invalid verdict for candidate {item.get('candidate')}")
+        if structured:
+            # Same validation and ISSUE-forces-FAIL rule as a single structured call
+            verdict = {key: value for key, value in item.items() if key != "candidate"}
+            by_candidate[candidate] = parse_structured_verdict(json.dumps(verdict))
+            continue
+        assessment = str(item["overall_assessment"]).strip().upper()
+        if assessment not in ("PASS", "FAIL"):
+            raise ValueError(f"Invalid verdict for candidate {item.get('candidate')}")
+        by_candidate[candidate] = AnalysisResult(analysis=str(item["analysis"]), overall_assessment=assessment)
+    if len(by_candidate) != count:
+        raise ValueError("Duplicate or missing candidate numbers in response")
+    return [by_candidate[i] for i in range(1, count + 1)]
+
+class BatchSizeTuner:
+    # Additive increase while responses parse, halve the batch when they don't
+    def __init__(self, initial: int = 4, maximum: int = 8):
+        self.maximum = max(1, maximum)
+        self.size = max(1, min(initial, self.maximum))
+        self._lock = threading.Lock()
+
+    def succeeded(self, size: int):
+        with self._lock:
+            if size >= self.size:
+                self.size = min(self.maximum, self.size + 1)
+
+    def failed(self, size: int):
+        with self._lock:
+            self.size = max(1, min(self.size, size // 2))
+
+def detect_anomalies_batched(
+    model: GenerativeModel,
+    profile_prompt: str,
+    generation_config: Dict[str, Any],
+    candidates: Sequence[Part],
+    reference_materials: Mapping[str, Part],
+    single_call: Callable[[Part], AnalysisResult],
+    tuner: Optional[BatchSizeTuner] = None,
+    structured: bool = False,
+) -> List[AnalysisResult]:
+    if len(candidates) == 1:
+        return [single_call(candidates[0])]
+
+    prompt = create_batched_prompt(profile_prompt, candidates, reference_materials, structured)
+    response = model.generate_content(
+        prompt,
+        generation_config=batched_generation_config(generation_config, len(candidates), structured),
+    )
+    try:
+        results = parse_batched_response(response.text, len(candidates), structured)
+    except (ValueError, KeyError, TypeError):
+        if tuner is not None:
+            tuner.failed(len(candidates))
+        return [single_call(candidate) for candidate in candidates]
+
+    if tuner is not None:
+        tuner.succeeded(len(candidates))
+    return results
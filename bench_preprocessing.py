@@ -0,0 +1,77 @@
+import argparse
+import asyncio
+import glob
+import mimetypes
+import os
+import time
+from typing import Any, Dict, List
+
+from metrics import percentile
+from preprocessing import IMAGE_EXTENSIONS, preprocess_image, settings_fingerprint
+
+async def compare_verdicts(images: List[Dict[str, Any]]) -> Dict[str, Any]:
+    from vertexai.generative_models import Part
+
+    from engine import InspectionEngine
+    from profiles import DEFAULT_PROFILE, get_profile
+
+    engine = InspectionEngine()
+    engine.warm_up()
+    profile = get_profile(DEFAULT_PROFILE)
+    raw_latencies, processed_latencies, agreements = [], [], 0
+    for item in images:
+        started = time.perf_counter()
+        raw = await engine.inspect_async(profile, Part.from_data(data=item["raw"], mime_type=item["mime_type"]))
+        raw_latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        processed = await engine.inspect_async(profile, Part.from_data(data=item["processed"], mime_type="image/jpeg"))
+        processed_latencies.append(time.perf_counter() - started)
+
+        agreements += raw.overall_assessment == processed.overall_assessment
+    return {
+        "model_p50_seconds_raw": percentile(raw_latencies, 50),
+        "model_p50_seconds_preprocessed": percentile(processed_latencies, 50),
+        "model_p95_seconds_raw": percentile(raw_latencies, 95),
+        "model_p95_seconds_preprocessed": percentile(processed_latencies, 95),
+        "verdict_agreement": agreements / len(images) if images else None,
+    }
+
+def run(image_dir: str, with_model: bool) -> Dict[str, Any]:
+    images, durations = [], []
+    for path in sorted(glob.glob(os.path.join(image_dir, "*"))):
+        if not path.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        with open(path, "rb") as f:
+            raw = f.read()
+        started = time.perf_counter()
+        processed = preprocess_image(raw)
+        durations.append(time.perf_counter() - started)
+        images.append({
+            "raw": raw,
+            "processed": processed.data,
+            "mime_type": mimetypes.guess_type(path)[0] or "image/jpeg",
+        })
+
+    raw_bytes = sum(len(item["raw"]) for item in images)
+    processed_bytes = sum(len(item["processed"]) for item in images)
+    report = {
+        "settings": settings_fingerprint(),
+        "images": len(images),
+        "bytes_on_wire_raw": raw_bytes,
+        "bytes_on_wire_preprocessed": processed_bytes,
+        "size_ratio": processed_bytes / raw_bytes if raw_bytes else None,
+        "preprocess_p50_ms": percentile(durations, 50) * 1000 if durations else None,
+        "preprocess_p95_ms": percentile(durations, 95) * 1000 if durations else None,
+    }
+    if with_model and images:
+        report.update(asyncio.run(compare_verdicts(images)))
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure upload size and latency with and without preprocessing")
+    parser.add_argument("image_dir")
+    parser.add_argument("--with-model", action="store_true", help="Also call the model on raw and preprocessed images")
+    args = parser.parse_args()
+    for name, value in run(args.image_dir, args.with_model).items():
+        print(f"{name}: {value}")
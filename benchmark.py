@@ -0,0 +1,231 @@
+import argparse
+import asyncio
+import contextlib
+import glob
+import io
+import json
+import os
+import random
+import resource
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from PIL import Image, ImageDraw
+
+from metrics import percentile
+from preprocessing import IMAGE_EXTENSIONS
+
+# Metrics compared against a baseline report; True means higher is better
+COMPARED_METRICS = {
+    "requests_per_second": True,
+    "images_per_second": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "tokens_per_image": False,
+    "peak_rss_mb": False,
+}
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def current_rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+def synthetic_corpus(count: int, seed: int = 0) -> List[bytes]:
+    # Plug-shaped blobs on a plain background, varied enough to exercise preprocessing and hashing
+    rng = random.Random(seed)
+    images = []
+    for _ in range(count):
+        width, height = rng.choice([(1600, 1200), (1200, 1600), (800, 800)])
+        image = Image.new("RGB", (width, height), tuple(rng.randint(200, 255) for _ in range(3)))
+        draw = ImageDraw.Draw(image)
+        left, top = rng.randint(0, width // 3), rng.randint(0, height // 3)
+        draw.rectangle([left, top, left + width // 3, top + height // 2], fill=(rng.randint(20, 90),) * 3)
+        draw.ellipse([left, top, left + width // 6, top + height // 8], fill=(180, 170, 160))
+        out = io.BytesIO()
+        image.save(out, format="JPEG", quality=90)
+        images.append(out.getvalue())
+    return images
+
+def load_corpus(corpus_dir: str) -> List[bytes]:
+    images = []
+    for path in sorted(glob.glob(os.path.join(corpus_dir, "**", "*"), recursive=True)):
+        if path.lower().endswith(IMAGE_EXTENSIONS):
+            with open(path, "rb") as f:
+                images.append(f.read())
+    return images
+
+def latency_report(latencies: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "p50_ms": percentile(latencies, 50) * 1000 if latencies else None,
+        "p95_ms": percentile(latencies, 95) * 1000 if latencies else None,
+        "p99_ms": percentile(latencies, 99) * 1000 if latencies else None,
+        "max_ms": max(latencies) * 1000 if latencies else None,
+    }
+
+def usage_report(usage: Dict[str, int], images: int) -> Dict[str, Any]:
+    return {
+        "model_calls": usage["calls"],
+        "model_errors": usage["errors"],
+        "prompt_tokens": usage["prompt_tokens"],
+        "output_tokens": usage["output_tokens"],
+        "tokens_per_image": usage["total_tokens"] / images if images else None,
+    }
+
+async def bench_api(images: List[bytes], requests: int, concurrency: int, use_cache: bool) -> Dict[str, Any]:
+    import httpx
+
+    import b
+    from model_backends import USAGE
+
+    async with b.lifespan(b.app):
+        USAGE.reset()
+        transport = httpx.ASGITransport(app=b.app)
+        latencies: List[float] = []
+        statuses: Counter = Counter()
+        pending = iter(range(requests))
+        headers = {} if use_cache else {"X-Cache-Bypass": "1"}
+
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            async def worker():
+                for i in pending:
+                    data = images[i % len(images)]
+                    started = time.perf_counter()
+                    response = await client.post(
+                        "/analyze/", files={"file": ("plug.jpg", data, "image/jpeg")}, headers=headers
+                    )
+                    latencies.append(time.perf_counter() - started)
+                    statuses[response.status_code] += 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            wall_seconds = time.perf_counter() - started
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "wall_seconds": wall_seconds,
+        "requests_per_second": statuses[200] / wall_seconds if wall_seconds else None,
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+        **latency_report(latencies),
+        **usage_report(USAGE.snapshot(), requests),
+        "rss_mb": current_rss_mb(),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def bench_batch(images: List[bytes], workers: int, images_per_call: int, profile: str) -> Dict[str, Any]:
+    from batch_inspect import collect_sources, run_batch
+    from model_backends import USAGE
+
+    with tempfile.TemporaryDirectory() as workdir:
+        corpus_dir = os.path.join(workdir, "corpus")
+        os.makedirs(corpus_dir)
+        for i, data in enumerate(images):
+            with open(os.path.join(corpus_dir, f"plug_{i:05d}.jpg"), "wb") as f:
+                f.write(data)
+
+        USAGE.reset()
+        # run_batch prints a line per image; keep the benchmark output readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            summary = run_batch(
+                collect_sources(corpus_dir), profile, os.path.join(workdir, "results"),
+                workers=workers, images_per_call=images_per_call,
+            )
+
+    latencies = summary["latency_seconds"]
+    return {
+        "images": summary["total"],
+        "workers": workers,
+        "images_per_call": images_per_call,
+        "wall_seconds": summary["wall_seconds"],
+        "images_per_second": summary["inspected"] / summary["wall_seconds"] if summary["wall_seconds"] else None,
+        "errors": summary["errors"],
+        "p50_ms": latencies["p50"] * 1000 if latencies["p50"] is not None else None,
+        "p95_ms": latencies["p95"] * 1000 if latencies["p95"] is not None else None,
+        "p99_ms": latencies["p99"] * 1000 if latencies["p99"] is not None else None,
+        "max_ms": latencies["max"] * 1000 if latencies["max"] is not None else None,
+        **usage_report(USAGE.snapshot(), summary["total"]),
+        "rss_mb": current_rss_mb(),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    lines = []
+    for phase in ("api", "batch"):
+        current, previous = report.get(phase), baseline.get(phase)
+        if not current or not previous:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            new, old = current.get(metric), previous.get(metric)
+            if new is None or not old:
+                continue
+            change = (new - old) / old * 100
+            worse = change < 0 if higher_is_better else change > 0
+            marker = "  REGRESSION" if worse and abs(change) >= 5 else ""
+            lines.append(f"{phase}.{metric}: {old:.2f} -> {new:.2f} ({change:+.1f}%){marker}")
+    return lines
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline throughput and latency benchmark for /analyze/ and the batch path")
+    parser.add_argument("corpus_dir", nargs="?", help="Directory of images; omit to use a synthetic corpus")
+    parser.add_argument("--synthetic", type=int, default=32, help="Synthetic images to generate when no corpus is given")
+    parser.add_argument("--phases", default="api,batch", help="Comma-separated subset of api,batch")
+    parser.add_argument("--backend", choices=["stub", "replay", "record", "vertex"], default="stub")
+    parser.add_argument("--cassette", help="Cassette file for the replay and record backends")
+    parser.add_argument("--latency", type=float, help="Stub latency in seconds")
+    parser.add_argument("--jitter", type=float, help="Stub latency jitter in seconds")
+    parser.add_argument("--error-rate", type=float, help="Share of stub calls that fail with 503")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--use-cache", action="store_true", help="Let repeated images hit the result cache")
+    parser.add_argument("--batch-workers", type=int, default=8)
+    parser.add_argument("--images-per-call", type=int, default=1)
+    parser.add_argument("--batch-profile", default="compact")
+    parser.add_argument("--output", default=os.path.join("spark_plug_analysis_results", "benchmark.json"))
+    parser.add_argument("--baseline", help="Earlier benchmark.json to compare against")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    # Backends read their settings at import time, so configure them before importing the service
+    os.environ["MODEL_BACKEND"] = args.backend
+    for name, value in (
+        ("MODEL_CASSETTE_PATH", args.cassette),
+        ("STUB_LATENCY_SECONDS", args.latency),
+        ("STUB_JITTER_SECONDS", args.jitter),
+        ("STUB_ERROR_RATE", args.error_rate),
+    ):
+        if value is not None:
+            os.environ[name] = str(value)
+    os.environ.setdefault("RESULT_CACHE_DB", "")
+    os.environ.setdefault("RESULT_SINK_PATH", os.path.join(tempfile.gettempdir(), "benchmark_verdicts.jsonl"))
+
+    images = load_corpus(args.corpus_dir) if args.corpus_dir else synthetic_corpus(args.synthetic)
+    if not images:
+        raise SystemExit(f"No images found in {args.corpus_dir}")
+    phases = [phase.strip() for phase in args.phases.split(",") if phase.strip()]
+
+    report: Dict[str, Any] = {
+        "backend": args.backend,
+        "corpus": args.corpus_dir or f"synthetic:{len(images)}",
+        "baseline_rss_mb": current_rss_mb(),
+    }
+    if "api" in phases:
+        report["api"] = asyncio.run(bench_api(images, args.requests, args.concurrency, args.use_cache))
+    if "batch" in phases:
+        report["batch"] = bench_batch(images, args.batch_workers, args.images_per_call, args.batch_profile)
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print("\n".join(compare(report, baseline)))
+    print(f"Benchmark complete. Report saved in {args.output}")
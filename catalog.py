@@ -0,0 +1,283 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from vertexai.generative_models import Part
+
+from profiles import DEFAULT_PROFILE, get_profile
+from reference_index import ALWAYS_INCLUDE, INDEX_PATH, TOP_K
+
+CATALOG_PATH = os.getenv("REFERENCE_CATALOG", "reference_catalog.json")
+CATALOG_MEMORY_MB = float(os.getenv("REFERENCE_CATALOG_MEMORY_MB", "256"))
+CATALOG_MAX_SKUS = int(os.getenv("REFERENCE_CATALOG_MAX_SKUS", "32"))
+# SKUs loaded at startup instead of on their first request; the default SKU always is
+PREWARM_SKUS = [sku for sku in os.getenv("REFERENCE_CATALOG_PREWARM", "").split(",") if sku]
+
+INDEX_DIR = os.path.join("spark_plug_analysis_results", "indexes")
+
+MIME_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".webp": "image/webp",
+    ".mp4": "video/mp4",
+    ".pdf": "application/pdf",
+}
+
+# Rough per-part bookkeeping cost on top of any inline bytes
+PART_OVERHEAD_BYTES = 4096
+
+@dataclass(frozen=True)
+class SkuSpec:
+    sku: str
+    references: Tuple[Tuple[str, str], ...]
+    profile: str = DEFAULT_PROFILE
+    description: str = ""
+    index_path: Optional[str] = None
+    top_k: int = TOP_K
+    always_include: Tuple[str, ...] = ()
+    prescreen_dir: Optional[str] = None
+    prescreen_pass_hash_distance: float = 0.12
+    prescreen_min_similarity: float = 0.9
+
+def parse_sku(sku: str, entry: Dict[str, Any], default: bool = False) -> SkuSpec:
+    references = dict(entry.get("references", {}))
+    # Numbered reference images can be given as a pattern instead of one line each
+    pattern = entry.get("image_pattern")
+    if pattern:
+        for i in range(1, int(entry.get("image_count", 0)) + 1):
+            references[f"reference_image_{i}"] = pattern.format(i=i)
+    if not references:
+        raise ValueError(f"SKU '{sku}' has no references")
+    for name, uri in references.items():
+        if os.path.splitext(uri)[1].lower() not in MIME_TYPES:
+            raise ValueError(f"SKU '{sku}' reference '{name}' has an unsupported file type: {uri}")
+
+    profile = entry.get("profile", DEFAULT_PROFILE)
+    get_profile(profile)
+    thresholds = entry.get("thresholds", {})
+    # The default SKU keeps the index and k the scripts use, REFERENCE_INDEX_PATH and REFERENCE_TOP_K
+    index_path = entry.get("index") or (INDEX_PATH if default else os.path.join(INDEX_DIR, f"{sku}.npz"))
+    # REFERENCE_TOP_K=0 turns subset selection off for every SKU, whatever the manifest says
+    top_k = 0 if TOP_K == 0 else int(thresholds.get("top_k", TOP_K))
+    return SkuSpec(
+        sku=sku,
+        references=tuple(references.items()),
+        profile=profile,
+        description=entry.get("description", ""),
+        index_path=index_path,
+        top_k=top_k,
+        always_include=tuple(thresholds.get("always_include", ALWAYS_INCLUDE)),
+        prescreen_dir=entry.get("prescreen_dir"),
+        prescreen_pass_hash_distance=float(thresholds.get("prescreen_pass_hash_distance", 0.12)),
+        prescreen_min_similarity=float(thresholds.get("prescreen_min_similarity", 0.9)),
+    )
+
+class Manifest:
+    def __init__(self, skus: Dict[str, SkuSpec], default_sku: str):
+        if default_sku not in skus:
+            raise ValueError(f"Default SKU '{default_sku}' is not in the catalog")
+        self.skus = skus
+        self.default_sku = default_sku
+
+    def spec(self, sku: Optional[str] = None) -> SkuSpec:
+        try:
+            return self.skus[sku or self.default_sku]
+        except KeyError:
+            raise ValueError(f"Unknown SKU '{sku}', expected one of: {', '.join(sorted(self.skus))}")
+
+def load_manifest(path: str = CATALOG_PATH) -> Manifest:
+    with open(path) as f:
+        data = json.load(f)
+    entries = data.get("skus", {})
+    if not entries:
+        raise ValueError(f"Reference catalog {path} lists no SKUs")
+    default_sku = data.get("default_sku") or next(iter(entries))
+    skus = {sku: parse_sku(sku, entry, default=sku == default_sku) for sku, entry in entries.items()}
+    return Manifest(skus, default_sku)
+
+def reference_part(uri: str) -> Part:
+    mime_type = MIME_TYPES[os.path.splitext(uri)[1].lower()]
+    if uri.startswith("gs://"):
+        return Part.from_uri(mime_type=mime_type, uri=uri)
+    # Local references are sent inline, so they count against the catalog's memory cap
+    with open(uri, "rb") as f:
+        return Part.from_data(data=f.read(), mime_type=mime_type)
+
+def sku_references(spec: SkuSpec) -> Dict[str, Part]:
+    return {name: reference_part(uri) for name, uri in spec.references}
+
+def references_bytes(references: Any) -> int:
+    return sum(len(part.inline_data.data) + PART_OVERHEAD_BYTES for part in references.values())
+
+@dataclass
+class CatalogEntry:
+    spec: SkuSpec
+    engine: Any
+    prescreener: Any = None
+    size_bytes: int = 0
+    loaded_at: float = field(default_factory=time.time)
+    hits: int = 0
+    # Requests currently using the entry, and whether the catalog has let go of it
+    holders: int = 0
+    retired: bool = False
+
+    def drop(self):
+        # Server-side context caches belong to this bundle; the shared result cache does not
+        self.engine.drop_context_caches()
+
+class ReferenceCatalog:
+    # SKU -> warm InspectionEngine, built on first use from the manifest and kept in an
+    # LRU bounded by both SKU count and estimated reference memory. The manifest can be
+    # re-read at runtime, so adding a product needs no worker restart.
+    def __init__(
+        self,
+        entry_factory: Callable[[SkuSpec], CatalogEntry],
+        path: str = CATALOG_PATH,
+        memory_cap_bytes: int = int(CATALOG_MEMORY_MB * 1024 * 1024),
+        max_skus: int = CATALOG_MAX_SKUS,
+    ):
+        self.entry_factory = entry_factory
+        self.path = path
+        self.memory_cap_bytes = memory_cap_bytes
+        self.max_skus = max(1, max_skus)
+        self.manifest = load_manifest(path)
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, CatalogEntry]" = OrderedDict()
+        self._sku_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def default_sku(self) -> str:
+        return self.manifest.default_sku
+
+    def _lookup(self, spec: SkuSpec, hold: bool) -> Optional[CatalogEntry]:
+        with self._lock:
+            entry = self._entries.get(spec.sku)
+            if entry is None or entry.spec != spec:
+                return None
+            self._entries.move_to_end(spec.sku)
+            entry.hits += 1
+            self.hits += 1
+            if hold:
+                entry.holders += 1
+            return entry
+
+    def _get(self, sku: Optional[str], hold: bool) -> CatalogEntry:
+        spec = self.manifest.spec(sku)
+        entry = self._lookup(spec, hold)
+        if entry is not None:
+            return entry
+
+        with self._lock:
+            sku_lock = self._sku_locks.setdefault(spec.sku, threading.Lock())
+        # One loader per SKU; concurrent first requests for it wait for that load
+        with sku_lock:
+            entry = self._lookup(spec, hold)
+            if entry is not None:
+                return entry
+            entry = self.entry_factory(spec)
+            with self._lock:
+                if hold:
+                    entry.holders += 1
+                retired = [self._entries.pop(spec.sku)] if spec.sku in self._entries else []
+                self._entries[spec.sku] = entry
+                self.loads += 1
+                retired.extend(self._evict())
+                idle = self._retire(retired)
+        for old in idle:
+            old.drop()
+        return entry
+
+    def get(self, sku: Optional[str] = None) -> CatalogEntry:
+        # Unheld, for prewarming; request paths use hold() or acquire() so eviction waits for them
+        return self._get(sku, hold=False)
+
+    def acquire(self, sku: Optional[str] = None) -> CatalogEntry:
+        # The entry stays usable until release(), even if the LRU evicts it meanwhile
+        return self._get(sku, hold=True)
+
+    def release(self, entry: CatalogEntry):
+        with self._lock:
+            entry.holders -= 1
+            idle = entry.retired and entry.holders == 0
+        # An evicted entry's context caches go once its last request is done, including any
+        # cache that request created after the eviction
+        if idle:
+            entry.drop()
+
+    @contextmanager
+    def hold(self, sku: Optional[str] = None) -> Iterator[CatalogEntry]:
+        entry = self.acquire(sku)
+        try:
+            yield entry
+        finally:
+            self.release(entry)
+
+    def _retire(self, entries: List[CatalogEntry]) -> List[CatalogEntry]:
+        # Called under the lock; returns the entries nobody holds, which can be dropped now
+        for entry in entries:
+            entry.retired = True
+        return [entry for entry in entries if entry.holders == 0]
+
+    def _evict(self) -> List[CatalogEntry]:
+        evicted = []
+        # The most recently loaded SKU always stays, even if it alone exceeds the cap
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_skus
+            or sum(entry.size_bytes for entry in self._entries.values()) > self.memory_cap_bytes
+        ):
+            _, entry = self._entries.popitem(last=False)
+            self.evictions += 1
+            evicted.append(entry)
+        return evicted
+
+    def prewarm(self, skus: List[str] = PREWARM_SKUS):
+        for sku in [self.default_sku] + [sku for sku in skus if sku != self.default_sku]:
+            self.get(sku)
+
+    def reload(self, reinitialize_model: bool = False) -> Dict[str, Any]:
+        # New SKUs become loadable, changed or removed ones are dropped and rebuilt on next use,
+        # and unchanged loaded ones re-read their references in place
+        manifest = load_manifest(self.path)
+        with self._lock:
+            self.manifest = manifest
+            stale = [sku for sku, entry in self._entries.items() if manifest.skus.get(sku) != entry.spec]
+            idle = self._retire([self._entries.pop(sku) for sku in stale])
+            kept = list(self._entries.values())
+        for entry in idle:
+            entry.drop()
+        for entry in kept:
+            entry.engine.reload(reinitialize_model)
+        return {"skus": len(manifest.skus), "reloaded": [entry.spec.sku for entry in kept], "dropped": stale}
+
+    def loaded(self) -> List[CatalogEntry]:
+        with self._lock:
+            return list(self._entries.values())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = list(self._entries.values())
+            counters = {"loads": self.loads, "hits": self.hits, "evictions": self.evictions}
+        return {
+            "skus": len(self.manifest.skus),
+            "default_sku": self.default_sku,
+            "loaded": {entry.spec.sku: {"size_bytes": entry.size_bytes, "hits": entry.hits} for entry in entries},
+            "loaded_bytes": sum(entry.size_bytes for entry in entries),
+            "memory_cap_bytes": self.memory_cap_bytes,
+            **counters,
+        }
+
+    def close(self):
+        with self._lock:
+            idle = self._retire(list(self._entries.values()))
+            self._entries = OrderedDict()
+        for entry in idle:
+            entry.drop()
@@ -0,0 +1,109 @@
+import datetime
+import hashlib
+import threading
+import time
+from typing import Any, Callable, Optional, Sequence
+
+from vertexai.generative_models import Content, GenerativeModel, Part
+
+def _create_cached_content(**kwargs) -> Any:
+    from vertexai.preview import caching
+
+    return caching.CachedContent.create(**kwargs)
+
+def reference_fingerprint(model_name: str, system_instruction: str, reference_parts: Sequence[Part]) -> str:
+    h = hashlib.sha256()
+    h.update(model_name.encode())
+    h.update(system_instruction.encode())
+    for part in reference_parts:
+        h.update(repr(part.to_dict()).encode())
+    return h.hexdigest()
+
+# Keeps the static reference corpus and instructions in Vertex cached content.
+# model() returns a GenerativeModel bound to the cache, or None when caching is
+# unavailable and callers should send the full prompt instead.
+class ReferenceContextCache:
+    def __init__(
+        self,
+        model_name: str,
+        system_instruction: str,
+        reference_parts: Sequence[Part],
+        ttl: datetime.timedelta = datetime.timedelta(hours=1),
+        renew_before: datetime.timedelta = datetime.timedelta(minutes=5),
+        retry_unavailable_after: float = 300.0,
+        create_cached_content: Callable[..., Any] = _create_cached_content,
+        model_from_cached_content: Callable[[Any], GenerativeModel] = GenerativeModel.from_cached_content,
+    ):
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.reference_parts = list(reference_parts)
+        self.ttl = ttl
+        self.renew_before = renew_before
+        self.retry_unavailable_after = retry_unavailable_after
+        self._create_cached_content = create_cached_content
+        self._model_from_cached_content = model_from_cached_content
+        self._fingerprint = reference_fingerprint(model_name, system_instruction, self.reference_parts)
+        self._cached_content: Any = None
+        self._cached_model: Optional[GenerativeModel] = None
+        self._expires_at = 0.0
+        self._unavailable_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def fingerprint(self) -> str:
+        return self._fingerprint
+
+    def model(self) -> Optional[GenerativeModel]:
+        with self._lock:
+            now = time.monotonic()
+            if now < self._unavailable_until:
+                return None
+            try:
+                if self._cached_model is None or now >= self._expires_at:
+                    self._create(now)
+                elif now >= self._expires_at - self.renew_before.total_seconds():
+                    self._cached_content.update(ttl=self.ttl)
+                    self._expires_at = now + self.ttl.total_seconds()
+            except Exception:
+                # Fall back to full prompts for a while rather than failing inspections
+                self._drop()
+                self._unavailable_until = now + self.retry_unavailable_after
+                return None
+            return self._cached_model
+
+    def _create(self, now: float):
+        self._drop()
+        self._cached_content = self._create_cached_content(
+            model_name=self.model_name,
+            system_instruction=Content(role="system", parts=[Part.from_text(self.system_instruction)]),
+            contents=[Content(role="user", parts=self.reference_parts)],
+            ttl=self.ttl,
+            display_name=f"spark-plug-references-{self._fingerprint[:12]}",
+        )
+        self._cached_model = self._model_from_cached_content(self._cached_content)
+        self._expires_at = now + self.ttl.total_seconds()
+
+    def _drop(self):
+        cached_content, self._cached_content, self._cached_model = self._cached_content, None, None
+        self._expires_at = 0.0
+        if cached_content is not None:
+            try:
+                cached_content.delete()
+            except Exception:
+                pass
+
+    def invalidate(self):
+        with self._lock:
+            self._drop()
+            self._unavailable_until = 0.0
+
+    def update_references(self, reference_parts: Sequence[Part]) -> bool:
+        fingerprint = reference_fingerprint(self.model_name, self.system_instruction, reference_parts)
+        with self._lock:
+            if fingerprint == self._fingerprint:
+                return False
+            self.reference_parts = list(reference_parts)
+            self._fingerprint = fingerprint
+            self._drop()
+            self._unavailable_until = 0.0
+            return True
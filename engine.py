@@ -0,0 +1,345 @@
+import argparse
+import asyncio
+import datetime
+import hashlib
+import json
+import threading
+import time
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Union
+
+import vertexai
+from PIL import Image
+from google.api_core import exceptions as google_exceptions
+from vertexai.generative_models import GenerativeModel, Part
+
+from batched_prompt import BatchSizeTuner, detect_anomalies_batched
+from catalog import load_manifest, sku_references
+from context_cache import ReferenceContextCache
+from metrics import record_usage, stage
+from model_backends import model_from_env
+from resilient_client import ResilientModel, failover_targets, is_retryable
+from profiles import DEFAULT_PROFILE, PROFILES, PromptProfile, get_profile
+from reference_index import ALWAYS_INCLUDE, TOP_K, ReferenceIndex, index_from_env, select_references
+from result_cache import ResultCache, cache_from_env, cache_key, uri_digest
+from result_sink import sink_from_env
+from schemas import AnalysisResult
+
+PROJECT = "fresh-span-400217"
+LOCATION = "us-central1"
+MODEL_NAME = "gemini-1.5-flash-001"
+
+def initialize_model(location: str = LOCATION, model_name: str = MODEL_NAME) -> GenerativeModel:
+    vertexai.init(project=PROJECT, location=LOCATION)
+    if location == LOCATION:
+        return GenerativeModel(model_name)
+    # A full resource name pins the client to another region without touching the global init
+    return GenerativeModel(f"projects/{PROJECT}/locations/{location}/publishers/google/models/{model_name}")
+
+def create_model() -> ResilientModel:
+    # MODEL_BACKEND swaps the live endpoint for a local stub or a recorded cassette
+    targets = [
+        (f"{location}/{model_name}", model_from_env(lambda: initialize_model(location, model_name)))
+        for location, model_name in failover_targets(LOCATION, MODEL_NAME)
+    ]
+    return ResilientModel(targets)
+
+def load_reference_materials(sku: Optional[str] = None) -> Dict[str, Part]:
+    # References per plug model live in the catalog manifest; scripts use its default SKU
+    return sku_references(load_manifest().spec(sku))
+
+def build_reference_bundle() -> Mapping[str, Part]:
+    return MappingProxyType(load_reference_materials())
+
+def create_prompt(profile: PromptProfile, uploaded_image: Part, reference_materials: Mapping[str, Part]) -> List[Any]:
+    prompt = [profile.instructions]
+
+    prompt.append(uploaded_image)
+    prompt.extend(reference_materials.values())
+
+    return prompt
+
+Observer = Callable[[PromptProfile, AnalysisResult, float], None]
+
+# One warm model client and reference bundle shared by every prompt profile.
+# All inspections, sync or async, single or batched, go through this class.
+class InspectionEngine:
+    def __init__(
+        self,
+        result_cache: Optional[ResultCache] = None,
+        context_caching: bool = False,
+        context_cache_ttl: datetime.timedelta = datetime.timedelta(hours=1),
+        model_factory: Callable[[], GenerativeModel] = create_model,
+        reference_loader: Callable[[], Mapping[str, Part]] = build_reference_bundle,
+        reference_top_k: int = TOP_K,
+        index_loader: Callable[[], Optional[ReferenceIndex]] = index_from_env,
+        always_include: Sequence[str] = ALWAYS_INCLUDE,
+        cache_namespace: str = "",
+    ):
+        self.result_cache = result_cache
+        self.context_caching = context_caching
+        self.context_cache_ttl = context_cache_ttl
+        self.model_factory = model_factory
+        self.reference_loader = reference_loader
+        self.reference_top_k = reference_top_k
+        self.index_loader = index_loader
+        self.always_include = list(always_include)
+        # Keeps result cache entries of different SKUs apart for the same image
+        self.cache_namespace = cache_namespace
+        self.reference_index: Optional[ReferenceIndex] = None
+        self.model: Optional[GenerativeModel] = None
+        self.reference_materials: Mapping[str, Part] = MappingProxyType({})
+        self.observers: List[Observer] = []
+        self._context_caches: Dict[str, ReferenceContextCache] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.model is not None
+
+    @property
+    def subset_selection(self) -> bool:
+        return self.reference_index is not None and self.reference_top_k > 0
+
+    def warm_up(self, profiles: Iterable[str] = ()):
+        self.model = self.model_factory()
+        self.reference_materials = self.reference_loader()
+        self.reference_index = self.index_loader()
+        # Create cached content up front so the first upload doesn't pay for it
+        for name in profiles:
+            context_cache = self.context_cache(get_profile(name))
+            if context_cache is not None:
+                context_cache.model()
+
+    def reload(self, reinitialize_model: bool = False):
+        if reinitialize_model:
+            self.model = self.model_factory()
+        # Swap in the new bundle atomically; in-flight inspections keep the old one
+        reference_materials = self.reference_loader()
+        self.reference_materials = reference_materials
+        self.reference_index = self.index_loader()
+        with self._lock:
+            context_caches = list(self._context_caches.values())
+        for context_cache in context_caches:
+            context_cache.update_references(list(reference_materials.values()))
+
+    def drop_context_caches(self):
+        with self._lock:
+            context_caches, self._context_caches = list(self._context_caches.values()), {}
+        for context_cache in context_caches:
+            context_cache.invalidate()
+
+    def close(self):
+        self.drop_context_caches()
+        if self.result_cache is not None:
+            self.result_cache.close()
+
+    def context_cache(self, profile: PromptProfile) -> Optional[ReferenceContextCache]:
+        # A cache holds one fixed reference set, so it can't serve per-upload subsets
+        if not self.context_caching or self.subset_selection:
+            return None
+        with self._lock:
+            context_cache = self._context_caches.get(profile.name)
+            if context_cache is None:
+                context_cache = ReferenceContextCache(
+                    MODEL_NAME,
+                    profile.instructions,
+                    list(self.reference_materials.values()),
+                    ttl=self.context_cache_ttl,
+                )
+                self._context_caches[profile.name] = context_cache
+            return context_cache
+
+    def cache_key(self, profile: PromptProfile, image_digest: str) -> str:
+        variant = f"{profile.name}|top_k={self.reference_top_k}" if self.subset_selection else profile.name
+        if self.cache_namespace:
+            variant = f"{self.cache_namespace}|{variant}"
+        return cache_key(f"{image_digest}|{variant}", profile.instructions, MODEL_NAME, profile.generation_config)
+
+    def cached_result(self, profile: PromptProfile, image_digest: str) -> Optional[AnalysisResult]:
+        if self.result_cache is None:
+            return None
+        cached = self.result_cache.get(self.cache_key(profile, image_digest))
+        return AnalysisResult.model_validate_json(cached) if cached is not None else None
+
+    def store_result(self, profile: PromptProfile, image_digest: str, result: AnalysisResult):
+        if self.result_cache is not None:
+            self.result_cache.set(self.cache_key(profile, image_digest), result.model_dump_json())
+
+    def prompt_fingerprint(self, profile: PromptProfile, references: Mapping[str, Part]) -> str:
+        # Identifies what the model was asked, without the upload, for auditing logged verdicts
+        h = hashlib.sha256()
+        h.update(f"{MODEL_NAME}|{profile.name}|{profile.instructions}".encode())
+        h.update(json.dumps(profile.generation_config, sort_keys=True, default=str).encode())
+        h.update("|".join(references).encode())
+        return h.hexdigest()[:16]
+
+    def notify(self, profile: PromptProfile, result: AnalysisResult, seconds: float):
+        for observer in self.observers:
+            observer(profile, result, seconds)
+
+    def references_for(self, upload: Union[Part, bytes, Image.Image, None], k: Optional[int] = None) -> Mapping[str, Part]:
+        if not self.subset_selection and k is None:
+            return self.reference_materials
+        if isinstance(upload, Part):
+            upload = upload.inline_data.data
+        k = self.reference_top_k if k is None else k
+        return select_references(self.reference_materials, self.reference_index, upload, k, self.always_include)
+
+    def inspect(
+        self,
+        profile: PromptProfile,
+        uploaded_image: Part,
+        references: Optional[Mapping[str, Part]] = None,
+    ) -> AnalysisResult:
+        started = time.perf_counter()
+        if references is None:
+            with stage("reference_select"):
+                references = self.references_for(uploaded_image)
+        context_cache = self.context_cache(profile)
+        cached_model = context_cache.model() if context_cache is not None else None
+        response = None
+        if cached_model is not None:
+            try:
+                # References and instructions already live in the cache; only the upload is sent
+                with stage("model", profile=profile.name, context_cache=True):
+                    response = cached_model.generate_content([uploaded_image], generation_config=profile.generation_config)
+                # The cache-bound model bypasses ResilientModel, which records usage for full prompts
+                record_usage(response)
+            except google_exceptions.NotFound:
+                context_cache.invalidate()
+            except Exception as e:
+                # The full prompt goes through the retrying client instead
+                if not is_retryable(e):
+                    raise
+        if response is None:
+            with stage("prompt_assembly"):
+                prompt = create_prompt(profile, uploaded_image, references)
+            with stage("model", profile=profile.name):
+                response = self.model.generate_content(prompt, generation_config=profile.generation_config)
+        with stage("parse", profile=profile.name):
+            result = profile.parse(response.text)
+        self.notify(profile, result, time.perf_counter() - started)
+        return result
+
+    async def generate_async(
+        self,
+        profile: PromptProfile,
+        uploaded_image: Part,
+        stream: bool = False,
+        references: Optional[Mapping[str, Part]] = None,
+    ):
+        if references is None:
+            with stage("reference_select"):
+                references = await asyncio.to_thread(self.references_for, uploaded_image)
+        # For streams the model stage ends when the first chunk can be read, not at the last one
+        model_stage = "model_stream_open" if stream else "model"
+        context_cache = self.context_cache(profile)
+        cached_model = await asyncio.to_thread(context_cache.model) if context_cache is not None else None
+        if cached_model is not None:
+            try:
+                with stage(model_stage, profile=profile.name, context_cache=True):
+                    response = await cached_model.generate_content_async(
+                        [uploaded_image], generation_config=profile.generation_config, stream=stream
+                    )
+                if not stream:
+                    # Streamed usage arrives on the last chunk; the consumer records it
+                    record_usage(response)
+                return response
+            except google_exceptions.NotFound:
+                # Cache expired or was deleted server-side; rebuild next time and use the full prompt now
+                await asyncio.to_thread(context_cache.invalidate)
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+
+        with stage("prompt_assembly"):
+            prompt = create_prompt(profile, uploaded_image, references)
+        with stage(model_stage, profile=profile.name):
+            return await self.model.generate_content_async(
+                prompt, generation_config=profile.generation_config, stream=stream
+            )
+
+    async def inspect_async(
+        self,
+        profile: PromptProfile,
+        uploaded_image: Part,
+        references: Optional[Mapping[str, Part]] = None,
+    ) -> AnalysisResult:
+        started = time.perf_counter()
+        response = await self.generate_async(profile, uploaded_image, references=references)
+        with stage("parse", profile=profile.name):
+            result = profile.parse(response.text)
+        self.notify(profile, result, time.perf_counter() - started)
+        return result
+
+    def inspect_many(
+        self,
+        profile: PromptProfile,
+        uploaded_images: Sequence[Part],
+        tuner: Optional[BatchSizeTuner] = None,
+        single_call: Optional[Callable[[Part], AnalysisResult]] = None,
+    ) -> List[AnalysisResult]:
+        single_call = single_call or (lambda image: self.inspect(profile, image))
+        started = time.perf_counter()
+        references = self.reference_materials
+        if self.subset_selection:
+            # A packed call shares one copy of the references: send the union of each image's subset
+            merged: Dict[str, Part] = {}
+            for uploaded_image in uploaded_images:
+                merged.update(self.references_for(uploaded_image))
+            references = MappingProxyType(merged)
+        results = detect_anomalies_batched(
+            self.model, profile.instructions, profile.generation_config,
+            uploaded_images, references, single_call, tuner, profile.structured,
+        )
+        if len(uploaded_images) > 1:
+            seconds = (time.perf_counter() - started) / len(uploaded_images)
+            for result in results:
+                self.notify(profile, result, seconds)
+        return results
+
+def run_cli(profile_name: str, uploaded_image_path: str, use_cache: bool = True) -> AnalysisResult:
+    profile = get_profile(profile_name)
+    engine = InspectionEngine(result_cache=cache_from_env() if use_cache else None)
+    # Every run is appended to the result sink instead of overwriting a per-profile file
+    sink = sink_from_env()
+    try:
+        started = time.perf_counter()
+        image_digest = uri_digest(uploaded_image_path) if use_cache else ""
+        result = engine.cached_result(profile, image_digest) if use_cache else None
+        source, prompt = "cache", None
+        if result is None:
+            engine.warm_up()
+            uploaded_image = Part.from_uri(mime_type="image/jpeg", uri=uploaded_image_path)
+            references = engine.references_for(uploaded_image)
+            result = engine.inspect(profile, uploaded_image, references)
+            source, prompt = "model", engine.prompt_fingerprint(profile, references)
+            if use_cache:
+                engine.store_result(profile, image_digest, result)
+        sink.write({
+            "ts": round(time.time(), 3),
+            "image": uploaded_image_path,
+            "profile": profile.name,
+            "prompt": prompt,
+            "verdict": result.overall_assessment,
+            "confidence": result.confidence,
+            "analysis": result.analysis,
+            "source": source,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+        })
+    finally:
+        sink.close()
+        engine.close()
+
+    print(result.analysis)
+    print(f"{profile.name.capitalize()} anomaly detection complete: {result.overall_assessment}")
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect one spark plug image with a prompt profile")
+    parser.add_argument("uploaded_image_path", help="gs:// URI of the image to inspect")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default=DEFAULT_PROFILE)
+    parser.add_argument("--no-cache", action="store_true", help="Force re-inspection")
+    args = parser.parse_args()
+    run_cli(args.profile, args.uploaded_image_path, use_cache=not args.no_cache)
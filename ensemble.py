@@ -0,0 +1,343 @@
+import argparse
+import asyncio
+import os
+import time
+from dataclasses import dataclass, field
+from typing import AsyncContextManager, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from pydantic import BaseModel
+from vertexai.generative_models import Part
+
+from engine import InspectionEngine
+from metrics import counter, stage
+from profiles import PROFILES, PromptProfile, get_profile
+from result_cache import cache_from_env, uri_digest
+from result_sink import sink_from_env
+from schemas import CRITERIA, AnalysisResult, CriteriaFindings, CriterionFinding
+
+def parse_weights(text: str) -> Dict[str, float]:
+    weights = {}
+    for item in text.split(","):
+        if not item:
+            continue
+        name, sep, weight = item.partition("=")
+        if not sep:
+            raise ValueError(f"Ensemble weight '{item}' should look like profile=weight")
+        try:
+            weights[name] = float(weight)
+        except ValueError:
+            raise ValueError(f"Ensemble weight for '{name}' is not a number: {weight}")
+    return weights
+
+# Structured profiles, so the ensemble can combine per-criterion findings as well as verdicts
+ENSEMBLE_PROFILES = [
+    name for name in os.getenv("ENSEMBLE_PROFILES", "strict_structured,refined_structured,significant_structured").split(",") if name
+]
+# "strict=1,refined=2"; profiles not listed weigh 1
+ENSEMBLE_WEIGHTS = parse_weights(os.getenv("ENSEMBLE_WEIGHTS", ""))
+# Share of the voting weight that has to say FAIL for the plug to fail:
+# 0.5 is a majority, anything near 0 lets one FAIL veto, 1 needs a unanimous FAIL
+ENSEMBLE_FAIL_QUORUM = float(os.getenv("ENSEMBLE_FAIL_QUORUM", "0.5"))
+
+ENSEMBLE_PROFILE_OUTCOMES = counter(
+    "spark_plug_ensemble_profile_outcomes_total", "Per-profile outcomes inside ensemble runs", ["profile", "outcome"]
+)
+ENSEMBLE_SPLITS = counter("spark_plug_ensemble_split_verdicts_total", "Ensemble runs whose profiles disagreed on the verdict")
+
+class ProfileVote(BaseModel):
+    # source is model, cache, skipped (cancelled once the outcome was decided) or error
+    source: str
+    weight: float
+    overall_assessment: Optional[str] = None
+    confidence: Optional[float] = None
+    latency_ms: Optional[float] = None
+    error: Optional[str] = None
+
+class Disagreement(BaseModel):
+    split: bool
+    # Weight share of the winning verdict among the profiles that voted
+    agreement: float
+    # Only criteria where structured profiles returned different statuses, as profile -> status
+    criteria: Dict[str, Dict[str, str]] = {}
+    # The votes said PASS but a combined criterion is an ISSUE, which fails the plug
+    criteria_override: bool = False
+
+class EnsembleResult(AnalysisResult):
+    votes: Dict[str, ProfileVote]
+    disagreement: Disagreement
+    short_circuited: bool = False
+
+@dataclass
+class Ensemble:
+    profiles: List[PromptProfile]
+    weights: Dict[str, float] = field(default_factory=dict)
+    fail_quorum: float = ENSEMBLE_FAIL_QUORUM
+
+    def __post_init__(self):
+        if not self.profiles:
+            raise ValueError("An ensemble needs at least one prompt profile")
+        if not 0.0 < self.fail_quorum <= 1.0:
+            raise ValueError(f"Ensemble fail quorum must be in (0, 1], got {self.fail_quorum}")
+        for profile in self.profiles:
+            if self.weight(profile.name) <= 0:
+                raise ValueError(f"Ensemble weight for '{profile.name}' must be positive")
+
+    @property
+    def name(self) -> str:
+        return "ensemble:" + "+".join(profile.name for profile in self.profiles)
+
+    def weight(self, name: str) -> float:
+        return self.weights.get(name, 1.0)
+
+    def decide(self, fail_weight: float, pass_weight: float, pending_weight: float) -> Optional[str]:
+        # The outcome is settled once the profiles still running can no longer change it
+        total = fail_weight + pass_weight + pending_weight
+        if total <= 0:
+            return None
+        if fail_weight >= self.fail_quorum * total:
+            return "FAIL"
+        if pass_weight > (1.0 - self.fail_quorum) * total:
+            return "PASS"
+        return None
+
+    def criterion_weights(self, results: Mapping[str, AnalysisResult], criterion: str) -> Tuple[float, float]:
+        # UNCLEAR abstains, as it does for a single profile
+        issue = normal = 0.0
+        for name, result in results.items():
+            if result.criteria is None:
+                continue
+            status = getattr(result.criteria, criterion).status
+            if status == "ISSUE":
+                issue += self.weight(name)
+            elif status == "NORMAL":
+                normal += self.weight(name)
+        return issue, normal
+
+    def could_flag_criterion(self, results: Mapping[str, AnalysisResult], waiting: Sequence[PromptProfile]) -> bool:
+        # Whether the structured profiles still running could yet turn a combined criterion into an ISSUE
+        pending = sum(self.weight(profile.name) for profile in waiting if profile.structured)
+        if pending <= 0:
+            return False
+        for criterion in CRITERIA:
+            issue, normal = self.criterion_weights(results, criterion)
+            if issue + pending >= self.fail_quorum * (issue + normal + pending):
+                return True
+        return False
+
+    def combine_criteria(self, results: Mapping[str, AnalysisResult]) -> Tuple[Optional[CriteriaFindings], Dict[str, Dict[str, str]]]:
+        # Free-text profiles only vote on the overall verdict; criteria come from structured ones
+        structured = {name: result.criteria for name, result in results.items() if result.criteria is not None}
+        if not structured:
+            return None, {}
+        combined, disputed = {}, {}
+        for criterion in CRITERIA:
+            findings = {name: getattr(criteria, criterion) for name, criteria in structured.items()}
+            statuses = {name: finding.status for name, finding in findings.items()}
+            if len(set(statuses.values())) > 1:
+                disputed[criterion] = statuses
+            issue, normal = self.criterion_weights(results, criterion)
+            if issue > 0 and issue >= self.fail_quorum * (issue + normal):
+                status = "ISSUE"
+            elif normal > 0:
+                status = "NORMAL"
+            else:
+                status = "UNCLEAR"
+            agreeing = [name for name, finding in findings.items() if finding.status == status]
+            combined[criterion] = CriterionFinding(
+                status=status,
+                confidence=sum(findings[name].confidence for name in agreeing) / len(agreeing),
+                details="; ".join(f"{name}: {findings[name].details}" for name in agreeing if findings[name].details),
+            )
+        return CriteriaFindings(**combined), disputed
+
+    def combine(self, votes: Dict[str, ProfileVote], results: Mapping[str, AnalysisResult], verdict: str) -> EnsembleResult:
+        criteria, disputed = self.combine_criteria(results)
+        # Same rule as a single structured profile: a flagged criterion always fails the plug
+        override = verdict == "PASS" and criteria is not None and any(
+            getattr(criteria, criterion).status == "ISSUE" for criterion in CRITERIA
+        )
+        if override:
+            verdict = "FAIL"
+        voted = {name: vote for name, vote in votes.items() if vote.overall_assessment is not None}
+        total = sum(vote.weight for vote in voted.values())
+        winning = sum(vote.weight for vote in voted.values() if vote.overall_assessment == verdict)
+        split = len({vote.overall_assessment for vote in voted.values()}) > 1
+
+        lines = []
+        for name, vote in votes.items():
+            if vote.overall_assessment is not None:
+                lines.append(f"- **{name}** ({vote.weight:g}): {vote.overall_assessment} [{vote.source}]")
+            else:
+                lines.append(f"- **{name}** ({vote.weight:g}): {vote.error or 'not needed'} [{vote.source}]")
+        if disputed:
+            lines.append("")
+            lines.append("Disputed criteria: " + ", ".join(CRITERIA[criterion] for criterion in disputed))
+        if override:
+            lines.append("")
+            lines.append("The votes passed the plug, but the combined criteria flag an issue, so it fails.")
+        lines.append("")
+        lines.append(f"**Overall assessment: {verdict}**")
+        return EnsembleResult(
+            analysis="\n".join(lines),
+            overall_assessment=verdict,
+            criteria=criteria,
+            confidence=round(winning / total, 3) if total else None,
+            votes=votes,
+            disagreement=Disagreement(
+                split=split, agreement=round(winning / total, 3) if total else 0.0, criteria=disputed, criteria_override=override,
+            ),
+            short_circuited=any(vote.source == "skipped" for vote in votes.values()),
+        )
+
+    async def run(
+        self,
+        engine: InspectionEngine,
+        uploaded_image: Part,
+        references: Optional[Mapping[str, Part]] = None,
+        image_digest: Optional[str] = None,
+        slot: Optional[Callable[[], AsyncContextManager]] = None,
+    ) -> EnsembleResult:
+        # Every profile shares the upload, the reference selection and the warm client;
+        # cached verdicts vote immediately and only the rest go to the model, concurrently.
+        # slot, when given, is held by each model call, so an ensemble uses one per profile it sends
+        if references is None:
+            with stage("reference_select"):
+                references = await asyncio.to_thread(engine.references_for, uploaded_image)
+        votes: Dict[str, ProfileVote] = {}
+        results: Dict[str, AnalysisResult] = {}
+        pending: Dict[asyncio.Task, PromptProfile] = {}
+        started = time.perf_counter()
+
+        def record(profile: PromptProfile, result: AnalysisResult, source: str):
+            results[profile.name] = result
+            votes[profile.name] = ProfileVote(
+                source=source,
+                weight=self.weight(profile.name),
+                overall_assessment=result.overall_assessment,
+                confidence=result.confidence,
+                latency_ms=round((time.perf_counter() - started) * 1000, 1),
+            )
+
+        def tally(waiting: Sequence[PromptProfile]) -> Optional[str]:
+            fail_weight = sum(vote.weight for vote in votes.values() if vote.overall_assessment == "FAIL")
+            pass_weight = sum(vote.weight for vote in votes.values() if vote.overall_assessment == "PASS")
+            verdict = self.decide(fail_weight, pass_weight, sum(self.weight(profile.name) for profile in waiting))
+            # A PASS is only settled once no running profile could still flag a combined criterion
+            if verdict == "PASS" and self.could_flag_criterion(results, waiting):
+                return None
+            return verdict
+
+        async def inspect(profile: PromptProfile) -> AnalysisResult:
+            if slot is None:
+                return await engine.inspect_async(profile, uploaded_image, references=references)
+            async with slot():
+                return await engine.inspect_async(profile, uploaded_image, references=references)
+
+        uncached = []
+        for profile in self.profiles:
+            votes[profile.name] = ProfileVote(source="skipped", weight=self.weight(profile.name))
+            cached = None
+            if image_digest is not None:
+                with stage("cache_lookup"):
+                    cached = await asyncio.to_thread(engine.cached_result, profile, image_digest)
+            if cached is not None:
+                record(profile, cached, "cache")
+            else:
+                uncached.append(profile)
+
+        errors: List[BaseException] = []
+        # Cached votes alone may already settle it, in which case no model call is made
+        verdict = tally(uncached)
+        if verdict is None:
+            for profile in uncached:
+                pending[asyncio.ensure_future(inspect(profile))] = profile
+        try:
+            while pending and verdict is None:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    profile = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        # A failed profile abstains; the others still decide the plug
+                        errors.append(e)
+                        votes[profile.name] = ProfileVote(
+                            source="error", weight=self.weight(profile.name),
+                            latency_ms=round((time.perf_counter() - started) * 1000, 1), error=str(e),
+                        )
+                        continue
+                    record(profile, result, "model")
+                    if image_digest is not None:
+                        await asyncio.to_thread(engine.store_result, profile, image_digest, result)
+                verdict = tally(list(pending.values()))
+        finally:
+            # Decided early, timed out or cancelled: the remaining calls are not needed
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        if verdict is None:
+            raise errors[0]
+        ensemble_result = self.combine(votes, results, verdict)
+        for name, vote in votes.items():
+            ENSEMBLE_PROFILE_OUTCOMES.inc(profile=name, outcome=vote.source)
+        if ensemble_result.disagreement.split:
+            ENSEMBLE_SPLITS.inc()
+        return ensemble_result
+
+def build_ensemble(
+    profile_names: Optional[Sequence[str]] = None,
+    weights: Optional[Dict[str, float]] = None,
+    fail_quorum: Optional[float] = None,
+) -> Ensemble:
+    # Unknown profile names raise ValueError from get_profile
+    profiles = [get_profile(name) for name in dict.fromkeys(profile_names or ENSEMBLE_PROFILES)]
+    return Ensemble(
+        profiles,
+        weights=ENSEMBLE_WEIGHTS if weights is None else weights,
+        fail_quorum=ENSEMBLE_FAIL_QUORUM if fail_quorum is None else fail_quorum,
+    )
+
+def run_ensemble_cli(ensemble: Ensemble, uploaded_image_path: str, use_cache: bool = True) -> EnsembleResult:
+    engine = InspectionEngine(result_cache=cache_from_env() if use_cache else None)
+    sink = sink_from_env()
+    try:
+        started = time.perf_counter()
+        engine.warm_up()
+        uploaded_image = Part.from_uri(mime_type="image/jpeg", uri=uploaded_image_path)
+        image_digest = uri_digest(uploaded_image_path) if use_cache else None
+        result = asyncio.run(ensemble.run(engine, uploaded_image, image_digest=image_digest))
+        sink.write({
+            "ts": round(time.time(), 3),
+            "image": uploaded_image_path,
+            "profile": ensemble.name,
+            "verdict": result.overall_assessment,
+            "confidence": result.confidence,
+            "votes": {name: vote.model_dump() for name, vote in result.votes.items()},
+            "disagreement": result.disagreement.model_dump(),
+            "source": "ensemble",
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+        })
+    finally:
+        sink.close()
+        engine.close()
+
+    print(result.analysis)
+    print(f"Ensemble anomaly detection complete: {result.overall_assessment}")
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect one spark plug image with several prompt profiles at once")
+    parser.add_argument("uploaded_image_path", help="gs:// URI of the image to inspect")
+    parser.add_argument("--profiles", default=",".join(ENSEMBLE_PROFILES), help=f"Comma-separated, from: {', '.join(sorted(PROFILES))}")
+    parser.add_argument("--weights", default=None, help="profile=weight pairs, e.g. strict=1,refined=2")
+    parser.add_argument("--fail-quorum", type=float, default=ENSEMBLE_FAIL_QUORUM)
+    parser.add_argument("--no-cache", action="store_true", help="Force re-inspection by every profile")
+    args = parser.parse_args()
+    ensemble = build_ensemble(
+        [name for name in args.profiles.split(",") if name],
+        parse_weights(args.weights) if args.weights is not None else None,
+        args.fail_quorum,
+    )
+    run_ensemble_cli(ensemble, args.uploaded_image_path, use_cache=not args.no_cache)
@@ -0,0 +1,386 @@
+import ipaddress
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from metrics import percentile
+
+DEFAULT_DB_PATH = os.path.join("spark_plug_analysis_results", "jobs.sqlite3")
+
+# Lower number is claimed first; re-inspections jump ahead of fresh line-camera uploads
+LANES = {
+    "reinspection": 0,
+    "normal": 1,
+}
+
+JOB_COLUMNS = (
+    "id, idempotency_key, profile, lane, status, mime_type, callback_url, result, error, "
+    "attempts, enqueued_at, started_at, finished_at, callback_status, sku"
+)
+
+# Callback hosts that may be private addresses, e.g. "mes.plant.local,.hooks.example.com";
+# a leading dot also allows subdomains. Hosts not listed must resolve to public addresses.
+CALLBACK_ALLOWED_HOSTS = [host.strip().lower() for host in os.getenv("JOB_CALLBACK_ALLOWED_HOSTS", "").split(",") if host.strip()]
+
+class QueueFullError(Exception):
+    pass
+
+@dataclass
+class Job:
+    id: str
+    idempotency_key: Optional[str]
+    profile: str
+    lane: str
+    status: str
+    mime_type: str
+    callback_url: Optional[str]
+    result: Optional[str]
+    error: Optional[str]
+    attempts: int
+    enqueued_at: float
+    started_at: Optional[float]
+    finished_at: Optional[float]
+    callback_status: Optional[str]
+    # None means the catalog's default SKU
+    sku: Optional[str] = None
+    payload: Optional[bytes] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "sku": self.sku,
+            "profile": self.profile,
+            "lane": self.lane,
+            "attempts": self.attempts,
+            "enqueued_at": self.enqueued_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "wait_seconds": self.started_at - self.enqueued_at if self.started_at else None,
+            "result": json.loads(self.result) if self.result else None,
+            "error": self.error,
+            "callback_status": self.callback_status,
+        }
+
+class JobQueue:
+    # Durable SQLite-backed queue: uploads survive restarts. A claimed job holds a lease
+    # that its worker keeps renewing; jobs whose lease lapsed (the worker died or hung)
+    # go back in the queue, so processes sharing the database never take over live work.
+    def __init__(
+        self,
+        path: str = DEFAULT_DB_PATH,
+        max_attempts: int = 3,
+        retry_delay_seconds: float = 10.0,
+        lease_seconds: float = 60.0,
+    ):
+        self.max_attempts = max_attempts
+        self.retry_delay_seconds = retry_delay_seconds
+        self.lease_seconds = lease_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                idempotency_key TEXT UNIQUE,
+                profile TEXT NOT NULL,
+                lane TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                payload BLOB,
+                mime_type TEXT NOT NULL,
+                callback_url TEXT,
+                result TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                enqueued_at REAL NOT NULL,
+                available_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                callback_status TEXT,
+                sku TEXT,
+                claimed_by TEXT,
+                lease_expires_at REAL
+            )"""
+        )
+        # Older databases lack these columns; their jobs use the default SKU, and running
+        # jobs without a lease count as expired
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("sku", "TEXT"), ("claimed_by", "TEXT"), ("lease_expires_at", "REAL")):
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, priority, available_at, enqueued_at)")
+        self._db.commit()
+
+    def _row_to_job(self, row: Tuple, payload: Optional[bytes] = None) -> Job:
+        return Job(*row, payload=payload)
+
+    def enqueue(
+        self,
+        payload: bytes,
+        mime_type: str,
+        profile: str,
+        lane: str = "normal",
+        idempotency_key: Optional[str] = None,
+        callback_url: Optional[str] = None,
+        sku: Optional[str] = None,
+        max_depth: Optional[int] = None,
+    ) -> Tuple[Job, bool]:
+        if lane not in LANES:
+            raise ValueError(f"Unknown lane '{lane}', expected one of: {', '.join(LANES)}")
+        now = time.time()
+        with self._lock:
+            if idempotency_key is not None:
+                row = self._db.execute(
+                    f"SELECT {JOB_COLUMNS} FROM jobs WHERE idempotency_key = ?", (idempotency_key,)
+                ).fetchone()
+                if row is not None:
+                    return self._row_to_job(row), False
+            # Checked only for jobs that would be created, so replays of a known key still succeed
+            if max_depth is not None:
+                depth = self._db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+                if depth >= max_depth:
+                    raise QueueFullError(f"Job queue is full ({depth} queued)")
+            job_id = uuid.uuid4().hex
+            self._db.execute(
+                "INSERT INTO jobs (id, idempotency_key, profile, sku, lane, priority, status, payload, mime_type, "
+                "callback_url, enqueued_at, available_at) VALUES (?, ?, ?, ?, ?, ?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, idempotency_key, profile, sku, lane, LANES[lane], payload, mime_type, callback_url, now, now),
+            )
+            self._db.commit()
+            row = self._db.execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row), True
+
+    def _expire_leases(self, now: float):
+        # A job that keeps killing its worker must not be retried forever, so lapsed leases
+        # count against max_attempts like any other failure
+        self._db.execute(
+            "UPDATE jobs SET status = 'failed', error = 'Worker lease expired', finished_at = ?, payload = NULL, "
+            "claimed_by = NULL WHERE status = 'running' AND (lease_expires_at IS NULL OR lease_expires_at < ?) "
+            "AND attempts >= ?",
+            (now, now, self.max_attempts),
+        )
+        self._db.execute(
+            "UPDATE jobs SET status = 'queued', claimed_by = NULL, lease_expires_at = NULL "
+            "WHERE status = 'running' AND (lease_expires_at IS NULL OR lease_expires_at < ?)",
+            (now,),
+        )
+
+    def claim(self) -> Optional[Job]:
+        now = time.time()
+        with self._lock:
+            self._expire_leases(now)
+            self._db.commit()
+            while True:
+                row = self._db.execute(
+                    f"SELECT {JOB_COLUMNS}, payload FROM jobs WHERE status = 'queued' AND available_at <= ? "
+                    "ORDER BY priority, enqueued_at LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is None:
+                    return None
+                # Guarded update so server processes sharing the database never claim the same job twice
+                cursor = self._db.execute(
+                    "UPDATE jobs SET status = 'running', started_at = ?, attempts = attempts + 1, "
+                    "claimed_by = ?, lease_expires_at = ? WHERE id = ? AND status = 'queued'",
+                    (now, self.worker_id, now + self.lease_seconds, row[0]),
+                )
+                self._db.commit()
+                if cursor.rowcount == 1:
+                    break
+        job = self._row_to_job(row[:-1], payload=row[-1])
+        job.status, job.started_at, job.attempts = "running", now, job.attempts + 1
+        return job
+
+    def renew(self, job_id: str) -> bool:
+        # False once the lease was lost, i.e. another worker may already be running the job
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND status = 'running' AND claimed_by = ?",
+                (time.time() + self.lease_seconds, job_id, self.worker_id),
+            )
+            self._db.commit()
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: str, result: str) -> bool:
+        # Returns False when this worker no longer holds the job, so its result is discarded
+        with self._lock:
+            # The upload is no longer needed once there is a verdict
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = 'done', result = ?, error = NULL, finished_at = ?, payload = NULL, "
+                "claimed_by = NULL, lease_expires_at = NULL WHERE id = ? AND status = 'running' AND claimed_by = ?",
+                (result, time.time(), job_id, self.worker_id),
+            )
+            self._db.commit()
+        return cursor.rowcount == 1
+
+    def fail(self, job_id: str, error: str, retryable: bool = False) -> bool:
+        # Returns True when the job went back into the queue for another attempt
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT attempts FROM jobs WHERE id = ? AND status = 'running' AND claimed_by = ?",
+                (job_id, self.worker_id),
+            ).fetchone()
+            if row is None:
+                return False
+            requeue = retryable and row[0] < self.max_attempts
+            if requeue:
+                self._db.execute(
+                    "UPDATE jobs SET status = 'queued', error = ?, available_at = ?, claimed_by = NULL, "
+                    "lease_expires_at = NULL WHERE id = ?",
+                    (error, now + self.retry_delay_seconds * row[0], job_id),
+                )
+            else:
+                self._db.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, payload = NULL, "
+                    "claimed_by = NULL, lease_expires_at = NULL WHERE id = ?",
+                    (error, now, job_id),
+                )
+            self._db.commit()
+        return requeue
+
+    def set_callback_status(self, job_id: str, callback_status: str):
+        with self._lock:
+            self._db.execute("UPDATE jobs SET callback_status = ? WHERE id = ?", (callback_status, job_id))
+            self._db.commit()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._db.execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row is not None else None
+
+    def depth(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    def prune(self, older_than_seconds: float) -> int:
+        with self._lock:
+            cursor = self._db.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                (time.time() - older_than_seconds,),
+            )
+            self._db.commit()
+        return cursor.rowcount
+
+    def metrics(self, window: int = 500) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            counts = dict(self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            depth_by_lane = dict(
+                self._db.execute("SELECT lane, COUNT(*) FROM jobs WHERE status = 'queued' GROUP BY lane").fetchall()
+            )
+            oldest = self._db.execute("SELECT MIN(enqueued_at) FROM jobs WHERE status = 'queued'").fetchone()[0]
+            waits: List[float] = [
+                row[0] for row in self._db.execute(
+                    "SELECT started_at - enqueued_at FROM jobs WHERE started_at IS NOT NULL "
+                    "ORDER BY started_at DESC LIMIT ?",
+                    (window,),
+                )
+            ]
+        return {
+            "depth": counts.get("queued", 0),
+            "depth_by_lane": {lane: depth_by_lane.get(lane, 0) for lane in LANES},
+            "running": counts.get("running", 0),
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "oldest_queued_seconds": now - oldest if oldest is not None else 0.0,
+            "wait_p50_seconds": percentile(waits, 50),
+            "wait_p95_seconds": percentile(waits, 95),
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+def host_allowed(host: str, allowed_hosts: List[str]) -> bool:
+    return any(host == entry or (entry.startswith(".") and host.endswith(entry)) for entry in allowed_hosts)
+
+def public_address(address: str) -> bool:
+    try:
+        return ipaddress.ip_address(address).is_global
+    except ValueError:
+        return False
+
+def validate_callback_url(url: str, allowed_hosts: List[str] = CALLBACK_ALLOWED_HOSTS) -> str:
+    # The server posts results to this URL, so it must not reach files or internal services
+    parsed = urllib.parse.urlsplit(url)
+    if parsed.scheme not in ("http", "https"):
+        raise ValueError(f"Callback URL must use http or https, got '{parsed.scheme or url}'")
+    host = (parsed.hostname or "").lower()
+    if not host:
+        raise ValueError("Callback URL has no host")
+    if host_allowed(host, allowed_hosts):
+        return url
+    if allowed_hosts:
+        raise ValueError(f"Callback host '{host}' is not in JOB_CALLBACK_ALLOWED_HOSTS")
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        # A name; what it resolves to is checked again when the callback is sent
+        if host == "localhost" or host.endswith((".localhost", ".internal", ".local")):
+            raise ValueError(f"Callback host '{host}' is not a public address")
+        return url
+    if not public_address(host):
+        raise ValueError(f"Callback host '{host}' is not a public address")
+    return url
+
+def resolves_to_public(host: str, port: Optional[int]) -> bool:
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, port or 443, proto=socket.IPPROTO_TCP)}
+    except OSError:
+        return False
+    return bool(addresses) and all(public_address(address) for address in addresses)
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    # A redirect could point the callback anywhere, past the checks above
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+def deliver_callback(
+    url: str, payload: Dict[str, Any], attempts: int = 3, timeout: float = 10.0, allowed_hosts: List[str] = CALLBACK_ALLOWED_HOSTS,
+) -> str:
+    try:
+        validate_callback_url(url, allowed_hosts)
+    except ValueError as e:
+        return f"failed: {e}"
+    parsed = urllib.parse.urlsplit(url)
+    host = (parsed.hostname or "").lower()
+    # Checked at send time too: a public name can be re-pointed at an internal address after enqueue
+    if not host_allowed(host, allowed_hosts) and not resolves_to_public(host, parsed.port):
+        return f"failed: callback host '{host}' does not resolve to a public address"
+    opener = urllib.request.build_opener(NoRedirect)
+    body = json.dumps(payload).encode()
+    error = ""
+    for attempt in range(attempts):
+        request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"}, method="POST")
+        try:
+            with opener.open(request, timeout=timeout) as response:
+                return f"delivered ({response.status})"
+        except Exception as e:
+            error = str(e)
+            if attempt < attempts - 1:
+                time.sleep(2 ** attempt)
+    return f"failed: {error}"
+
+def queue_from_env() -> JobQueue:
+    return JobQueue(
+        os.getenv("JOB_QUEUE_DB", DEFAULT_DB_PATH),
+        max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "3")),
+        retry_delay_seconds=float(os.getenv("JOB_RETRY_DELAY_SECONDS", "10")),
+        lease_seconds=float(os.getenv("JOB_LEASE_SECONDS", "60")),
+    )
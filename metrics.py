@@ -0,0 +1,199 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "0").lower() in ("1", "true", "yes")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{escape_label(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+Callback = Callable[[], Dict[Tuple[str, ...], float]]
+
+def percentile(values: Iterable[float], pct: float) -> Optional[float]:
+    # Nearest-rank on the sorted samples; shared by the benchmarks, the hedge delay and queue waits
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))]
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), callback: Optional[Callback] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # Callback metrics are read at scrape time from state kept elsewhere, e.g. cache stats
+        self.callback = callback
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _current(self) -> List[Tuple[Tuple[str, ...], float]]:
+        if self.callback is not None:
+            try:
+                return sorted(self.callback().items())
+            except Exception:
+                return []
+        with self._lock:
+            return sorted(self._values.items())
+
+    def samples(self) -> List[str]:
+        # One line per label set; Histogram overrides this with its bucket series
+        return [f"{self.name}{format_labels(self.labelnames, key)} {value}" for key, value in self._current()]
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self.samples()
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: Dict[Tuple[str, ...], List[int]] = {}
+        self._sums: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            counts[index] += 1
+            self._sums[key] += value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            snapshot = sorted((key, list(counts), self._sums[key]) for key, counts in self._counts.items())
+        lines = []
+        for key, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            # Re-registering (e.g. a module reload) keeps the original series
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = (), callback: Optional[Callback] = None) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames, callback))
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = (), callback: Optional[Callback] = None) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames, callback))
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+STAGE_SECONDS = histogram(
+    "spark_plug_stage_seconds", "Time spent in each inspection pipeline stage", ["stage"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+MODEL_TOKENS = counter("spark_plug_model_tokens_total", "Model tokens from response usage metadata", ["direction"])
+VERDICTS = counter("spark_plug_verdicts_total", "Inspection verdicts", ["profile", "verdict", "source"])
+IN_FLIGHT = gauge("spark_plug_inference_in_flight", "Synchronous inspections currently holding an inference slot")
+HTTP_REQUESTS = counter("spark_plug_http_requests_total", "HTTP requests", ["route", "method", "status"])
+HTTP_SECONDS = histogram("spark_plug_http_request_seconds", "HTTP request latency", ["route", "method"])
+
+def record_usage(response: Any):
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    MODEL_TOKENS.inc(getattr(usage, "prompt_token_count", 0) or 0, direction="in")
+    MODEL_TOKENS.inc(getattr(usage, "candidates_token_count", 0) or 0, direction="out")
+
+_tracer: Any = None
+_tracer_lock = threading.Lock()
+
+def get_tracer() -> Any:
+    # OpenTelemetry is optional; without it, or with tracing off, spans cost nothing
+    global _tracer
+    if not TRACING_ENABLED:
+        return None
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                try:
+                    from opentelemetry import trace
+                except ImportError:
+                    _tracer = False
+                else:
+                    _tracer = trace.get_tracer("spark_plug_inspection")
+    return _tracer or None
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Any]:
+    tracer = get_tracer()
+    if tracer is None:
+        yield None
+        return
+    with tracer.start_as_current_span(name, attributes={k: v for k, v in attributes.items() if v is not None}) as current:
+        yield current
+
+@contextmanager
+def stage(name: str, **attributes) -> Iterator[Any]:
+    started = time.perf_counter()
+    try:
+        with span(f"inspection.{name}", **attributes) as current:
+            yield current
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=name)
@@ -0,0 +1,262 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from google.api_core import exceptions as google_exceptions
+
+from schemas import CRITERIA
+
+# vertex: the live endpoint. stub: deterministic local fake. record/replay: cassette of real responses.
+BACKEND = os.getenv("MODEL_BACKEND", "vertex").lower()
+CASSETTE_PATH = os.getenv("MODEL_CASSETTE_PATH", os.path.join("spark_plug_analysis_results", "cassette.jsonl"))
+
+STUB_LATENCY_SECONDS = float(os.getenv("STUB_LATENCY_SECONDS", "0.5"))
+STUB_JITTER_SECONDS = float(os.getenv("STUB_JITTER_SECONDS", "0.1"))
+STUB_ERROR_RATE = float(os.getenv("STUB_ERROR_RATE", "0"))
+STUB_FAIL_RATE = float(os.getenv("STUB_FAIL_RATE", "0.2"))
+STUB_SEED = int(os.getenv("STUB_SEED", "0"))
+
+# Rough per-part input token costs used by the stub; real counts come from recorded usage
+IMAGE_TOKENS = 258
+VIDEO_TOKENS = 263 * 60
+DOCUMENT_TOKENS = 258 * 10
+
+CANDIDATE_PATTERN = re.compile(r"^CANDIDATE (\d+):$")
+
+class Usage:
+    def __init__(self, prompt_token_count: int = 0, candidates_token_count: int = 0):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+class Response:
+    def __init__(self, text: str, usage_metadata: Optional[Usage] = None):
+        self.text = text
+        self.usage_metadata = usage_metadata or Usage()
+
+class UsageMeter:
+    # Process-wide token and call counters for whichever backend is active
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = 0
+            self.errors = 0
+            self.prompt_tokens = 0
+            self.output_tokens = 0
+
+    def record(self, usage: Any):
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += getattr(usage, "prompt_token_count", 0) or 0
+            self.output_tokens += getattr(usage, "candidates_token_count", 0) or 0
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "prompt_tokens": self.prompt_tokens,
+                "output_tokens": self.output_tokens,
+                "total_tokens": self.prompt_tokens + self.output_tokens,
+            }
+
+USAGE = UsageMeter()
+
+def part_digest(part: Any) -> str:
+    if isinstance(part, str):
+        return hashlib.sha256(part.encode()).hexdigest()
+    return hashlib.sha256(repr(part.to_dict()).encode()).hexdigest()
+
+def estimate_prompt_tokens(prompt: List[Any]) -> int:
+    tokens = 0
+    for part in prompt:
+        if isinstance(part, str):
+            tokens += len(part) // 4
+        elif part.mime_type.startswith("video/"):
+            tokens += VIDEO_TOKENS
+        elif part.mime_type == "application/pdf":
+            tokens += DOCUMENT_TOKENS
+        else:
+            tokens += IMAGE_TOKENS
+    return tokens
+
+def structured_verdict(verdict: str) -> Dict[str, Any]:
+    status = "ISSUE" if verdict == "FAIL" else "NORMAL"
+    return {
+        "criteria": {
+            name: {"status": status if name == "tip_condition" else "NORMAL", "confidence": 0.9, "details": ""}
+            for name in CRITERIA
+        },
+        "summary": "Stub verdict.",
+        "overall_assessment": verdict,
+        "confidence": 0.9,
+    }
+
+async def stream_chunks(text: str, chunk_size: int = 64) -> AsyncIterator[Response]:
+    for i in range(0, len(text), chunk_size):
+        yield Response(text[i:i + chunk_size])
+
+class StubModel:
+    # Drop-in for GenerativeModel with no network: the verdict is a pure function of the
+    # upload's bytes, so repeated runs and different code versions see the same answers.
+    def __init__(
+        self,
+        latency_seconds: float = STUB_LATENCY_SECONDS,
+        jitter_seconds: float = STUB_JITTER_SECONDS,
+        error_rate: float = STUB_ERROR_RATE,
+        fail_rate: float = STUB_FAIL_RATE,
+        seed: int = STUB_SEED,
+    ):
+        self.latency_seconds = latency_seconds
+        self.jitter_seconds = jitter_seconds
+        self.error_rate = error_rate
+        self.fail_rate = fail_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _draw(self) -> tuple:
+        with self._lock:
+            delay = max(0.0, self.latency_seconds + self._random.uniform(-self.jitter_seconds, self.jitter_seconds))
+            failed = self._random.random() < self.error_rate
+        return delay, failed
+
+    def verdict(self, part: Any) -> str:
+        return "FAIL" if int(part_digest(part)[:8], 16) / 0xFFFFFFFF < self.fail_rate else "PASS"
+
+    def respond(self, prompt: List[Any], generation_config: Dict[str, Any]) -> Response:
+        candidates = [prompt[i + 1] for i, part in enumerate(prompt[:-1])
+                      if isinstance(part, str) and CANDIDATE_PATTERN.match(part)]
+        uploads = candidates or [next((part for part in prompt if not isinstance(part, str)), "")]
+        verdicts = [self.verdict(part) for part in uploads]
+
+        structured = "response_schema" in generation_config
+        if candidates and structured:
+            text = json.dumps([
+                {"candidate": i, **structured_verdict(verdict)} for i, verdict in enumerate(verdicts, 1)
+            ])
+        elif candidates:
+            text = json.dumps([
+                {"candidate": i, "analysis": f"Stub analysis. Overall assessment: {verdict}", "overall_assessment": verdict}
+                for i, verdict in enumerate(verdicts, 1)
+            ])
+        elif generation_config.get("response_mime_type") == "application/json":
+            text = json.dumps(structured_verdict(verdicts[0]))
+        else:
+            text = f"Stub analysis of the uploaded spark plug.\n\nOverall assessment: {verdicts[0]}"
+        return Response(text, Usage(estimate_prompt_tokens(prompt), len(text) // 4))
+
+    def generate_content(self, prompt: List[Any], generation_config: Optional[Dict[str, Any]] = None, stream: bool = False):
+        delay, failed = self._draw()
+        time.sleep(delay)
+        if failed:
+            USAGE.record_error()
+            raise google_exceptions.ServiceUnavailable("Stub backend: injected error")
+        response = self.respond(prompt, generation_config or {})
+        USAGE.record(response.usage_metadata)
+        return iter([response]) if stream else response
+
+    async def generate_content_async(self, prompt: List[Any], generation_config: Optional[Dict[str, Any]] = None, stream: bool = False):
+        delay, failed = self._draw()
+        await asyncio.sleep(delay)
+        if failed:
+            USAGE.record_error()
+            raise google_exceptions.ServiceUnavailable("Stub backend: injected error")
+        response = self.respond(prompt, generation_config or {})
+        USAGE.record(response.usage_metadata)
+        return stream_chunks(response.text) if stream else response
+
+class CassetteMiss(LookupError):
+    pass
+
+class CassetteModel:
+    # Records real responses keyed by prompt and config, then replays them offline
+    def __init__(self, path: str, mode: str = "replay", inner: Any = None):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode '{mode}'")
+        if mode == "record" and inner is None:
+            raise ValueError("Recording needs a live model to record from")
+        self.path = path
+        self.mode = mode
+        self.inner = inner
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[entry["key"]] = entry
+
+    @staticmethod
+    def key(prompt: List[Any], generation_config: Optional[Dict[str, Any]]) -> str:
+        h = hashlib.sha256()
+        h.update(json.dumps(generation_config or {}, sort_keys=True, default=str).encode())
+        for part in prompt:
+            h.update(part_digest(part).encode())
+        return h.hexdigest()
+
+    def _replay(self, key: str) -> Response:
+        entry = self._entries.get(key)
+        if entry is None:
+            raise CassetteMiss(f"No recorded response for prompt {key[:12]} in {self.path}")
+        usage = Usage(entry.get("prompt_tokens", 0), entry.get("output_tokens", 0))
+        USAGE.record(usage)
+        return Response(entry["text"], usage)
+
+    def _store(self, key: str, response: Any) -> Response:
+        usage = getattr(response, "usage_metadata", None)
+        entry = {
+            "key": key,
+            "text": response.text,
+            "prompt_tokens": getattr(usage, "prompt_token_count", 0) or 0,
+            "output_tokens": getattr(usage, "candidates_token_count", 0) or 0,
+        }
+        with self._lock:
+            self._entries[key] = entry
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+        USAGE.record(usage)
+        return Response(entry["text"], Usage(entry["prompt_tokens"], entry["output_tokens"]))
+
+    def generate_content(self, prompt: List[Any], generation_config: Optional[Dict[str, Any]] = None, stream: bool = False):
+        key = self.key(prompt, generation_config)
+        if self.mode == "replay":
+            response = self._replay(key)
+        else:
+            response = self._store(key, self.inner.generate_content(prompt, generation_config=generation_config))
+        return iter([response]) if stream else response
+
+    async def generate_content_async(self, prompt: List[Any], generation_config: Optional[Dict[str, Any]] = None, stream: bool = False):
+        # Streams are recorded whole and replayed in chunks, so they share entries with unary calls
+        key = self.key(prompt, generation_config)
+        if self.mode == "replay":
+            response = self._replay(key)
+        else:
+            live = await self.inner.generate_content_async(prompt, generation_config=generation_config)
+            response = await asyncio.to_thread(self._store, key, live)
+        return stream_chunks(response.text) if stream else response
+
+def model_from_env(vertex_factory: Callable[[], Any]) -> Any:
+    if BACKEND == "vertex":
+        return vertex_factory()
+    if BACKEND == "stub":
+        return StubModel()
+    if BACKEND == "replay":
+        return CassetteModel(CASSETTE_PATH, "replay")
+    if BACKEND == "record":
+        return CassetteModel(CASSETTE_PATH, "record", inner=vertex_factory())
+    raise ValueError(f"Unknown MODEL_BACKEND '{BACKEND}', expected vertex, stub, record or replay")
@@ -1,11 +1,34 @@
 import React, { useState, useRef } from 'react';
-import axios from 'axios';
 import ReactMarkdown from 'react-markdown';
 import { motion } from 'framer-motion';
 import { Zap, BarChart2, Clock, Award } from 'lucide-react';
 
 const API_URL = 'http://localhost:8000';
 
+const CRITERIA_TITLES = {
+  black_marks: 'Black Marks',
+  branding: 'Branding',
+  missing_parts: 'Missing Parts',
+  nut_bending: 'Nut Bending',
+  tip_condition: 'Tip Condition',
+};
+
+const parseSseEvents = (buffer) => {
+  const events = [];
+  let boundary = buffer.indexOf('\n\n');
+  while (boundary !== -1) {
+    const block = buffer.slice(0, boundary);
+    buffer = buffer.slice(boundary + 2);
+    const event = block.match(/^event: (.*)$/m)?.[1];
+    const data = block.match(/^data: (.*)$/m)?.[1];
+    if (event && data) {
+      events.push({ event, data: JSON.parse(data) });
+    }
+    boundary = buffer.indexOf('\n\n');
+  }
+  return { events, rest: buffer };
+};
+
 const Header = () => (
   <motion.header 
     initial={{ y: -50, opacity: 0 }}
@@ -62,17 +85,50 @@ const LLMModel = () => {
 
     setLoading(true);
     setError(null);
+    setAnalysis(null);
 
     const formData = new FormData();
     formData.append('file', file);
 
     try {
-      const response = await axios.post(`${API_URL}/analyze/`, formData, {
-        headers: { 'Content-Type': 'multipart/form-data' },
+      // Stream findings so the verdict shows up as soon as the model decides it
+      const response = await fetch(`${API_URL}/analyze/stream`, { method: 'POST', body: formData });
+      if (!response.ok) {
+        const body = await response.json().catch(() => ({}));
+        throw new Error(body.detail || `Request failed with status ${response.status}`);
+      }
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let findings = [];
+      let verdict = null;
+      const showPartial = () => setAnalysis({
+        overall_assessment: verdict || 'PENDING',
+        analysis: findings.join('\n'),
       });
-      setAnalysis(response.data);
+
+      for (;;) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        const parsed = parseSseEvents(buffer + decoder.decode(value, { stream: true }));
+        buffer = parsed.rest;
+        for (const { event, data } of parsed.events) {
+          if (event === 'criterion') {
+            findings = [...findings, `- **${CRITERIA_TITLES[data.name] || data.name}**: ${data.status} ${data.details}`];
+            showPartial();
+          } else if (event === 'verdict') {
+            verdict = data.overall_assessment;
+            showPartial();
+          } else if (event === 'result') {
+            setAnalysis(data);
+          } else if (event === 'error') {
+            throw new Error(data.detail);
+          }
+        }
+      }
     } catch (error) {
-      setError(error.response?.data?.detail || error.message || 'An unknown error occurred');
+      setError(error.message || 'An unknown error occurred');
     } finally {
       setLoading(false);
     }
@@ -174,7 +230,7 @@ const LLMModel = () => {
           >
             <h2 className="text-xl font-bold mb-3">Analysis Results</h2>
             <div className="flex-grow overflow-auto" style={{ height: '300px' }}>
-              {loading && (
+              {loading && !analysis && (
                 <div className="flex justify-center items-center h-full">
                   <motion.div 
                     animate={{ rotate: 360 }}
@@ -205,7 +261,8 @@ const LLMModel = () => {
                   <div className="flex justify-between items-center">
                     <span className="text-gray-700">Overall Assessment:</span>
                     <span className={`px-2 py-1 rounded-full text-sm font-medium ${
-                      analysis.overall_assessment === 'PASS' ? 'bg-green-200 text-green-800' : 'bg-red-200 text-red-800'
+                      analysis.overall_assessment === 'PASS' ? 'bg-green-200 text-green-800'
+                        : analysis.overall_assessment === 'PENDING' ? 'bg-gray-200 text-gray-800' : 'bg-red-200 text-red-800'
                     }`}>
                       {analysis.overall_assessment}
                     </span>
@@ -0,0 +1,122 @@
+import argparse
+import glob
+import io
+import os
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+IMAGE_SIGNATURES = {
+    b"\xff\xd8\xff": "image/jpeg",
+    b"\x89PNG\r\n\x1a\n": "image/png",
+}
+
+MAX_SIDE = int(os.getenv("PREPROCESS_MAX_SIDE", "1024"))
+JPEG_QUALITY = int(os.getenv("PREPROCESS_JPEG_QUALITY", "85"))
+AUTOCROP = os.getenv("PREPROCESS_AUTOCROP", "1").lower() in ("1", "true", "yes")
+
+class UnsupportedImageError(ValueError):
+    pass
+
+@dataclass
+class PreprocessedImage:
+    data: bytes
+    mime_type: str
+    image: Image.Image
+    original_bytes: int
+    original_size: Tuple[int, int]
+
+def sniff_mime_type(data: bytes) -> str:
+    for signature, mime_type in IMAGE_SIGNATURES.items():
+        if data.startswith(signature):
+            return mime_type
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    raise UnsupportedImageError("Upload is not a JPEG, PNG or WebP image")
+
+def plug_bounding_box(image: Image.Image, threshold: int = 30, margin: float = 0.05) -> Optional[Tuple[int, int, int, int]]:
+    # The plug is whatever differs from the background colour sampled along the border
+    small = image.convert("L")
+    small.thumbnail((256, 256))
+    pixels = np.asarray(small, dtype=np.int16)
+    border = np.concatenate([pixels[0], pixels[-1], pixels[:, 0], pixels[:, -1]])
+    mask = np.abs(pixels - np.median(border)) > threshold
+    rows, cols = np.flatnonzero(mask.any(axis=1)), np.flatnonzero(mask.any(axis=0))
+    if rows.size == 0 or cols.size == 0:
+        return None
+
+    height, width = pixels.shape
+    top, bottom, left, right = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+    if (bottom - top) * (right - left) < 0.02 * height * width:
+        return None
+    pad_y, pad_x = int(margin * height), int(margin * width)
+    scale_x, scale_y = image.width / width, image.height / height
+    return (
+        int(max(0, left - pad_x) * scale_x),
+        int(max(0, top - pad_y) * scale_y),
+        int(min(width, right + pad_x) * scale_x),
+        int(min(height, bottom + pad_y) * scale_y),
+    )
+
+def preprocess_image(
+    data: bytes,
+    max_side: int = MAX_SIDE,
+    quality: int = JPEG_QUALITY,
+    autocrop: bool = AUTOCROP,
+) -> PreprocessedImage:
+    sniff_mime_type(data)
+    try:
+        image = Image.open(io.BytesIO(data))
+        original_size = image.size
+        # Let the JPEG decoder downscale by a power of two while decoding
+        image.draft("RGB", (max_side, max_side))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+    except Exception as e:
+        raise UnsupportedImageError(f"Could not decode image: {e}")
+
+    if autocrop:
+        box = plug_bounding_box(image)
+        if box is not None:
+            image = image.crop(box)
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    out = io.BytesIO()
+    image.save(out, format="JPEG", quality=quality, optimize=True)
+    return PreprocessedImage(
+        data=out.getvalue(),
+        mime_type="image/jpeg",
+        image=image,
+        original_bytes=len(data),
+        original_size=original_size,
+    )
+
+def settings_fingerprint() -> str:
+    return f"max_side={MAX_SIDE};quality={JPEG_QUALITY};autocrop={int(AUTOCROP)}"
+
+def preprocess_directory(source_dir: str, output_dir: str) -> int:
+    # Offline pass over the reference images so they match what uploads look like
+    os.makedirs(output_dir, exist_ok=True)
+    count = 0
+    for path in sorted(glob.glob(os.path.join(source_dir, "*"))):
+        if not path.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        with open(path, "rb") as f:
+            processed = preprocess_image(f.read())
+        name = os.path.splitext(os.path.basename(path))[0] + ".jpeg"
+        with open(os.path.join(output_dir, name), "wb") as f:
+            f.write(processed.data)
+        count += 1
+    return count
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Preprocess reference images the same way as uploads")
+    parser.add_argument("source_dir")
+    parser.add_argument("output_dir")
+    args = parser.parse_args()
+    count = preprocess_directory(args.source_dir, args.output_dir)
+    print(f"Preprocessed {count} images into {args.output_dir}")
@@ -0,0 +1,214 @@
+import argparse
+import glob
+import io
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from preprocessing import IMAGE_EXTENSIONS, UnsupportedImageError, preprocess_image
+
+HASH_SIZE = 16
+THUMBNAIL_SIZE = 32
+
+def load_image(data: bytes) -> Image.Image:
+    image = Image.open(io.BytesIO(data))
+    image.draft("L", (THUMBNAIL_SIZE * 8, THUMBNAIL_SIZE * 8))
+    return image.convert("L")
+
+def difference_hash(image: Image.Image, hash_size: int = HASH_SIZE) -> np.ndarray:
+    pixels = np.asarray(image.resize((hash_size + 1, hash_size), Image.BILINEAR), dtype=np.int16)
+    return (pixels[:, 1:] > pixels[:, :-1]).ravel()
+
+def thumbnail_embedding(image: Image.Image, size: int = THUMBNAIL_SIZE) -> np.ndarray:
+    pixels = np.asarray(image.resize((size, size), Image.BILINEAR), dtype=np.float32).ravel()
+    pixels -= pixels.mean()
+    norm = np.linalg.norm(pixels)
+    return pixels / norm if norm else pixels
+
+@dataclass
+class PrescreenResult:
+    decision: str
+    hash_distance: float
+    similarity: float
+    reference: str
+    seconds: float
+
+    @property
+    def escalate(self) -> bool:
+        return self.decision != "PASS"
+
+    def summary(self) -> str:
+        return (
+            f"Pre-screen: closest reference {self.reference} "
+            f"(hash distance {self.hash_distance:.3f}, similarity {self.similarity:.3f}). "
+            f"No anomalies suspected; not escalated to the model.\n\nOverall assessment: PASS"
+        )
+
+class PrescreenStats:
+    def __init__(self):
+        self.screened = 0
+        self.passed = 0
+        self.escalated = 0
+        self.prescreen_seconds = 0.0
+        self.model_calls = 0
+        self.model_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record_prescreen(self, result: PrescreenResult):
+        with self._lock:
+            self.screened += 1
+            self.prescreen_seconds += result.seconds
+            if result.escalate:
+                self.escalated += 1
+            else:
+                self.passed += 1
+
+    def record_model(self, seconds: float):
+        with self._lock:
+            self.model_calls += 1
+            self.model_seconds += seconds
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "screened": self.screened,
+                "passed_locally": self.passed,
+                "escalated": self.escalated,
+                "escalation_rate": self.escalated / self.screened if self.screened else 0.0,
+                "prescreen_avg_seconds": self.prescreen_seconds / self.screened if self.screened else 0.0,
+                "model_avg_seconds": self.model_seconds / self.model_calls if self.model_calls else 0.0,
+            }
+
+class Prescreener:
+    # Cheap CPU check against the reference images. Only uploads that look
+    # very close to a known-good reference pass here; everything else escalates.
+    def __init__(self, references: Dict[str, bytes], pass_hash_distance: float = 0.12, min_similarity: float = 0.9):
+        self.pass_hash_distance = pass_hash_distance
+        self.min_similarity = min_similarity
+        self.names: List[str] = []
+        hashes, embeddings = [], []
+        for name, data in sorted(references.items()):
+            # Uploads are screened after cropping, rotation and downscaling, so references must be too
+            image = preprocess_image(data).image.convert("L")
+            self.names.append(name)
+            hashes.append(difference_hash(image))
+            embeddings.append(thumbnail_embedding(image))
+        if not self.names:
+            raise ValueError("Pre-screen needs at least one reference image")
+        self.hashes = np.stack(hashes)
+        self.embeddings = np.stack(embeddings)
+        self.stats = PrescreenStats()
+
+    @classmethod
+    def from_directory(cls, directory: str, **thresholds) -> "Prescreener":
+        references = {}
+        for path in sorted(glob.glob(os.path.join(directory, "*"))):
+            if path.lower().endswith(IMAGE_EXTENSIONS):
+                with open(path, "rb") as f:
+                    references[os.path.basename(path)] = f.read()
+        return cls(references, **thresholds)
+
+    def nearest(self, upload: Union[bytes, Image.Image]) -> Tuple[float, float, str]:
+        # Accept an already decoded upload so the preprocessing stage's decode is reused
+        if not isinstance(upload, Image.Image):
+            upload = preprocess_image(upload).image
+        image = upload.convert("L")
+        hash_distances = (self.hashes != difference_hash(image)).mean(axis=1)
+        similarities = self.embeddings @ thumbnail_embedding(image)
+        best = int(np.argmin(hash_distances - similarities))
+        return float(hash_distances[best]), float(similarities[best]), self.names[best]
+
+    def screen(self, upload: Union[bytes, Image.Image]) -> PrescreenResult:
+        started = time.perf_counter()
+        try:
+            hash_distance, similarity, reference = self.nearest(upload)
+        except Exception:
+            # Anything we can't decode goes to the model as before
+            result = PrescreenResult("ESCALATE", 1.0, 0.0, "", time.perf_counter() - started)
+        else:
+            passed = hash_distance <= self.pass_hash_distance and similarity >= self.min_similarity
+            result = PrescreenResult(
+                "PASS" if passed else "ESCALATE", hash_distance, similarity, reference, time.perf_counter() - started
+            )
+        self.stats.record_prescreen(result)
+        return result
+
+def prescreener_from_env() -> Optional[Prescreener]:
+    directory = os.getenv("PRESCREEN_REFERENCE_DIR")
+    if not directory:
+        return None
+    return Prescreener.from_directory(
+        directory,
+        pass_hash_distance=float(os.getenv("PRESCREEN_PASS_HASH_DISTANCE", "0.12")),
+        min_similarity=float(os.getenv("PRESCREEN_MIN_SIMILARITY", "0.9")),
+    )
+
+def evaluate(prescreener: Prescreener, llm_results_dir: str) -> Dict[str, Any]:
+    # Compare local decisions with LLM verdicts written by batch_inspect.py
+    rows = []
+    for path in sorted(glob.glob(os.path.join(llm_results_dir, "*.json"))):
+        with open(path) as f:
+            result = json.load(f)
+        source = result.get("source")
+        if not source or source.startswith("gs://") or not os.path.exists(source):
+            continue
+        with open(source, "rb") as f:
+            data = f.read()
+        try:
+            # Same preprocessing the service applies before its pre-screen
+            upload = preprocess_image(data).image
+        except UnsupportedImageError:
+            # The service rejects these with a 415 before any pre-screen
+            continue
+        screened = prescreener.screen(upload)
+        rows.append((screened, result["overall_assessment"]))
+
+    passed = [verdict for screened, verdict in rows if not screened.escalate]
+    report: Dict[str, Any] = {
+        "images": len(rows),
+        "passed_locally": len(passed),
+        "escalation_rate": 1 - len(passed) / len(rows) if rows else None,
+        # Share of locally passed plugs the model also passed; misses here are escaped defects
+        "agreement_on_local_pass": passed.count("PASS") / len(passed) if passed else None,
+        "escaped_llm_fails": passed.count("FAIL"),
+        "prescreen_avg_seconds": prescreener.stats.snapshot()["prescreen_avg_seconds"],
+        "thresholds": {
+            "pass_hash_distance": prescreener.pass_hash_distance,
+            "min_similarity": prescreener.min_similarity,
+        },
+    }
+
+    sweep = []
+    for distance in (0.04, 0.08, 0.12, 0.16, 0.2, 0.25):
+        local = [v for s, v in rows if s.hash_distance <= distance and s.similarity >= prescreener.min_similarity]
+        sweep.append({
+            "pass_hash_distance": distance,
+            "escalation_rate": 1 - len(local) / len(rows) if rows else None,
+            "escaped_llm_fails": local.count("FAIL"),
+        })
+    report["threshold_sweep"] = sweep
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate the local pre-screen against LLM verdicts")
+    parser.add_argument("reference_dir", help="Directory of known-good reference images")
+    parser.add_argument("llm_results_dir", help="Per-image results written by batch_inspect.py")
+    parser.add_argument("--pass-hash-distance", type=float, default=0.12)
+    parser.add_argument("--min-similarity", type=float, default=0.9)
+    parser.add_argument("--output", default=os.path.join("spark_plug_analysis_results", "prescreen_evaluation.json"))
+    args = parser.parse_args()
+
+    prescreener = Prescreener.from_directory(
+        args.reference_dir, pass_hash_distance=args.pass_hash_distance, min_similarity=args.min_similarity
+    )
+    report = evaluate(prescreener, args.llm_results_dir)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Pre-screen evaluation complete. Report saved in {args.output}")
@@ -0,0 +1,230 @@
+from dataclasses import dataclass
+from typing import Any, Dict
+
+from schemas import VERDICT_RESPONSE_SCHEMA, AnalysisResult, assessment_from_text, parse_structured_verdict
+
+TEXT_GENERATION_CONFIG = {
+    "max_output_tokens": 2048,
+    "temperature": 0.2,
+    "top_p": 0.8,
+}
+
+# Constrained JSON output keeps responses short and removes free-text parsing
+STRUCTURED_GENERATION_CONFIG = {
+    "max_output_tokens": 1024,
+    "temperature": 0.2,
+    "top_p": 0.8,
+    "response_mime_type": "application/json",
+    "response_schema": VERDICT_RESPONSE_SCHEMA,
+}
+
+REFINED_ANOMALY_DETECTION_PROMPT = """You are a quality control AI for NGK SILKFR8A6 Laser Iridium Spark Plugs. Your task is to analyze the uploaded image and detect significant anomalies by comparing it to the provided reference images. Focus only on the following major issues:
+
+        1. Black Marks:
+           - Look for any noticeable black marks or discolorations that are not present in the reference images.
+           - Pay special attention to marker marks, which may appear as intentional black lines or writing on the spark plug.
+        2. Missing Branding:
+           - Check if the "NGK" branding and model number are completely absent or unreadable.
+        3. Missing Parts:
+           - Verify that all essential parts of the spark plug are present (hexagonal nut, insulator, metal shell, precious metal tip).
+        4. Nut Bending:
+           - Look for any significant bending or distortion of the hexagonal nut.
+        5. Tip Condition:
+           - Examine the precious metal tip carefully.
+           - Check if the tip appears blurred, damaged, or significantly different from the reference images.
+           - Look for any signs of wear, melting, or deformation at the tip.
+
+        Instructions:
+        1. Carefully compare the uploaded image to the reference images.
+        2. Flag only the specific issues mentioned above.
+        3. For each of the five criteria, state whether it appears normal or if there's an issue.
+        4. Describe any detected anomalies in detail.
+        5. For black marks, distinguish between unintentional marks and intentional marker marks if possible.
+        6. When examining the tip, comment on its clarity, shape, and any signs of wear or damage.
+        7. If a feature is unclear in the image, state so explicitly but do not flag it as an anomaly unless you're certain.
+        8. Provide a summary of all detected major anomalies.
+        9. Conclude with an overall assessment: 'PASS' if none of the specified issues are found, 'FAIL' if any of the five major issues are detected.
+
+        Remember: Only flag issues that clearly fall into one of the five categories mentioned. Do not report on any other types of anomalies or minor imperfections.
+
+        Now, analyze the uploaded spark plug image and report your findings:
+        """
+
+SIGNIFICANT_ANOMALY_DETECTION_PROMPT = """You are a quality control AI for NGK SILKFR8A6 Laser Iridium Spark Plugs. Your task is to analyze the uploaded image and detect significant anomalies by comparing it to the provided reference images. Focus on identifying major issues such as black marks, extreme scratches, or substantial deviations from the expected appearance. Use the following guidelines for your inspection:
+
+        1. Reference Standard:
+           - Use the provided reference images as the benchmark for how a proper spark plug should look.
+           - The reference images represent spark plugs without issues or anomalies.
+
+        2. Significant Anomaly Criteria:
+           a) Black Marks:
+              - Look for any noticeable black marks or discolorations that are not present in the reference images.
+           b) Extreme Scratches:
+              - Identify any deep or extensive scratches that significantly alter the surface appearance.
+           c) Major Deviations:
+              - Flag any substantial differences in shape, size, or overall appearance compared to the reference images.
+
+        3. Inspection Areas:
+           a) Thread Section:
+              - Check for significant damage or deformation of threads.
+           b) Hexagonal Nut:
+              - Look for major damage or distortion of the hexagonal shape.
+           c) Insulator:
+              - Identify any large cracks, chips, or major discoloration of the white ceramic.
+           d) Branding and Markings:
+              - Verify if "NGK" and the model number are clearly visible and not significantly damaged.
+           e) Electrodes:
+              - Check for obvious misalignment or major damage to the electrodes.
+           f) Precious Metal Tip:
+              - Verify the presence and general condition of the iridium tip.
+           g) Metal Shell:
+              - Look for extensive corrosion or major damage to the metal shell.
+
+        Instructions:
+        1. Carefully compare the uploaded image to the reference images.
+        2. Flag only significant anomalies that clearly deviate from the reference standard.
+        3. For each inspection area, state whether it appears normal or if there's a major anomaly.
+        4. Describe any detected significant anomalies in detail.
+        5. If a feature is unclear in the image, state so explicitly but do not flag it as an anomaly unless you're certain.
+        6. Provide a summary of all detected major anomalies.
+        7. Conclude with an overall assessment: 'PASS' if no significant anomalies are found, 'FAIL' if major issues are detected.
+
+        Remember: Focus on identifying clear and significant issues. Minor variations or imperfections that are within the range seen in reference images should not be flagged as anomalies.
+
+        Now, analyze the uploaded spark plug image and report your findings:
+        """
+
+STRICT_ANOMALY_DETECTION_PROMPT = """You are an extremely meticulous quality control AI for NGK SILKFR8A6 Laser Iridium Spark Plugs. Your task is to analyze the uploaded image with utmost scrutiny and detect ANY deviation from perfect condition, no matter how minor. Even the slightest imperfection should be flagged as an anomaly. Use the following guidelines for your inspection:
+
+        1. Perfection Standard:
+           - The spark plug must be in absolutely perfect condition.
+           - ANY scratch, mark, discoloration, or deviation from ideal specifications is an anomaly.
+
+        2. Comprehensive Inspection Areas:
+           a) Thread Section:
+              - Exactly 18-19 threads, perfectly clean and uniformly spaced.
+              - No signs of wear, damage, or cross-threading.
+           b) Hexagonal Nut:
+              - Perfect hexagonal shape with sharp, undamaged edges.
+              - No signs of tool marks or wear.
+           c) Insulator:
+              - Pristine white ceramic with no discoloration, chips, or cracks.
+              - Perfectly attached to the metal shell with no gaps or misalignment.
+           d) Branding and Markings:
+              - "NGK" must be clearly written in perfect light blue.
+              - Model number (SILKFR8A6) must be crisp and fully legible.
+              - All markings must be perfectly aligned and undamaged.
+           e) Electrodes:
+              - Center and ground electrodes must be in perfect alignment.
+              - No signs of wear, erosion, or discoloration.
+              - Gap must appear precise and uniform.
+           f) Precious Metal Tip:
+              - Iridium tip must be perfectly formed, fine, and pointed.
+              - No signs of wear or deformation.
+           g) Seal Ring:
+              - Must be present, perfectly seated, and undamaged.
+              - No signs of compression or deformation.
+           h) Metal Shell:
+              - Absolutely no corrosion, scratches, or marks.
+              - Plating or coating must be perfectly uniform.
+           i) Overall Dimensions and Proportions:
+              - Must appear exactly consistent with specifications.
+           j) Manufacturing Quality:
+              - No signs of poor assembly, misalignments, or residues.
+           k) Packaging (if visible):
+              - Must be pristine, undamaged, and properly sealed.
+
+        Instructions:
+        1. Analyze the uploaded image with extreme attention to detail.
+        2. Compare against the provided reference materials meticulously.
+        3. Flag ANY deviation from perfect condition as an anomaly, no matter how minor.
+        4. For each inspection area, clearly state whether it's perfect or if there's an anomaly.
+        5. Describe ALL detected anomalies in detail, no matter how small.
+        6. If you can't clearly see any feature, state so explicitly and consider it a potential anomaly.
+        7. Provide a summary of ALL detected anomalies, even if they seem insignificant.
+        8. Conclude with an overall assessment: 'PASS' only if absolutely perfect, otherwise 'FAIL'.
+
+        Remember: Your role is to ensure only absolutely perfect spark plugs pass inspection. Be extremely strict and flag even the slightest imperfections.
+
+        Now, analyze the uploaded spark plug image and report your findings:
+        """
+
+COMPACT_ANOMALY_DETECTION_PROMPT = """Analyze the uploaded spark plug image for these major issues:
+        1. Black Marks: Look for noticeable black marks or discolorations.
+        2. Missing Branding: Check if the "NGK" branding and model number are absent or unreadable.
+        3. Missing Parts: Verify all essential parts are present (hexagonal nut, insulator, metal shell, precious metal tip).
+        4. Nut Bending: Look for significant bending or distortion of the hexagonal nut.
+        5. Tip Condition: Examine the precious metal tip for blur, damage, wear, melting, or deformation.
+
+        For each criterion give a status of NORMAL, ISSUE or UNCLEAR, a confidence between 0 and 1,
+        and a one-sentence description of any anomaly found (empty if normal).
+        Use UNCLEAR only when the feature cannot be seen; do not treat it as an issue.
+        Give a short summary of all detected major anomalies.
+        Set overall_assessment to 'PASS' if no criterion is an ISSUE, otherwise 'FAIL', with your overall confidence.
+        """
+
+# Turns a free-text profile into a structured one so it can report per-criterion findings
+STRUCTURED_REPORT_INSTRUCTIONS = """Report your findings in the requested JSON format instead of free text.
+        Map them onto five criteria: black marks, missing branding, missing parts, nut bending and tip condition.
+        For each criterion give a status of NORMAL, ISSUE or UNCLEAR, a confidence between 0 and 1,
+        and a one-sentence description of any anomaly found (empty if normal).
+        Anomalies outside those five criteria go in the summary and still count toward the overall assessment.
+        Set overall_assessment by the rule above, with your overall confidence; it must be 'FAIL' if any criterion is an ISSUE.
+        """
+
+@dataclass(frozen=True)
+class PromptProfile:
+    name: str
+    instructions: str
+    generation_config: Dict[str, Any]
+    structured: bool = False
+
+    def parse(self, text: str) -> AnalysisResult:
+        if self.structured:
+            return parse_structured_verdict(text)
+        return AnalysisResult(analysis=text, overall_assessment=assessment_from_text(text))
+
+PROFILES: Dict[str, PromptProfile] = {}
+
+DEFAULT_PROFILE = "compact"
+
+def register_profile(profile: PromptProfile) -> PromptProfile:
+    PROFILES[profile.name] = profile
+    return profile
+
+def get_profile(name: str) -> PromptProfile:
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown prompt profile '{name}', expected one of: {', '.join(sorted(PROFILES))}")
+
+register_profile(PromptProfile(
+    name="refined",
+    instructions=REFINED_ANOMALY_DETECTION_PROMPT,
+    generation_config=TEXT_GENERATION_CONFIG,
+))
+register_profile(PromptProfile(
+    name="significant",
+    instructions=SIGNIFICANT_ANOMALY_DETECTION_PROMPT,
+    generation_config=TEXT_GENERATION_CONFIG,
+))
+register_profile(PromptProfile(
+    name="strict",
+    instructions=STRICT_ANOMALY_DETECTION_PROMPT,
+    generation_config=TEXT_GENERATION_CONFIG,
+))
+register_profile(PromptProfile(
+    name="compact",
+    instructions=COMPACT_ANOMALY_DETECTION_PROMPT,
+    generation_config=STRUCTURED_GENERATION_CONFIG,
+    structured=True,
+))
+
+# Structured variants of the free-text profiles, e.g. for ensembles that combine criteria
+for name in ("refined", "significant", "strict"):
+    register_profile(PromptProfile(
+        name=f"{name}_structured",
+        instructions=PROFILES[name].instructions + STRUCTURED_REPORT_INSTRUCTIONS,
+        generation_config=STRUCTURED_GENERATION_CONFIG,
+        structured=True,
+    ))
@@ -0,0 +1,204 @@
+import argparse
+import glob
+import json
+import os
+import time
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Union
+
+import numpy as np
+from PIL import Image
+
+from preprocessing import IMAGE_EXTENSIONS, preprocess_image
+from prescreen import thumbnail_embedding
+
+TOP_K = int(os.getenv("REFERENCE_TOP_K", "6"))
+INDEX_PATH = os.getenv("REFERENCE_INDEX_PATH", os.path.join("spark_plug_analysis_results", "reference_index.npz"))
+# Reference keys sent with every call regardless of the upload, e.g. "document"
+ALWAYS_INCLUDE = [name for name in os.getenv("REFERENCE_ALWAYS_INCLUDE", "").split(",") if name]
+
+def reference_descriptor(image: Image.Image) -> np.ndarray:
+    # Expects a preprocessed (plug-cropped) image so framing doesn't dominate pose and region
+    return thumbnail_embedding(image.convert("L"))
+
+class ReferenceIndex:
+    # Precomputed descriptors of the reference images, keyed like load_reference_materials()
+    def __init__(self, names: List[str], descriptors: np.ndarray):
+        if not names:
+            raise ValueError("Reference index needs at least one reference image")
+        self.names = list(names)
+        self.descriptors = descriptors.astype(np.float32)
+
+    @classmethod
+    def build(cls, references: Dict[str, bytes]) -> "ReferenceIndex":
+        names = sorted(references)
+        descriptors = [reference_descriptor(preprocess_image(references[name]).image) for name in names]
+        return cls(names, np.stack(descriptors) if descriptors else np.empty((0, 0)))
+
+    @classmethod
+    def load(cls, path: str) -> "ReferenceIndex":
+        with np.load(path) as data:
+            return cls([str(name) for name in data["names"]], data["descriptors"])
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # float16 keeps the index a few tens of KB; ranking is unaffected at this precision
+        with open(path, "wb") as f:
+            np.savez_compressed(f, names=np.array(self.names), descriptors=self.descriptors.astype(np.float16))
+
+    def rank(self, upload: Union[bytes, Image.Image]) -> List[str]:
+        # Decoded images are assumed to come from preprocess_image already
+        image = upload if isinstance(upload, Image.Image) else preprocess_image(upload).image
+        similarities = self.descriptors @ reference_descriptor(image)
+        return [self.names[i] for i in np.argsort(-similarities)]
+
+    def select(self, upload: Union[bytes, Image.Image], k: int) -> List[str]:
+        return self.rank(upload)[:k]
+
+def select_references(
+    reference_materials: Mapping[str, Any],
+    index: Optional[ReferenceIndex],
+    upload: Union[bytes, Image.Image, None],
+    k: int = TOP_K,
+    always_include: List[str] = ALWAYS_INCLUDE,
+) -> Mapping[str, Any]:
+    if index is None or k <= 0 or upload is None or (isinstance(upload, bytes) and not upload):
+        return reference_materials
+    try:
+        names = [name for name in index.select(upload, len(index.names)) if name in reference_materials][:k]
+    except Exception:
+        # An upload the index can't decode still gets the full reference set
+        return reference_materials
+    if not names:
+        return reference_materials
+    names = [name for name in always_include if name in reference_materials and name not in names] + names
+    return MappingProxyType({name: reference_materials[name] for name in names})
+
+def index_from_env() -> Optional[ReferenceIndex]:
+    if not INDEX_PATH or not os.path.exists(INDEX_PATH):
+        return None
+    return ReferenceIndex.load(INDEX_PATH)
+
+def fetch_reference_images(reference_materials: Mapping[str, Any], mirror_dir: Optional[str] = None) -> Dict[str, bytes]:
+    # Remote reference parts only carry gs:// URIs; read them from a local mirror when given, else from GCS
+    references = {}
+    client = None
+    for name, part in reference_materials.items():
+        if not part.mime_type.startswith("image/"):
+            continue
+        if part.inline_data.data:
+            references[name] = part.inline_data.data
+            continue
+        uri = part.file_data.file_uri
+        if mirror_dir:
+            path = os.path.join(mirror_dir, os.path.basename(uri))
+            if not os.path.exists(path):
+                continue
+            with open(path, "rb") as f:
+                references[name] = f.read()
+            continue
+        if client is None:
+            from google.cloud import storage
+
+            client = storage.Client()
+        bucket_name, _, blob_name = uri[len("gs://"):].partition("/")
+        references[name] = client.bucket(bucket_name).blob(blob_name).download_as_bytes()
+    return references
+
+def labeled_images(labeled_dir: str) -> List[Dict[str, str]]:
+    # Expected layout: <labeled_dir>/PASS/*.jpg and <labeled_dir>/FAIL/*.jpg
+    images = []
+    for label in ("PASS", "FAIL"):
+        for path in sorted(glob.glob(os.path.join(labeled_dir, label, "*"))):
+            if path.lower().endswith(IMAGE_EXTENSIONS):
+                images.append({"path": path, "label": label})
+    return images
+
+def evaluate(labeled_dir: str, profile_name: str, k: int) -> Dict[str, Any]:
+    from vertexai.generative_models import Part
+
+    from engine import InspectionEngine
+    from profiles import get_profile
+
+    profile = get_profile(profile_name)
+    engine = InspectionEngine()
+    engine.warm_up()
+    if engine.reference_index is None:
+        raise ValueError(f"No reference index at {INDEX_PATH}; build one first")
+
+    rows = []
+    for item in labeled_images(labeled_dir):
+        with open(item["path"], "rb") as f:
+            upload = preprocess_image(f.read())
+        uploaded_image = Part.from_data(data=upload.data, mime_type=upload.mime_type)
+        subset = engine.references_for(upload.image, k=k)
+
+        started = time.perf_counter()
+        full = engine.inspect(profile, uploaded_image, references=engine.reference_materials)
+        full_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        partial = engine.inspect(profile, uploaded_image, references=subset)
+        subset_seconds = time.perf_counter() - started
+
+        rows.append({
+            "path": item["path"],
+            "label": item["label"],
+            "full": full.overall_assessment,
+            "subset": partial.overall_assessment,
+            "references": list(subset),
+            "full_seconds": full_seconds,
+            "subset_seconds": subset_seconds,
+        })
+
+    def accuracy(column: str) -> Optional[float]:
+        return sum(row[column] == row["label"] for row in rows) / len(rows) if rows else None
+
+    def mean(column: str) -> Optional[float]:
+        return sum(row[column] for row in rows) / len(rows) if rows else None
+
+    return {
+        "profile": profile_name,
+        "k": k,
+        "images": len(rows),
+        "full_references": len(engine.reference_materials),
+        "accuracy_full": accuracy("full"),
+        "accuracy_subset": accuracy("subset"),
+        "verdict_agreement": sum(row["full"] == row["subset"] for row in rows) / len(rows) if rows else None,
+        # Missed defects matter more than false alarms on a QC line
+        "missed_fails_full": sum(row["label"] == "FAIL" and row["full"] == "PASS" for row in rows),
+        "missed_fails_subset": sum(row["label"] == "FAIL" and row["subset"] == "PASS" for row in rows),
+        "avg_seconds_full": mean("full_seconds"),
+        "avg_seconds_subset": mean("subset_seconds"),
+        "rows": rows,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or evaluate the reference subset index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Compute descriptors for the reference images")
+    build_parser.add_argument("--mirror-dir", help="Local copy of the reference JPEGs; defaults to reading from GCS")
+    build_parser.add_argument("--sku", help="Catalog SKU to index; defaults to the catalog's default SKU")
+    build_parser.add_argument("--output", help="Defaults to the SKU's index path in the catalog")
+
+    evaluate_parser = subparsers.add_parser("evaluate", help="Compare full and subset references on a labeled set")
+    evaluate_parser.add_argument("labeled_dir", help="Directory with PASS/ and FAIL/ subdirectories of images")
+    evaluate_parser.add_argument("--profile", default="compact")
+    evaluate_parser.add_argument("-k", type=int, default=TOP_K)
+    evaluate_parser.add_argument("--output", default=os.path.join("spark_plug_analysis_results", "reference_subset_evaluation.json"))
+    args = parser.parse_args()
+
+    if args.command == "build":
+        from catalog import load_manifest, sku_references
+
+        spec = load_manifest().spec(args.sku)
+        output = args.output or spec.index_path
+        index = ReferenceIndex.build(fetch_reference_images(sku_references(spec), args.mirror_dir))
+        index.save(output)
+        print(f"Indexed {len(index.names)} {spec.sku} reference images. Index saved in {output}")
+    else:
+        report = evaluate(args.labeled_dir, args.profile, args.k)
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Reference subset evaluation complete. Report saved in {args.output}")
@@ -0,0 +1,292 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from google.api_core import exceptions as google_exceptions
+
+from metrics import percentile, record_usage
+
+MAX_ATTEMPTS = int(os.getenv("MODEL_MAX_ATTEMPTS", "4"))
+BACKOFF_BASE_SECONDS = float(os.getenv("MODEL_BACKOFF_BASE_SECONDS", "0.5"))
+BACKOFF_MAX_SECONDS = float(os.getenv("MODEL_BACKOFF_MAX_SECONDS", "8"))
+
+HEDGE_ENABLED = os.getenv("MODEL_HEDGE_ENABLED", "0").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = float(os.getenv("MODEL_HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("MODEL_HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MIN_DELAY_SECONDS = float(os.getenv("MODEL_HEDGE_MIN_DELAY_SECONDS", "0.5"))
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("MODEL_BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("MODEL_BREAKER_RESET_SECONDS", "30"))
+
+# Ordered "region/model" fallbacks tried after the primary endpoint, e.g. "us-east4/gemini-1.5-flash-001"
+FAILOVER = [entry.strip() for entry in os.getenv("MODEL_FAILOVER", "").split(",") if entry.strip()]
+
+RETRYABLE_ERRORS = (
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.BadGateway,
+    google_exceptions.GatewayTimeout,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.Aborted,
+    ConnectionError,
+    TimeoutError,
+)
+
+def is_retryable(error: BaseException) -> bool:
+    # Quota and transient server errors are worth another try; bad requests and auth errors are not
+    return isinstance(error, RETRYABLE_ERRORS)
+
+def backoff_delay(attempt: int, base: float = BACKOFF_BASE_SECONDS, maximum: float = BACKOFF_MAX_SECONDS) -> float:
+    # Full jitter keeps a fleet of retrying workers from hammering the endpoint in lockstep
+    return random.uniform(0, min(maximum, base * 2 ** attempt))
+
+class CircuitOpenError(RuntimeError):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Model backend unavailable, circuit open for another {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            return "half_open" if time.monotonic() - self.opened_at >= self.reset_seconds else "open"
+
+    def retry_after(self) -> float:
+        with self._lock:
+            if self.opened_at is None:
+                return 0.0
+            return max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_seconds or self._probing:
+                return False
+            # Half-open: let a single probe through to see whether the backend recovered
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def release(self):
+        # A cancelled probe proves nothing either way; let the next call probe instead
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+class LatencyWindow:
+    def __init__(self, size: int = 200):
+        self._samples: deque = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            samples = list(self._samples)
+        return percentile(samples, pct)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+class Target:
+    def __init__(self, name: str, model: Any, breaker: CircuitBreaker):
+        self.name = name
+        self.model = model
+        self.breaker = breaker
+
+class ResilientModel:
+    # Wraps one or more GenerativeModel-like targets (primary first) with classified
+    # retries, per-target circuit breakers, failover and optional hedged requests.
+    def __init__(
+        self,
+        targets: Sequence[Tuple[str, Any]],
+        max_attempts: int = MAX_ATTEMPTS,
+        hedge: bool = HEDGE_ENABLED,
+        hedge_percentile: float = HEDGE_PERCENTILE,
+        hedge_min_samples: int = HEDGE_MIN_SAMPLES,
+        hedge_min_delay: float = HEDGE_MIN_DELAY_SECONDS,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        reset_seconds: float = BREAKER_RESET_SECONDS,
+    ):
+        if not targets:
+            raise ValueError("ResilientModel needs at least one target")
+        self.targets = [Target(name, model, CircuitBreaker(failure_threshold, reset_seconds)) for name, model in targets]
+        self.max_attempts = max(1, max_attempts)
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+        self.latencies = LatencyWindow()
+        self.counters = {"calls": 0, "retries": 0, "failovers": 0, "hedges": 0, "hedge_wins": 0, "circuit_rejections": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _pick(self, attempt: int, exclude: Optional[Target] = None, fallback: Optional[Target] = None) -> Target:
+        # Each retry starts one step further down the failover list
+        offset = attempt % len(self.targets)
+        for target in self.targets[offset:] + self.targets[:offset]:
+            if target is not exclude and target.breaker.allow():
+                if target is not self.targets[0]:
+                    self._count("failovers")
+                return target
+        if fallback is not None:
+            # Nothing else to use, which is not a rejection: the caller already holds a target
+            return fallback
+        self._count("circuit_rejections")
+        raise CircuitOpenError(min(target.breaker.retry_after() for target in self.targets))
+
+    def _record(self, target: Target, started: float, error: Optional[BaseException] = None):
+        if error is None:
+            target.breaker.record_success()
+            self.latencies.add(time.perf_counter() - started)
+        elif is_retryable(error):
+            target.breaker.record_failure()
+        else:
+            # The request was bad, not the backend
+            target.breaker.record_success()
+
+    def hedge_delay(self) -> Optional[float]:
+        if not self.hedge or len(self.latencies) < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay, self.latencies.percentile(self.hedge_percentile) or 0.0)
+
+    def generate_content(self, contents: Any, generation_config: Optional[Dict[str, Any]] = None, stream: bool = False, **kwargs):
+        self._count("calls")
+        for attempt in range(self.max_attempts):
+            target = self._pick(attempt)
+            started = time.perf_counter()
+            try:
+                response = target.model.generate_content(contents, generation_config=generation_config, stream=stream, **kwargs)
+            except Exception as e:
+                self._record(target, started, e)
+                if not is_retryable(e) or attempt == self.max_attempts - 1:
+                    raise
+                self._count("retries")
+                time.sleep(backoff_delay(attempt))
+                continue
+            self._record(target, started)
+            if not stream:
+                record_usage(response)
+            return response
+
+    async def _call_async(self, target: Target, contents: Any, generation_config: Optional[Dict[str, Any]], stream: bool, kwargs: Dict[str, Any]):
+        started = time.perf_counter()
+        try:
+            response = await target.model.generate_content_async(contents, generation_config=generation_config, stream=stream, **kwargs)
+        except asyncio.CancelledError:
+            target.breaker.release()
+            raise
+        except Exception as e:
+            self._record(target, started, e)
+            raise
+        self._record(target, started)
+        if not stream:
+            # Streamed usage arrives on the last chunk; the consumer records it
+            record_usage(response)
+        return response
+
+    async def _hedged_async(self, attempt: int, target: Target, contents: Any, generation_config: Optional[Dict[str, Any]], kwargs: Dict[str, Any]):
+        delay = self.hedge_delay()
+        if delay is None:
+            return await self._call_async(target, contents, generation_config, False, kwargs)
+
+        started = time.perf_counter()
+        primary = asyncio.ensure_future(self._call_async(target, contents, generation_config, False, kwargs))
+        pending = {primary}
+        error: Optional[BaseException] = None
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return primary.result()
+
+            # The primary is slower than the recent p95: race a duplicate, preferably on another target
+            hedge_target = self._pick(attempt + 1, exclude=target, fallback=target)
+            self._count("hedges")
+            hedged = asyncio.ensure_future(self._call_async(hedge_target, contents, generation_config, False, kwargs))
+            pending.add(hedged)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedged:
+                            self._count("hedge_wins")
+                            if not primary.done():
+                                # The cancelled primary never reports its latency; its elapsed time is a
+                                # lower bound, and leaving it out would drag the p95 and the hedge delay down
+                                self.latencies.add(time.perf_counter() - started)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def generate_content_async(self, contents: Any, generation_config: Optional[Dict[str, Any]] = None, stream: bool = False, **kwargs):
+        self._count("calls")
+        for attempt in range(self.max_attempts):
+            target = self._pick(attempt)
+            try:
+                # Streams are consumed by the caller as they arrive, so only unary calls are hedged
+                if stream:
+                    return await self._call_async(target, contents, generation_config, True, kwargs)
+                return await self._hedged_async(attempt, target, contents, generation_config, kwargs)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.max_attempts - 1:
+                    raise
+                self._count("retries")
+                await asyncio.sleep(backoff_delay(attempt))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+        p95 = self.latencies.percentile(95)
+        return {
+            **counters,
+            "latency_p95_seconds": p95,
+            "hedge_delay_seconds": self.hedge_delay(),
+            "targets": {target.name: target.breaker.state for target in self.targets},
+        }
+
+def failover_targets(location: str, model_name: str, failover: List[str] = FAILOVER) -> List[Tuple[str, str]]:
+    targets = [(location, model_name)]
+    for entry in failover:
+        region, _, name = entry.partition("/")
+        target = (region or location, name or model_name)
+        if target not in targets:
+            targets.append(target)
+    return targets
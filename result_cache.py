@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+DEFAULT_DISK_PATH = os.path.join("spark_plug_analysis_results", "result_cache.sqlite3")
+
+# Expired rows are swept from the disk tier at most this often, from set()
+PRUNE_INTERVAL_SECONDS = 600.0
+
+def cache_key(image_digest: str, prompt_template: str, model_name: str, generation_config: Dict[str, Any]) -> str:
+    h = hashlib.sha256()
+    h.update(image_digest.encode())
+    h.update(b"\0")
+    h.update(hashlib.sha256(prompt_template.encode()).digest())
+    h.update(b"\0")
+    h.update(model_name.encode())
+    h.update(b"\0")
+    h.update(json.dumps(generation_config, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+def bytes_digest(data: bytes) -> str:
+    return "sha256:" + hashlib.sha256(data).hexdigest()
+
+def uri_digest(uri: str) -> str:
+    # Use the object's stored checksum so a re-uploaded file under the same name is a new key
+    if uri.startswith("gs://"):
+        from google.cloud import storage
+
+        bucket_name, _, blob_name = uri[len("gs://"):].partition("/")
+        blob = storage.Client().bucket(bucket_name).get_blob(blob_name)
+        if blob is None:
+            raise FileNotFoundError(uri)
+        return "md5:" + blob.md5_hash
+    with open(uri, "rb") as f:
+        return bytes_digest(f.read())
+
+class ResultCache:
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 24 * 3600, disk_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._next_prune = 0.0
+        if disk_path:
+            os.makedirs(os.path.dirname(disk_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_stored_at ON results (stored_at)")
+            self._db.commit()
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl_seconds > 0 and time.time() - stored_at > self.ttl_seconds
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._expired(entry[0]):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute("SELECT value, stored_at FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None and not self._expired(row[1]):
+                    self._remember(key, row[0], row[1])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0]
+                if row is not None:
+                    self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                    self._db.commit()
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: str):
+        stored_at = time.time()
+        with self._lock:
+            self._remember(key, value, stored_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results (key, value, stored_at) VALUES (?, ?, ?)",
+                    (key, value, stored_at),
+                )
+                # Entries that are never read again would otherwise stay on disk forever
+                if self.ttl_seconds > 0 and stored_at >= self._next_prune:
+                    self._next_prune = stored_at + min(PRUNE_INTERVAL_SECONDS, self.ttl_seconds)
+                    self._db.execute("DELETE FROM results WHERE stored_at < ?", (stored_at - self.ttl_seconds,))
+                self._db.commit()
+
+    def _remember(self, key: str, value: str, stored_at: float):
+        self._entries[key] = (stored_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+def cache_from_env() -> ResultCache:
+    disk_path = os.getenv("RESULT_CACHE_DB", DEFAULT_DISK_PATH)
+    return ResultCache(
+        max_entries=int(os.getenv("RESULT_CACHE_SIZE", "1024")),
+        ttl_seconds=float(os.getenv("RESULT_CACHE_TTL_SECONDS", str(24 * 3600))),
+        disk_path=disk_path or None,
+    )
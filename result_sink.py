@@ -0,0 +1,258 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+DEFAULT_JSONL_PATH = os.path.join("spark_plug_analysis_results", "verdicts.jsonl")
+DEFAULT_SQLITE_PATH = os.path.join("spark_plug_analysis_results", "verdicts.sqlite3")
+DEFAULT_PARQUET_DIR = os.path.join("spark_plug_analysis_results", "verdicts")
+
+# Every field any writer puts in a verdict record, so all Parquet files share one schema whatever
+# kind of record comes first; nested values are JSON text and unknown keys go into "extra"
+PARQUET_COLUMNS = (
+    ("ts", "float64"),
+    ("image", "string"),
+    ("sku", "string"),
+    ("profile", "string"),
+    ("prompt", "string"),
+    ("verdict", "string"),
+    ("confidence", "float64"),
+    ("criteria", "string"),
+    ("analysis", "string"),
+    ("source", "string"),
+    ("latency_ms", "float64"),
+    ("lag_ms", "float64"),
+    ("votes", "string"),
+    ("split", "bool_"),
+    ("short_circuited", "bool_"),
+    ("disagreement", "string"),
+    ("error", "string"),
+    ("extra", "string"),
+)
+
+class JsonlBackend:
+    # One long-lived append handle; rotates like logging's RotatingFileHandler
+    def __init__(self, path: str = DEFAULT_JSONL_PATH, max_bytes: int = 64 * 1024 * 1024, backups: int = 5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "a")
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, "a")
+
+    def write(self, records: List[Dict[str, Any]]):
+        self._file.write("".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records))
+        if self.max_bytes and self._file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+class SqliteBackend:
+    def __init__(self, path: str = DEFAULT_SQLITE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Only the sink's writer thread touches the connection after construction
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS verdicts (
+                ts REAL NOT NULL,
+                image TEXT,
+                profile TEXT,
+                verdict TEXT,
+                source TEXT,
+                prompt TEXT,
+                latency_ms REAL,
+                record TEXT NOT NULL
+            )"""
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS verdicts_ts ON verdicts (ts)")
+        self._db.commit()
+
+    def write(self, records: List[Dict[str, Any]]):
+        self._db.executemany(
+            "INSERT INTO verdicts (ts, image, profile, verdict, source, prompt, latency_ms, record) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    record.get("ts", time.time()), record.get("image"), record.get("profile"), record.get("verdict"),
+                    record.get("source"), record.get("prompt"), record.get("latency_ms"),
+                    json.dumps(record, separators=(",", ":")),
+                )
+                for record in records
+            ],
+        )
+        self._db.commit()
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self._db.close()
+
+class ParquetBackend:
+    # Parquet files can't be appended to, so rows are buffered into one file per rows_per_file
+    def __init__(self, directory: str = DEFAULT_PARQUET_DIR, rows_per_file: int = 10000):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise RuntimeError("The parquet result sink requires pyarrow (pip install pyarrow)")
+        self.directory = directory
+        self.rows_per_file = rows_per_file
+        self._rows: List[Dict[str, Any]] = []
+        self._files = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def normalize(record: Dict[str, Any]) -> Dict[str, Any]:
+        row: Dict[str, Any] = {name: None for name, _ in PARQUET_COLUMNS}
+        extra = {}
+        for key, value in record.items():
+            if key not in row or key == "extra":
+                extra[key] = value
+            elif isinstance(value, (dict, list)):
+                row[key] = json.dumps(value, separators=(",", ":"))
+            else:
+                row[key] = value
+        row["extra"] = json.dumps(extra, separators=(",", ":")) if extra else None
+        return row
+
+    def _write_file(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        rows, self._rows = self._rows, []
+        schema = pa.schema([(name, getattr(pa, kind)()) for name, kind in PARQUET_COLUMNS])
+        table = pa.Table.from_pylist([self.normalize(row) for row in rows], schema=schema)
+        self._files += 1
+        pq.write_table(table, os.path.join(self.directory, f"verdicts-{int(time.time())}-{os.getpid()}-{self._files:05d}.parquet"))
+
+    def write(self, records: List[Dict[str, Any]]):
+        self._rows.extend(records)
+        if len(self._rows) >= self.rows_per_file:
+            self._write_file()
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self._rows:
+            self._write_file()
+
+class ResultSink:
+    # Callers hand records to a bounded queue and return immediately; one background
+    # thread batches them into the backend. When the queue is full, records are
+    # dropped and counted rather than blocking inspections or growing memory.
+    def __init__(self, backend: Any, max_pending: int = 10000, batch_size: int = 256, flush_seconds: float = 1.0):
+        self.backend = backend
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="result-sink", daemon=True)
+        self._thread.start()
+
+    def write(self, record: Dict[str, Any]) -> bool:
+        if self._closed:
+            return False
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            with self._stats_lock:
+                self.dropped += 1
+            return False
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                first = self._queue.get(timeout=self.flush_seconds)
+            except queue.Empty:
+                continue
+            batch: List[Optional[Dict[str, Any]]] = [first]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            # None is the shutdown sentinel queued by close()
+            stopping = any(record is None for record in batch)
+            records = [record for record in batch if record is not None]
+            try:
+                if records:
+                    self.backend.write(records)
+                if stopping or self._queue.empty():
+                    self.backend.flush()
+                with self._stats_lock:
+                    self.written += len(records)
+            except Exception as e:
+                with self._stats_lock:
+                    self.errors += len(records)
+                print(f"Result sink write failed: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self):
+        # Blocks until everything queued so far has reached the backend
+        self._queue.join()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        self.backend.close()
+
+    def stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            return {
+                "written": self.written,
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "pending": self._queue.qsize(),
+            }
+
+def sink_from_env() -> ResultSink:
+    kind = os.getenv("RESULT_SINK", "jsonl").lower()
+    path = os.getenv("RESULT_SINK_PATH")
+    if kind == "jsonl":
+        backend: Any = JsonlBackend(
+            path or DEFAULT_JSONL_PATH,
+            max_bytes=int(os.getenv("RESULT_SINK_MAX_BYTES", str(64 * 1024 * 1024))),
+            backups=int(os.getenv("RESULT_SINK_BACKUPS", "5")),
+        )
+    elif kind == "sqlite":
+        backend = SqliteBackend(path or DEFAULT_SQLITE_PATH)
+    elif kind == "parquet":
+        backend = ParquetBackend(path or DEFAULT_PARQUET_DIR, rows_per_file=int(os.getenv("RESULT_SINK_ROWS_PER_FILE", "10000")))
+    else:
+        raise ValueError(f"Unknown RESULT_SINK '{kind}', expected jsonl, sqlite or parquet")
+    return ResultSink(
+        backend,
+        max_pending=int(os.getenv("RESULT_SINK_MAX_PENDING", "10000")),
+        batch_size=int(os.getenv("RESULT_SINK_BATCH_SIZE", "256")),
+        flush_seconds=float(os.getenv("RESULT_SINK_FLUSH_SECONDS", "1")),
+    )
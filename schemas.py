@@ -0,0 +1,134 @@
+import json
+import re
+from typing import Literal, Optional
+
+from pydantic import BaseModel, Field
+
+CRITERIA = {
+    "black_marks": "Black Marks",
+    "branding": "Branding",
+    "missing_parts": "Missing Parts",
+    "nut_bending": "Nut Bending",
+    "tip_condition": "Tip Condition",
+}
+
+CRITERION_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "status": {"type": "STRING", "enum": ["NORMAL", "ISSUE", "UNCLEAR"]},
+        "confidence": {"type": "NUMBER"},
+        "details": {"type": "STRING"},
+    },
+    "required": ["status", "confidence", "details"],
+}
+
+VERDICT_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "criteria": {
+            "type": "OBJECT",
+            "properties": {name: CRITERION_RESPONSE_SCHEMA for name in CRITERIA},
+            "required": list(CRITERIA),
+        },
+        "summary": {"type": "STRING"},
+        "overall_assessment": {"type": "STRING", "enum": ["PASS", "FAIL"]},
+        "confidence": {"type": "NUMBER"},
+    },
+    "required": ["criteria", "summary", "overall_assessment", "confidence"],
+}
+
+class CriterionFinding(BaseModel):
+    status: Literal["NORMAL", "ISSUE", "UNCLEAR"]
+    confidence: float = Field(ge=0.0, le=1.0)
+    details: str = ""
+
+class CriteriaFindings(BaseModel):
+    black_marks: CriterionFinding
+    branding: CriterionFinding
+    missing_parts: CriterionFinding
+    nut_bending: CriterionFinding
+    tip_condition: CriterionFinding
+
+class AnalysisResult(BaseModel):
+    analysis: str
+    overall_assessment: str
+    criteria: Optional[CriteriaFindings] = None
+    confidence: Optional[float] = None
+
+class StructuredVerdict(BaseModel):
+    criteria: CriteriaFindings
+    summary: str
+    overall_assessment: Literal["PASS", "FAIL"]
+    confidence: float = Field(ge=0.0, le=1.0)
+
+def render_analysis(verdict: StructuredVerdict) -> str:
+    lines = []
+    for name, title in CRITERIA.items():
+        finding: CriterionFinding = getattr(verdict.criteria, name)
+        lines.append(f"- **{title}**: {finding.status} ({finding.confidence:.0%}) {finding.details}".rstrip())
+    lines.append("")
+    lines.append(verdict.summary)
+    lines.append("")
+    lines.append(f"**Overall assessment: {verdict.overall_assessment}**")
+    return "\n".join(lines)
+
+def parse_structured_verdict(text: str) -> AnalysisResult:
+    verdict = StructuredVerdict.model_validate(json.loads(text))
+    # A flagged criterion always fails the plug, whatever the model concluded
+    flagged = any(getattr(verdict.criteria, name).status == "ISSUE" for name in CRITERIA)
+    overall_assessment = "FAIL" if flagged else verdict.overall_assessment
+    return AnalysisResult(
+        analysis=render_analysis(verdict),
+        overall_assessment=overall_assessment,
+        criteria=verdict.criteria,
+        confidence=verdict.confidence,
+    )
+
+ASSESSMENT_PATTERN = re.compile(r"overall\s+assessment\W*(?:is\W*)?(PASS|FAIL)\b", re.IGNORECASE)
+
+# A line that is only the verdict, e.g. "**PASS**" or "FAIL."
+VERDICT_LINE_PATTERN = re.compile(r"^[\s*_#>:.\-]*(PASS|FAIL)[\s*_:.!]*$", re.IGNORECASE | re.MULTILINE)
+VERDICT_TOKEN_PATTERN = re.compile(r"\b(PASS|FAIL)\b")
+
+def assessment_from_text(text: str) -> str:
+    # Free-text reports: prefer the concluding "Overall assessment" line, then a verdict on a line of
+    # its own, then the last upper-case PASS/FAIL; only a report with none of them defaults to FAIL
+    for pattern in (ASSESSMENT_PATTERN, VERDICT_LINE_PATTERN, VERDICT_TOKEN_PATTERN):
+        matches = pattern.findall(text)
+        if matches:
+            return matches[-1].upper()
+    return "FAIL"
+
+CRITERION_PATTERN = re.compile(r'"(' + "|".join(CRITERIA) + r')"\s*:\s*(\{[^{}]*\})')
+VERDICT_PATTERN = re.compile(r'"overall_assessment"\s*:\s*"(PASS|FAIL)"')
+
+class VerdictStreamParser:
+    # Picks completed criteria and the verdict out of a partially streamed JSON verdict
+    def __init__(self):
+        self.buffer = ""
+        self.findings: dict = {}
+        self.verdict: Optional[str] = None
+
+    def feed(self, text: str) -> list:
+        self.buffer += text
+        events = []
+        for match in CRITERION_PATTERN.finditer(self.buffer):
+            name = match.group(1)
+            if name in self.findings:
+                continue
+            try:
+                finding = CriterionFinding.model_validate(json.loads(match.group(2)))
+            except ValueError:
+                continue
+            self.findings[name] = finding
+            events.append(("criterion", {"name": name, **finding.model_dump()}))
+            # Any flagged criterion decides the plug before the model writes its conclusion
+            if finding.status == "ISSUE" and self.verdict is None:
+                self.verdict = "FAIL"
+                events.append(("verdict", {"overall_assessment": "FAIL", "decided_by": name}))
+        if self.verdict is None:
+            match = VERDICT_PATTERN.search(self.buffer)
+            if match:
+                self.verdict = match.group(1)
+                events.append(("verdict", {"overall_assessment": self.verdict, "decided_by": "overall_assessment"}))
+        return events
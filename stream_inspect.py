@@ -0,0 +1,420 @@
+import argparse
+import glob
+import json
+import os
+import queue
+import threading
+import time
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+from vertexai.generative_models import Part
+
+from engine import InspectionEngine
+from metrics import REGISTRY, VERDICTS, counter, histogram, stage
+from preprocessing import IMAGE_EXTENSIONS, preprocess_image
+from prescreen import difference_hash, load_image
+from profiles import DEFAULT_PROFILE, PROFILES, PromptProfile, get_profile
+from result_sink import sink_from_env
+from schemas import AnalysisResult
+
+SAMPLE_FPS = float(os.getenv("STREAM_SAMPLE_FPS", "5"))
+# Frame rate assumed for MJPEG files and frame directories, which carry no timestamps
+SOURCE_FPS = float(os.getenv("STREAM_SOURCE_FPS", "30"))
+# Share of differing hash bits between consecutive samples that means a different plug is in view
+NEW_PLUG_DISTANCE = float(os.getenv("STREAM_NEW_PLUG_DISTANCE", "0.25"))
+# Consecutive samples closer than this are near-identical: the plug has stopped moving
+STILL_DISTANCE = float(os.getenv("STREAM_STILL_DISTANCE", "0.08"))
+SETTLE_FRAMES = int(os.getenv("STREAM_SETTLE_FRAMES", "2"))
+FRAME_BUFFER = int(os.getenv("STREAM_FRAME_BUFFER", "8"))
+
+STREAM_FRAMES = counter("spark_plug_stream_frames_total", "Camera frames by outcome", ["outcome"])
+STREAM_PLUGS = counter("spark_plug_stream_plugs_total", "Plugs detected in the camera stream")
+STREAM_LAG = histogram(
+    "spark_plug_stream_lag_seconds", "Delay from frame capture to tracking and to the verdict", ["point"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+
+@dataclass
+class Frame:
+    index: int
+    timestamp: float
+    captured_at: float
+    data: bytes
+
+class FrameSampler:
+    def __init__(self, sample_fps: float = SAMPLE_FPS):
+        self.interval = 1.0 / sample_fps if sample_fps > 0 else 0.0
+        self._next = float("-inf")
+
+    def keep(self, timestamp: float) -> bool:
+        if timestamp < self._next:
+            STREAM_FRAMES.inc(outcome="skipped")
+            return False
+        self._next = timestamp + self.interval
+        return True
+
+def mjpeg_frames(source: str, keep: Callable[[float], bool], source_fps: float = SOURCE_FPS) -> Iterator[Frame]:
+    # Concatenated JPEGs, as in .mjpeg files and multipart/x-mixed-replace camera feeds
+    live = source.startswith(("http://", "https://"))
+    stream = urllib.request.urlopen(source, timeout=30) if live else open(source, "rb")
+    started = time.monotonic()
+    buffer = b""
+    index = 0
+    with stream:
+        while True:
+            chunk = stream.read(64 * 1024)
+            if not chunk:
+                break
+            buffer += chunk
+            while True:
+                start = buffer.find(b"\xff\xd8")
+                end = buffer.find(b"\xff\xd9", start + 2) if start >= 0 else -1
+                if end < 0:
+                    # Drop bytes before the next frame start, e.g. multipart headers
+                    buffer = buffer[start:] if start >= 0 else b""
+                    break
+                data, buffer = buffer[start:end + 2], buffer[end + 2:]
+                timestamp = time.monotonic() - started if live else index / source_fps
+                if keep(timestamp):
+                    yield Frame(index, timestamp, time.monotonic(), data)
+                index += 1
+
+def directory_frames(source: str, keep: Callable[[float], bool], source_fps: float = SOURCE_FPS) -> Iterator[Frame]:
+    paths = sorted(path for path in glob.glob(os.path.join(source, "*")) if path.lower().endswith(IMAGE_EXTENSIONS))
+    for index, path in enumerate(paths):
+        timestamp = index / source_fps
+        if keep(timestamp):
+            with open(path, "rb") as f:
+                yield Frame(index, timestamp, time.monotonic(), f.read())
+
+def video_frames(source: str, keep: Callable[[float], bool], source_fps: float = SOURCE_FPS) -> Iterator[Frame]:
+    try:
+        import cv2
+    except ImportError:
+        raise RuntimeError("Reading video files and RTSP streams requires opencv-python (pip install opencv-python)")
+
+    capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        raise RuntimeError(f"Could not open video source {source}")
+    live = "://" in source
+    fps = capture.get(cv2.CAP_PROP_FPS) or source_fps
+    started = time.monotonic()
+    index = 0
+    try:
+        # grab() is cheap; only sampled frames are decoded and re-encoded
+        while capture.grab():
+            timestamp = time.monotonic() - started if live else index / fps
+            if keep(timestamp):
+                ok, pixels = capture.retrieve()
+                if ok:
+                    ok, encoded = cv2.imencode(".jpg", pixels)
+                    if ok:
+                        yield Frame(index, timestamp, time.monotonic(), encoded.tobytes())
+            index += 1
+    finally:
+        capture.release()
+
+def open_source(source: str, keep: Callable[[float], bool], source_fps: float = SOURCE_FPS) -> Iterator[Frame]:
+    if os.path.isdir(source):
+        return directory_frames(source, keep, source_fps)
+    if source.lower().endswith((".mjpeg", ".mjpg")) or source.startswith(("http://", "https://")):
+        return mjpeg_frames(source, keep, source_fps)
+    return video_frames(source, keep, source_fps)
+
+def paced(frames: Iterator[Frame]) -> Iterator[Frame]:
+    # Replay a recording at its own frame rate so it behaves like a live camera
+    started = time.monotonic()
+    for frame in frames:
+        delay = started + frame.timestamp - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        frame.captured_at = time.monotonic()
+        yield frame
+
+def hash_distance(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.count_nonzero(a != b)) / a.size
+
+def foreground_box(image: Image.Image, size: int = 96, threshold: int = 30, min_area: float = 0.02) -> Tuple[Optional[Tuple[int, int, int, int]], bool]:
+    # Like preprocessing.plug_bounding_box, but box-downsampled first so sensor noise and
+    # specks can't stretch the box between otherwise identical frames. Also reports whether
+    # the blob touches the frame edge, i.e. a plug still entering or already leaving.
+    small = image.resize((size, max(1, round(size * image.height / image.width))), Image.BOX)
+    pixels = np.asarray(small, dtype=np.int16)
+    border = np.concatenate([pixels[0], pixels[-1], pixels[:, 0], pixels[:, -1]])
+    mask = np.abs(pixels - np.median(border)) > threshold
+    if mask.mean() < min_area:
+        return None, False
+    rows, cols = np.flatnonzero(mask.any(axis=1)), np.flatnonzero(mask.any(axis=0))
+    height, width = mask.shape
+    partial = rows[0] == 0 or cols[0] == 0 or rows[-1] == height - 1 or cols[-1] == width - 1
+    scale_x, scale_y = image.width / width, image.height / height
+    box = (int(cols[0] * scale_x), int(rows[0] * scale_y), int((cols[-1] + 1) * scale_x), int((rows[-1] + 1) * scale_y))
+    return box, partial
+
+def sharpness(image: Image.Image) -> float:
+    pixels = np.asarray(image, dtype=np.float32)
+    return float(np.var(np.diff(pixels, axis=0))) + float(np.var(np.diff(pixels, axis=1)))
+
+@dataclass
+class PlugTrack:
+    plug_id: int
+    first_frame: Frame
+    last_hash: np.ndarray
+    best_frame: Frame
+    best_sharpness: float
+    frames: int = 1
+    duplicates: int = 0
+    still_run: int = 0
+    emitted: bool = False
+
+class PlugTracker:
+    # One plug at a time passes the camera. A plug appears when a foreground blob is fully
+    # in frame and ends when the blob leaves or its hash jumps to a different plug.
+    # Near-identical samples of the same plug are duplicates; only the sharpest sample is
+    # inspected, as soon as the plug has been still for settle_frames samples.
+    def __init__(
+        self,
+        new_plug_distance: float = NEW_PLUG_DISTANCE,
+        still_distance: float = STILL_DISTANCE,
+        settle_frames: int = SETTLE_FRAMES,
+    ):
+        self.new_plug_distance = new_plug_distance
+        self.still_distance = still_distance
+        self.settle_frames = settle_frames
+        self.current: Optional[PlugTrack] = None
+        self.plugs = 0
+
+    def _start(self, frame: Frame, plug_hash: np.ndarray, frame_sharpness: float) -> PlugTrack:
+        self.plugs += 1
+        STREAM_PLUGS.inc()
+        return PlugTrack(self.plugs, frame, plug_hash, frame, frame_sharpness)
+
+    def _finish(self, track: Optional[PlugTrack]) -> List[PlugTrack]:
+        # A plug that left before it settled is still inspected, from its sharpest sample
+        if track is None or track.emitted:
+            return []
+        track.emitted = True
+        return [track]
+
+    def update(self, frame: Frame) -> List[PlugTrack]:
+        try:
+            gray = load_image(frame.data)
+        except (OSError, SyntaxError, ValueError):
+            # Truncated JPEGs are routine on live feeds; skip the frame and keep the current track
+            STREAM_FRAMES.inc(outcome="corrupt")
+            return []
+        box, partial = foreground_box(gray)
+        if box is None or partial:
+            STREAM_FRAMES.inc(outcome="partial" if partial else "empty")
+            ready, self.current = self._finish(self.current), None
+            return ready
+
+        crop = gray.crop(box)
+        plug_hash = difference_hash(crop)
+        frame_sharpness = sharpness(crop)
+        track = self.current
+        if track is None or hash_distance(plug_hash, track.last_hash) > self.new_plug_distance:
+            ready = self._finish(track)
+            self.current = self._start(frame, plug_hash, frame_sharpness)
+            STREAM_FRAMES.inc(outcome="tracked")
+            return ready + self._settled()
+
+        track.frames += 1
+        if hash_distance(plug_hash, track.last_hash) <= self.still_distance:
+            track.still_run += 1
+            track.duplicates += 1
+            STREAM_FRAMES.inc(outcome="duplicate")
+        else:
+            track.still_run = 0
+            STREAM_FRAMES.inc(outcome="tracked")
+        track.last_hash = plug_hash
+        if not track.emitted and frame_sharpness > track.best_sharpness:
+            track.best_frame, track.best_sharpness = frame, frame_sharpness
+        return self._settled()
+
+    def _settled(self) -> List[PlugTrack]:
+        track = self.current
+        if track is not None and not track.emitted and track.still_run >= self.settle_frames:
+            track.emitted = True
+            return [track]
+        return []
+
+    def flush(self) -> List[PlugTrack]:
+        ready, self.current = self._finish(self.current), None
+        return ready
+
+def read_frames(frames: Iterator[Frame], buffer: "queue.Queue[Optional[Frame]]", stop: threading.Event, live: bool):
+    # When tracking falls behind a live feed, the oldest buffered frame is dropped, not the newest.
+    # Recordings simply wait, so every sampled frame is tracked.
+    try:
+        for frame in frames:
+            if stop.is_set():
+                break
+            STREAM_FRAMES.inc(outcome="read")
+            if not live:
+                buffer.put(frame)
+                continue
+            while True:
+                try:
+                    buffer.put_nowait(frame)
+                    break
+                except queue.Full:
+                    try:
+                        buffer.get_nowait()
+                        STREAM_FRAMES.inc(outcome="dropped")
+                    except queue.Empty:
+                        pass
+    except Exception as e:
+        print(f"Frame source error: {e}")
+    finally:
+        buffer.put(None)
+
+def inspect_plug(engine: InspectionEngine, profile: PromptProfile, track: PlugTrack) -> AnalysisResult:
+    upload = preprocess_image(track.best_frame.data)
+    uploaded_image = Part.from_data(data=upload.data, mime_type=upload.mime_type)
+    return engine.inspect(profile, uploaded_image, engine.references_for(upload.image))
+
+def serve_metrics(port: int) -> ThreadingHTTPServer:
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = REGISTRY.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def run_stream(
+    source: str,
+    profile_name: str,
+    workers: int = 2,
+    sample_fps: float = SAMPLE_FPS,
+    source_fps: float = SOURCE_FPS,
+    realtime: bool = False,
+    tracker: Optional[PlugTracker] = None,
+    engine: Optional[InspectionEngine] = None,
+) -> Dict[str, Any]:
+    profile = get_profile(profile_name)
+    tracker = tracker or PlugTracker()
+    if engine is None:
+        engine = InspectionEngine()
+        engine.warm_up()
+    sink = sink_from_env()
+    print_lock = threading.Lock()
+    verdicts: Dict[str, int] = {"PASS": 0, "FAIL": 0, "errors": 0}
+    started = time.monotonic()
+
+    def emit(track: PlugTrack, future: "Future[AnalysisResult]", inspect_started: float):
+        frame = track.best_frame
+        lag = time.monotonic() - frame.captured_at
+        STREAM_LAG.observe(lag, point="verdict")
+        record: Dict[str, Any] = {
+            "plug": track.plug_id,
+            "frame": frame.index,
+            "first_frame": track.first_frame.index,
+            "stream_seconds": round(frame.timestamp, 3),
+            "samples": track.frames,
+            "duplicates": track.duplicates,
+            "lag_ms": round(lag * 1000, 1),
+            "model_ms": round((time.monotonic() - inspect_started) * 1000, 1),
+        }
+        try:
+            result = future.result()
+        except Exception as e:
+            record["error"] = str(e)
+            with print_lock:
+                verdicts["errors"] += 1
+        else:
+            record.update(verdict=result.overall_assessment, confidence=result.confidence)
+            VERDICTS.inc(profile=profile.name, verdict=result.overall_assessment, source="stream")
+            sink.write({
+                "ts": round(time.time(), 3),
+                "image": f"{source}#frame={frame.index}",
+                "profile": profile.name,
+                "verdict": result.overall_assessment,
+                "confidence": result.confidence,
+                "source": "stream",
+                "latency_ms": record["model_ms"],
+                "lag_ms": record["lag_ms"],
+            })
+            with print_lock:
+                verdicts[result.overall_assessment] = verdicts.get(result.overall_assessment, 0) + 1
+        with print_lock:
+            print(json.dumps(record), flush=True)
+
+    sampler = FrameSampler(sample_fps)
+    frames = open_source(source, sampler.keep, source_fps)
+    if realtime:
+        frames = paced(frames)
+    buffer: "queue.Queue[Optional[Frame]]" = queue.Queue(maxsize=FRAME_BUFFER)
+    stop = threading.Event()
+    live = realtime or "://" in source
+    reader = threading.Thread(target=read_frames, args=(frames, buffer, stop, live), daemon=True)
+    reader.start()
+
+    def submit(tracks: List[PlugTrack]):
+        for track in tracks:
+            inspect_started = time.monotonic()
+            future = executor.submit(inspect_plug, engine, profile, track)
+            future.add_done_callback(lambda f, t=track, s=inspect_started: emit(t, f, s))
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                frame = buffer.get()
+                if frame is None:
+                    break
+                STREAM_LAG.observe(time.monotonic() - frame.captured_at, point="tracking")
+                with stage("stream_track"):
+                    ready = tracker.update(frame)
+                submit(ready)
+            submit(tracker.flush())
+    finally:
+        stop.set()
+        sink.close()
+
+    return {
+        "plugs": tracker.plugs,
+        "verdicts": verdicts,
+        "wall_seconds": time.monotonic() - started,
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Inspect spark plugs from a line-camera recording or stream")
+    parser.add_argument("source", help="Video file or RTSP URL (needs opencv-python), .mjpeg file, MJPEG http:// URL, or a directory of frames")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default=DEFAULT_PROFILE)
+    parser.add_argument("--workers", type=int, default=2, help="Concurrent model calls")
+    parser.add_argument("--sample-fps", type=float, default=SAMPLE_FPS)
+    parser.add_argument("--source-fps", type=float, default=SOURCE_FPS, help="Frame rate of .mjpeg files and frame directories")
+    parser.add_argument("--realtime", action="store_true", help="Replay recordings at their frame rate, like a live camera")
+    parser.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics on this port while running")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+    summary = run_stream(
+        args.source,
+        args.profile,
+        workers=args.workers,
+        sample_fps=args.sample_fps,
+        source_fps=args.source_fps,
+        realtime=args.realtime,
+    )
+    print(f"Stream inspection complete: {summary['plugs']} plugs, {summary['verdicts']['PASS']} PASS, "
+          f"{summary['verdicts']['FAIL']} FAIL, {summary['verdicts']['errors']} errors "
+          f"in {summary['wall_seconds']:.1f}s")
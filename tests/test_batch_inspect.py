@@ -0,0 +1,45 @@
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+import batch_inspect
+from batch_inspect import RateLimiter, RetryBudget, call_with_retries
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(batch_inspect.time, "sleep", lambda seconds: None)
+
+class Flaky:
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+@pytest.mark.parametrize("error", [google_exceptions.BadRequest("400"), google_exceptions.PermissionDenied("403"), ValueError("parse")])
+def test_non_retryable_errors_are_not_retried(error):
+    call = Flaky(error)
+    budget = RetryBudget(100)
+    with pytest.raises(type(error)):
+        call_with_retries(call, RateLimiter(0), budget, max_retries=3, client_attempts=4)
+    assert call.calls == 1
+    assert budget.remaining == 100
+
+def test_retries_charge_the_client_attempts_to_the_budget():
+    call = Flaky(google_exceptions.ServiceUnavailable("503"))
+    budget = RetryBudget(10)
+    assert call_with_retries(call, RateLimiter(0), budget, max_retries=3, client_attempts=4) == "ok"
+    assert call.calls == 2
+    assert budget.remaining == 6
+
+def test_an_exhausted_budget_stops_retrying():
+    call = Flaky(*[google_exceptions.TooManyRequests("429")] * 3)
+    budget = RetryBudget(5)
+    with pytest.raises(google_exceptions.TooManyRequests):
+        call_with_retries(call, RateLimiter(0), budget, max_retries=3, client_attempts=4)
+    # One retry fits in the budget, the second would overdraw it
+    assert call.calls == 2
+    assert budget.remaining == 1
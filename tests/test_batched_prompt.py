@@ -0,0 +1,49 @@
+import json
+
+import pytest
+from vertexai.generative_models import Part
+
+import engine
+from batched_prompt import BATCHED_VERDICT_RESPONSE_SCHEMA, batched_generation_config, parse_batched_response
+from model_backends import StubModel, structured_verdict
+from profiles import STRUCTURED_GENERATION_CONFIG, TEXT_GENERATION_CONFIG, get_profile
+
+def test_structured_batches_keep_an_array_response_schema():
+    config = batched_generation_config(STRUCTURED_GENERATION_CONFIG, 3, structured=True)
+    assert config["response_schema"] is BATCHED_VERDICT_RESPONSE_SCHEMA
+    assert config["response_schema"]["items"]["required"][0] == "candidate"
+    assert "response_schema" not in batched_generation_config(TEXT_GENERATION_CONFIG, 3)
+
+def test_structured_batches_parse_criteria_and_force_fail_on_an_issue():
+    flagged = structured_verdict("FAIL")
+    # The model contradicts its own criteria; the parse must not trust the PASS
+    flagged["overall_assessment"] = "PASS"
+    text = json.dumps([{"candidate": 2, **flagged}, {"candidate": 1, **structured_verdict("PASS")}])
+
+    first, second = parse_batched_response(text, 2, structured=True)
+    assert first.overall_assessment == "PASS"
+    assert second.overall_assessment == "FAIL"
+    assert second.criteria.tip_condition.status == "ISSUE"
+    assert second.confidence == 0.9
+
+def test_structured_batches_reject_items_missing_criteria():
+    item = {"candidate": 1, **structured_verdict("PASS")}
+    del item["criteria"]
+    with pytest.raises(ValueError):
+        parse_batched_response(json.dumps([item]), 1, structured=True)
+
+def test_packed_structured_calls_return_criteria_without_falling_back():
+    stub = StubModel(latency_seconds=0, jitter_seconds=0, fail_rate=0)
+    inspection = engine.InspectionEngine(
+        model_factory=lambda: stub,
+        reference_loader=lambda: {"reference": Part.from_data(data=b"reference", mime_type="image/jpeg")},
+        index_loader=lambda: None,
+    )
+    inspection.warm_up()
+    images = [Part.from_data(data=bytes([i]) * 8, mime_type="image/jpeg") for i in range(3)]
+
+    def single_call(image):
+        raise AssertionError("packed response should have parsed")
+
+    results = inspection.inspect_many(get_profile("compact"), images, single_call=single_call)
+    assert [result.criteria is not None for result in results] == [True, True, True]
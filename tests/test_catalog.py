@@ -0,0 +1,54 @@
+import json
+
+from catalog import CatalogEntry, ReferenceCatalog
+
+class FakeEngine:
+    def __init__(self):
+        self.drops = 0
+
+    def drop_context_caches(self):
+        self.drops += 1
+
+def make_catalog(tmp_path, max_skus=1):
+    manifest = {"default_sku": "A", "skus": {
+        sku: {"profile": "compact", "references": {"r0": f"gs://bucket/{sku}/r0.jpg"}} for sku in ("A", "B", "C")
+    }}
+    path = tmp_path / "catalog.json"
+    path.write_text(json.dumps(manifest))
+    return ReferenceCatalog(lambda spec: CatalogEntry(spec=spec, engine=FakeEngine()), path=str(path), max_skus=max_skus)
+
+def test_idle_entry_is_dropped_on_eviction(tmp_path):
+    catalog = make_catalog(tmp_path)
+    a = catalog.get("A")
+    catalog.get("B")
+    assert catalog.evictions == 1
+    assert a.engine.drops == 1
+
+def test_held_entry_is_dropped_after_last_release(tmp_path):
+    catalog = make_catalog(tmp_path)
+    first = catalog.acquire("A")
+    second = catalog.acquire("A")
+    assert first is second
+    catalog.get("B")
+    # Evicted but still in use: its context caches must outlive the eviction
+    assert first.retired and first.engine.drops == 0
+    catalog.release(first)
+    assert first.engine.drops == 0
+    catalog.release(second)
+    assert first.engine.drops == 1
+
+def test_hold_releases_on_error_and_close_waits_for_holders(tmp_path):
+    catalog = make_catalog(tmp_path, max_skus=2)
+    try:
+        with catalog.hold("A"):
+            raise RuntimeError("inspection failed")
+    except RuntimeError:
+        pass
+    a = catalog.get("A")
+    assert a.holders == 0
+
+    with catalog.hold("B") as b:
+        catalog.close()
+        assert a.engine.drops == 1
+        assert b.engine.drops == 0
+    assert b.engine.drops == 1
@@ -0,0 +1,158 @@
+import datetime
+from types import SimpleNamespace
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+from vertexai.generative_models import Part
+
+import context_cache
+import engine
+import metrics
+from context_cache import ReferenceContextCache
+from model_backends import StubModel
+from profiles import get_profile
+
+class FakeCachedContent:
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.ttl_updates = 0
+        self.deleted = False
+
+    def update(self, ttl):
+        self.ttl_updates += 1
+
+    def delete(self):
+        self.deleted = True
+
+class FakeVertex:
+    # Stands in for CachedContent.create and GenerativeModel.from_cached_content
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.created = []
+
+    def create(self, **kwargs):
+        if self.fail:
+            raise google_exceptions.PermissionDenied("caching not enabled")
+        self.created.append(FakeCachedContent(**kwargs))
+        return self.created[-1]
+
+    def bind(self, cached_content):
+        return SimpleNamespace(cached_content=cached_content)
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(context_cache, "time", clock)
+    return clock
+
+def references(*texts):
+    return [Part.from_text(text) for text in texts]
+
+def make_cache(vertex: FakeVertex, parts=None, **kwargs) -> ReferenceContextCache:
+    return ReferenceContextCache(
+        "model", "instructions", parts or references("reference"),
+        ttl=datetime.timedelta(minutes=60), renew_before=datetime.timedelta(minutes=5),
+        create_cached_content=vertex.create, model_from_cached_content=vertex.bind, **kwargs,
+    )
+
+def test_cache_is_created_once_and_renewed_before_expiry(clock):
+    vertex = FakeVertex()
+    cache = make_cache(vertex)
+
+    model = cache.model()
+    assert model.cached_content is vertex.created[0]
+    assert cache.model() is model
+    assert len(vertex.created) == 1
+
+    clock.now = 56 * 60
+    assert cache.model() is model
+    assert vertex.created[0].ttl_updates == 1
+
+def test_expired_cache_is_recreated(clock):
+    vertex = FakeVertex()
+    cache = make_cache(vertex)
+    cache.model()
+
+    clock.now = 61 * 60
+    cache.model()
+    assert len(vertex.created) == 2
+    assert vertex.created[0].deleted
+
+def test_creation_failure_falls_back_for_a_cooldown(clock):
+    vertex = FakeVertex(fail=True)
+    cache = make_cache(vertex, retry_unavailable_after=300)
+    assert cache.model() is None
+
+    vertex.fail = False
+    clock.now = 299
+    assert cache.model() is None
+    clock.now = 300
+    assert cache.model() is not None
+
+def test_changed_references_rebuild_the_cache(clock):
+    vertex = FakeVertex()
+    cache = make_cache(vertex)
+    cache.model()
+
+    assert not cache.update_references(references("reference"))
+    assert cache.update_references(references("reference", "new reference"))
+    assert vertex.created[0].deleted
+    cache.model()
+    assert len(vertex.created) == 2
+
+class ExpiredCacheModel:
+    def generate_content(self, contents, generation_config=None):
+        raise google_exceptions.NotFound("cached content expired")
+
+def test_engine_falls_back_to_the_full_prompt_on_a_local_stub(monkeypatch):
+    vertex = FakeVertex()
+    monkeypatch.setattr(engine, "ReferenceContextCache", lambda *args, **kwargs: ReferenceContextCache(
+        *args, create_cached_content=vertex.create, model_from_cached_content=lambda content: ExpiredCacheModel(), **kwargs
+    ))
+    stub = StubModel(latency_seconds=0, jitter_seconds=0, fail_rate=0)
+    inspection = engine.InspectionEngine(
+        context_caching=True,
+        model_factory=lambda: stub,
+        reference_loader=lambda: {"reference": Part.from_data(data=b"reference", mime_type="image/jpeg")},
+        index_loader=lambda: None,
+    )
+    inspection.warm_up()
+    result = inspection.inspect(get_profile("compact"), Part.from_data(data=b"plug", mime_type="image/jpeg"))
+
+    assert result.overall_assessment == "PASS"
+    assert result.criteria is not None
+    # The expired cache was dropped; the next call builds a fresh one
+    assert vertex.created[0].deleted
+
+class UsageReportingCacheModel:
+    def generate_content(self, contents, generation_config=None):
+        usage = SimpleNamespace(prompt_token_count=7, candidates_token_count=3)
+        return SimpleNamespace(text="Overall Assessment: PASS", usage_metadata=usage)
+
+def test_cached_calls_record_token_usage(monkeypatch):
+    vertex = FakeVertex()
+    monkeypatch.setattr(engine, "ReferenceContextCache", lambda *args, **kwargs: ReferenceContextCache(
+        *args, create_cached_content=vertex.create, model_from_cached_content=lambda content: UsageReportingCacheModel(), **kwargs
+    ))
+    tokens = metrics.MODEL_TOKENS
+    before = dict(tokens._current())
+    stub = StubModel(latency_seconds=0, jitter_seconds=0, fail_rate=0)
+    inspection = engine.InspectionEngine(
+        context_caching=True,
+        model_factory=lambda: stub,
+        reference_loader=lambda: {"reference": Part.from_data(data=b"reference", mime_type="image/jpeg")},
+        index_loader=lambda: None,
+    )
+    inspection.warm_up()
+    inspection.inspect(get_profile("refined"), Part.from_data(data=b"plug", mime_type="image/jpeg"))
+
+    after = dict(tokens._current())
+    assert after[("in",)] - before.get(("in",), 0.0) == 7
+    assert after[("out",)] - before.get(("out",), 0.0) == 3
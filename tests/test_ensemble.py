@@ -0,0 +1,96 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import ensemble
+from ensemble import Ensemble, build_ensemble
+from profiles import get_profile
+from schemas import CRITERIA, AnalysisResult, CriteriaFindings, CriterionFinding
+
+def verdict(overall_assessment: str, **statuses) -> AnalysisResult:
+    criteria = CriteriaFindings(**{
+        name: CriterionFinding(status=statuses.get(name, "NORMAL"), confidence=0.9) for name in CRITERIA
+    })
+    return AnalysisResult(analysis="", overall_assessment=overall_assessment, criteria=criteria, confidence=0.9)
+
+class FakeEngine:
+    # Answers each profile after a delay and remembers which ones reached the model
+    def __init__(self, answers, cached=None):
+        self.answers = answers
+        self.cached = cached or {}
+        self.called = []
+        self.cancelled = []
+
+    def references_for(self, uploaded_image):
+        return {}
+
+    def cached_result(self, profile, image_digest):
+        return self.cached.get(profile.name)
+
+    def store_result(self, profile, image_digest, result):
+        pass
+
+    async def inspect_async(self, profile, uploaded_image, references=None):
+        self.called.append(profile.name)
+        delay, result = self.answers[profile.name]
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled.append(profile.name)
+            raise
+        return result
+
+def structured_ensemble() -> Ensemble:
+    return build_ensemble(["strict_structured", "refined_structured", "significant_structured"], weights={})
+
+def test_default_profiles_report_criteria():
+    assert all(get_profile(name).structured for name in ensemble.ENSEMBLE_PROFILES)
+
+def test_combined_issue_fails_a_plug_the_votes_passed():
+    engine = FakeEngine({
+        "strict_structured": (0.0, verdict("PASS", tip_condition="UNCLEAR")),
+        "refined_structured": (0.0, verdict("PASS", tip_condition="UNCLEAR")),
+        "significant_structured": (0.05, verdict("FAIL", tip_condition="ISSUE")),
+    })
+    result = asyncio.run(structured_ensemble().run(engine, "plug"))
+
+    # Two PASS votes would settle a plain vote, but the last profile could still flag the tip
+    assert engine.cancelled == []
+    assert result.criteria.tip_condition.status == "ISSUE"
+    assert result.overall_assessment == "FAIL"
+    assert result.disagreement.criteria_override
+
+def test_pass_short_circuits_once_no_criterion_can_be_flagged():
+    engine = FakeEngine({
+        "strict_structured": (0.0, verdict("PASS")),
+        "refined_structured": (0.0, verdict("PASS")),
+        "significant_structured": (5.0, verdict("FAIL", tip_condition="ISSUE")),
+    })
+    result = asyncio.run(structured_ensemble().run(engine, "plug"))
+
+    assert result.overall_assessment == "PASS"
+    assert result.short_circuited
+    assert engine.cancelled == ["significant_structured"]
+    assert not result.disagreement.criteria_override
+
+def test_each_model_call_holds_its_own_slot():
+    engine = FakeEngine(
+        {name: (0.01, verdict("PASS")) for name in ("refined_structured", "significant_structured")},
+        cached={"strict_structured": verdict("PASS")},
+    )
+    held, peak = [], []
+
+    @asynccontextmanager
+    async def slot():
+        held.append(True)
+        peak.append(len(held))
+        try:
+            yield
+        finally:
+            held.pop()
+
+    result = asyncio.run(structured_ensemble().run(engine, "plug", image_digest="digest", slot=slot))
+
+    assert result.votes["strict_structured"].source == "cache"
+    # The cached vote takes no slot; the two model calls run concurrently, one slot each
+    assert sorted(engine.called) == ["refined_structured", "significant_structured"]
+    assert len(peak) == 2 and max(peak) == 2
@@ -0,0 +1,119 @@
+from types import SimpleNamespace
+
+import pytest
+
+import job_queue
+from job_queue import JobQueue, QueueFullError, deliver_callback, validate_callback_url
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(job_queue, "time", SimpleNamespace(time=clock.time, sleep=lambda seconds: None))
+    return clock
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "jobs.sqlite3")
+
+def open_queue(path: str, **kwargs) -> JobQueue:
+    kwargs.setdefault("lease_seconds", 60)
+    kwargs.setdefault("retry_delay_seconds", 0)
+    return JobQueue(path, **kwargs)
+
+def test_lapsed_lease_requeues_the_job_for_another_worker(clock, path):
+    first, second = open_queue(path), open_queue(path)
+    job, _ = first.enqueue(b"plug", "image/jpeg", "compact")
+    assert first.claim().id == job.id
+
+    # While the lease is live nobody else can take the job
+    clock.now += 59
+    assert second.claim() is None
+    assert first.renew(job.id)
+
+    clock.now += 61
+    taken = second.claim()
+    assert taken.id == job.id and taken.attempts == 2
+    # The first worker lost the job: its renewal and late result are refused
+    assert not first.renew(job.id)
+    assert not first.complete(job.id, "{}")
+    assert not first.fail(job.id, "late", retryable=True)
+    assert second.complete(job.id, "{}")
+    assert second.get(job.id).status == "done"
+
+def test_lapsed_leases_count_against_max_attempts(clock, path):
+    queue = open_queue(path, max_attempts=2)
+    job, _ = queue.enqueue(b"plug", "image/jpeg", "compact")
+    for _ in range(2):
+        assert queue.claim().id == job.id
+        clock.now += 61
+
+    assert queue.claim() is None
+    failed = queue.get(job.id)
+    assert failed.status == "failed"
+    assert failed.error == "Worker lease expired"
+
+def test_retryable_failures_requeue_until_max_attempts(clock, path):
+    queue = open_queue(path, max_attempts=2)
+    job, _ = queue.enqueue(b"plug", "image/jpeg", "compact")
+
+    queue.claim()
+    assert queue.fail(job.id, "503", retryable=True)
+    assert queue.get(job.id).status == "queued"
+    queue.claim()
+    assert not queue.fail(job.id, "503", retryable=True)
+    assert queue.get(job.id).status == "failed"
+
+def test_idempotency_key_replays_the_original_job(clock, path):
+    queue = open_queue(path)
+    job, created = queue.enqueue(b"plug", "image/jpeg", "compact", idempotency_key="line-1/42")
+    replay, replay_created = queue.enqueue(b"other", "image/jpeg", "strict", idempotency_key="line-1/42")
+
+    assert created and not replay_created
+    assert replay.id == job.id and replay.profile == "compact"
+    assert queue.depth() == 1
+
+def test_depth_limit_rejects_new_jobs_but_not_replays(clock, path):
+    queue = open_queue(path)
+    queue.enqueue(b"plug", "image/jpeg", "compact", idempotency_key="a", max_depth=2)
+    queue.enqueue(b"plug", "image/jpeg", "compact", max_depth=2)
+
+    with pytest.raises(QueueFullError):
+        queue.enqueue(b"plug", "image/jpeg", "compact", max_depth=2)
+    with pytest.raises(QueueFullError):
+        queue.enqueue(b"plug", "image/jpeg", "compact", idempotency_key="b", max_depth=2)
+    _, created = queue.enqueue(b"plug", "image/jpeg", "compact", idempotency_key="a", max_depth=2)
+    assert not created
+
+@pytest.mark.parametrize("url", [
+    "file:///etc/passwd",
+    "ftp://example.com/result",
+    "http://169.254.169.254/computeMetadata/v1/",
+    "http://127.0.0.1:8000/admin",
+    "http://[::1]/",
+    "http://10.0.0.5/hook",
+    "http://localhost/hook",
+    "http://metadata.google.internal/",
+    "https:///no-host",
+])
+def test_callback_urls_must_be_public_http(url):
+    with pytest.raises(ValueError):
+        validate_callback_url(url, allowed_hosts=[])
+
+def test_callback_allowlist():
+    allowed = ["mes.plant.local", ".hooks.example.com"]
+    assert validate_callback_url("http://mes.plant.local/done", allowed)
+    assert validate_callback_url("https://line1.hooks.example.com/done", allowed)
+    with pytest.raises(ValueError):
+        validate_callback_url("https://example.org/done", allowed)
+
+def test_delivery_refuses_names_that_resolve_to_internal_addresses(monkeypatch):
+    monkeypatch.setattr(job_queue.socket, "getaddrinfo", lambda *args, **kwargs: [(2, 1, 6, "", ("10.1.2.3", 443))])
+    status = deliver_callback("https://hooks.example.com/done", {"id": "job"}, allowed_hosts=[])
+    assert status.startswith("failed:") and "public address" in status
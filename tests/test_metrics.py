@@ -0,0 +1,47 @@
+from metrics import Counter, Gauge, Histogram, Metric, Registry, percentile
+
+def test_registry_renders_counters_callback_gauges_and_histograms():
+    registry = Registry()
+    verdicts = registry.register(Counter("verdicts_total", "Verdicts", ["verdict"]))
+    registry.register(Gauge("queue_depth", "Queued jobs", ["lane"], callback=lambda: {("normal",): 3, ("reinspection",): 1}))
+    latency = registry.register(Histogram("latency_seconds", "Latency", buckets=(0.1, 1.0)))
+    verdicts.inc(verdict="PASS")
+    verdicts.inc(2, verdict="FAIL")
+    latency.observe(0.05)
+    latency.observe(0.5)
+
+    assert registry.render().splitlines() == [
+        "# HELP verdicts_total Verdicts",
+        "# TYPE verdicts_total counter",
+        'verdicts_total{verdict="FAIL"} 2.0',
+        'verdicts_total{verdict="PASS"} 1.0',
+        "# HELP queue_depth Queued jobs",
+        "# TYPE queue_depth gauge",
+        'queue_depth{lane="normal"} 3',
+        'queue_depth{lane="reinspection"} 1',
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{le="0.1"} 1',
+        'latency_seconds_bucket{le="1.0"} 2',
+        'latency_seconds_bucket{le="+Inf"} 2',
+        "latency_seconds_sum 0.55",
+        "latency_seconds_count 2",
+    ]
+
+def test_plain_metrics_and_failing_callbacks_still_render():
+    registry = Registry()
+    registry.register(Metric("untyped", "Untyped", callback=lambda: {(): 1.5}))
+    registry.register(Gauge("broken", "Broken", callback=lambda: 1 / 0))
+
+    assert registry.render().splitlines() == [
+        "# HELP untyped Untyped",
+        "# TYPE untyped untyped",
+        "untyped 1.5",
+        "# HELP broken Broken",
+        "# TYPE broken gauge",
+    ]
+
+def test_percentile_uses_nearest_rank():
+    assert percentile([], 95) is None
+    assert percentile([3.0, 1.0, 2.0], 50) == 2.0
+    assert percentile(range(1, 101), 95) == 95
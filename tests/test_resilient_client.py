@@ -0,0 +1,252 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+import resilient_client
+from resilient_client import CircuitBreaker, CircuitOpenError, ResilientModel
+
+class FakeTarget:
+    # Plays back a script of outcomes, one per call: an exception to raise, a response to
+    # return, or (seconds, outcome) to wait first on the async path
+    def __init__(self, *script):
+        self.script = list(script)
+        self.calls = 0
+        self.started_at = []
+        self.cancelled = 0
+
+    def _next(self):
+        self.calls += 1
+        outcome = self.script.pop(0) if len(self.script) > 1 else self.script[0]
+        return outcome if isinstance(outcome, tuple) else (0.0, outcome)
+
+    def generate_content(self, contents, generation_config=None, stream=False):
+        _, outcome = self._next()
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    async def generate_content_async(self, contents, generation_config=None, stream=False):
+        self.started_at.append(time.perf_counter())
+        delay, outcome = self._next()
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(resilient_client, "backoff_delay", lambda attempt: 0.0)
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(
+        resilient_client, "time", SimpleNamespace(monotonic=clock.monotonic, perf_counter=time.perf_counter, sleep=lambda seconds: None)
+    )
+    return clock
+
+def response(text: str = "ok"):
+    return SimpleNamespace(text=text, usage_metadata=None)
+
+@pytest.mark.parametrize("error", [
+    google_exceptions.TooManyRequests("429"),
+    google_exceptions.ResourceExhausted("quota"),
+    google_exceptions.InternalServerError("500"),
+    google_exceptions.ServiceUnavailable("503"),
+])
+def test_transient_errors_are_retried(error):
+    target = FakeTarget(error, error, response("recovered"))
+    model = ResilientModel([("primary", target)], max_attempts=3)
+
+    assert model.generate_content(["prompt"]).text == "recovered"
+    assert target.calls == 3
+    assert model.counters["retries"] == 2
+
+@pytest.mark.parametrize("error", [
+    google_exceptions.BadRequest("400"),
+    google_exceptions.PermissionDenied("403"),
+])
+def test_client_errors_fail_immediately(error):
+    target = FakeTarget(error, response())
+    model = ResilientModel([("primary", target)], max_attempts=4)
+
+    with pytest.raises(type(error)):
+        model.generate_content(["prompt"])
+    assert target.calls == 1
+    assert model.counters["retries"] == 0
+    # A bad request says nothing about the backend's health
+    assert model.targets[0].breaker.failures == 0
+
+def test_gives_up_after_max_attempts():
+    target = FakeTarget(google_exceptions.ServiceUnavailable("503"))
+    model = ResilientModel([("primary", target)], max_attempts=3, failure_threshold=10)
+
+    with pytest.raises(google_exceptions.ServiceUnavailable):
+        model.generate_content(["prompt"])
+    assert target.calls == 3
+
+def test_async_transient_errors_are_retried():
+    target = FakeTarget(google_exceptions.TooManyRequests("429"), response("recovered"))
+    model = ResilientModel([("primary", target)], max_attempts=2)
+
+    assert asyncio.run(model.generate_content_async(["prompt"])).text == "recovered"
+    assert target.calls == 2
+
+def test_breaker_opens_after_threshold_and_allows_one_half_open_probe(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=10)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert breaker.retry_after() == pytest.approx(10)
+
+    clock.advance(10)
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    # A failed probe re-opens for another full reset period
+    breaker.record_failure()
+    assert breaker.state == "open"
+    clock.advance(9)
+    assert not breaker.allow()
+    clock.advance(1)
+    assert breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+    assert breaker.allow() and breaker.allow()
+
+def test_released_probe_lets_the_next_call_probe(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=5)
+    breaker.record_failure()
+    clock.advance(5)
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.release()
+    assert breaker.allow()
+
+def test_open_circuit_rejects_without_calling_the_backend(clock):
+    target = FakeTarget(google_exceptions.ServiceUnavailable("503"))
+    model = ResilientModel([("primary", target)], max_attempts=1, failure_threshold=2, reset_seconds=30)
+    for _ in range(2):
+        with pytest.raises(google_exceptions.ServiceUnavailable):
+            model.generate_content(["prompt"])
+
+    with pytest.raises(CircuitOpenError) as raised:
+        model.generate_content(["prompt"])
+    assert raised.value.retry_after == pytest.approx(30)
+    assert target.calls == 2
+    assert model.counters["circuit_rejections"] == 1
+
+def test_retry_fails_over_to_the_next_target():
+    primary = FakeTarget(google_exceptions.ServiceUnavailable("503"))
+    secondary = FakeTarget(response("secondary"))
+    model = ResilientModel([("primary", primary), ("secondary", secondary)], max_attempts=2)
+
+    assert model.generate_content(["prompt"]).text == "secondary"
+    assert (primary.calls, secondary.calls) == (1, 1)
+    assert model.counters["failovers"] == 1
+
+def test_open_primary_is_skipped_for_the_next_target(clock):
+    primary = FakeTarget(google_exceptions.ServiceUnavailable("503"))
+    secondary = FakeTarget(response("secondary"))
+    model = ResilientModel([("primary", primary), ("secondary", secondary)], max_attempts=1, failure_threshold=1)
+    with pytest.raises(google_exceptions.ServiceUnavailable):
+        model.generate_content(["prompt"])
+
+    assert model.generate_content(["prompt"]).text == "secondary"
+    assert primary.calls == 1
+    assert model.stats()["targets"] == {"primary": "open", "secondary": "closed"}
+
+def hedging_model(primary: FakeTarget, secondary: FakeTarget, delay: float = 0.05) -> ResilientModel:
+    model = ResilientModel(
+        [("primary", primary), ("secondary", secondary)],
+        max_attempts=1, hedge=True, hedge_min_samples=5, hedge_min_delay=0.0,
+    )
+    # A warm latency window whose p95 becomes the hedge delay
+    for _ in range(5):
+        model.latencies.add(delay)
+    return model
+
+def test_hedge_fires_after_p95_and_cancels_the_loser():
+    primary = FakeTarget((5.0, response("primary")))
+    secondary = FakeTarget(response("secondary"))
+    model = hedging_model(primary, secondary)
+
+    assert asyncio.run(model.generate_content_async(["prompt"])).text == "secondary"
+    assert secondary.started_at[0] - primary.started_at[0] >= 0.05
+    assert primary.cancelled == 1
+    assert model.counters["hedges"] == 1
+    assert model.counters["hedge_wins"] == 1
+
+def test_no_hedge_when_the_primary_answers_in_time():
+    primary = FakeTarget((0.0, response("primary")))
+    secondary = FakeTarget(response("secondary"))
+    model = hedging_model(primary, secondary, delay=1.0)
+
+    assert asyncio.run(model.generate_content_async(["prompt"])).text == "primary"
+    assert secondary.calls == 0
+    assert model.counters["hedges"] == 0
+
+def test_cancelled_half_open_probe_releases_the_breaker():
+    primary = FakeTarget((5.0, response("primary")))
+    secondary = FakeTarget(response("secondary"))
+    model = hedging_model(primary, secondary)
+    breaker = model.targets[0].breaker
+    # Put the primary into half-open so this call is its single probe
+    breaker.failures = breaker.failure_threshold
+    breaker.opened_at = time.monotonic() - breaker.reset_seconds
+    released = []
+    release = breaker.release
+    breaker.release = lambda: (released.append(True), release())
+
+    assert asyncio.run(model.generate_content_async(["prompt"])).text == "secondary"
+    assert primary.cancelled == 1
+    assert released == [True]
+    # The lost probe proved nothing, so the next call may probe again
+    assert breaker.allow()
+
+def test_single_target_hedges_on_the_primary_without_a_circuit_rejection():
+    target = FakeTarget((5.0, response("slow")), response("hedge"))
+    model = ResilientModel([("primary", target)], max_attempts=1, hedge=True, hedge_min_samples=5, hedge_min_delay=0.0)
+    for _ in range(5):
+        model.latencies.add(0.05)
+
+    assert asyncio.run(model.generate_content_async(["prompt"])).text == "hedge"
+    assert model.counters["hedges"] == 1
+    assert model.counters["circuit_rejections"] == 0
+    assert model.stats()["targets"] == {"primary": "closed"}
+
+def test_cancelled_primary_latency_stays_in_the_window():
+    primary = FakeTarget((5.0, response("primary")))
+    secondary = FakeTarget(response("secondary"))
+    model = hedging_model(primary, secondary)
+
+    asyncio.run(model.generate_content_async(["prompt"]))
+    # The warm samples, the hedge's own latency and the lost primary's elapsed time
+    assert len(model.latencies) == 7
+    assert model.latencies.percentile(100) >= 0.05
@@ -0,0 +1,56 @@
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+
+import result_cache
+from result_cache import ResultCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(result_cache, "time", SimpleNamespace(time=clock.time))
+    return clock
+
+def disk_keys(path) -> list:
+    with sqlite3.connect(path) as db:
+        return sorted(row[0] for row in db.execute("SELECT key FROM results"))
+
+def test_expired_disk_rows_are_deleted_when_read(clock, tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = ResultCache(max_entries=1, ttl_seconds=60, disk_path=path)
+    cache.set("old", "{}")
+    # Push "old" out of memory so the read goes to disk
+    cache.set("new", "{}")
+
+    clock.now += 61
+    assert cache.get("old") is None
+    assert "old" not in disk_keys(path)
+
+def test_set_prunes_expired_rows_nobody_reads(clock, tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = ResultCache(ttl_seconds=60, disk_path=path)
+    for key in ("a", "b", "c"):
+        cache.set(key, "{}")
+
+    clock.now += 61
+    cache.set("d", "{}")
+    assert disk_keys(path) == ["d"]
+
+def test_disk_entries_survive_a_restart_until_they_expire(clock, tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = ResultCache(ttl_seconds=60, disk_path=path)
+    cache.set("plug", '{"overall_assessment": "PASS"}')
+    cache.close()
+
+    reopened = ResultCache(ttl_seconds=60, disk_path=path)
+    clock.now += 30
+    assert reopened.get("plug") == '{"overall_assessment": "PASS"}'
+    assert reopened.stats()["disk_hits"] == 1
@@ -0,0 +1,30 @@
+import json
+
+import pytest
+
+from result_sink import PARQUET_COLUMNS, ParquetBackend
+
+def test_parquet_files_keep_one_schema_whatever_record_comes_first(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    backend = ParquetBackend(str(tmp_path), rows_per_file=2)
+    single = {"ts": 1.0, "image": "a", "profile": "compact", "verdict": "PASS", "confidence": 0.9, "latency_ms": 12}
+    ensemble = {
+        "ts": 2.0, "image": "b", "profile": "ensemble:strict_structured+refined_structured", "verdict": "FAIL",
+        "votes": {"strict_structured": "FAIL", "refined_structured": "PASS"}, "split": True, "short_circuited": False,
+        "criteria": {"tip_condition": "ISSUE"}, "camera": "line-1",
+    }
+    backend.write([single, ensemble])
+    backend.write([ensemble])
+    backend.close()
+
+    tables = [pq.read_table(str(path)) for path in sorted(tmp_path.glob("*.parquet"))]
+    assert len(tables) == 2
+    assert tables[0].schema.equals(tables[1].schema)
+    assert tables[0].schema.names == [name for name, _ in PARQUET_COLUMNS]
+
+    rows = tables[0].to_pylist()
+    assert rows[0]["votes"] is None and rows[0]["split"] is None and rows[0]["latency_ms"] == 12.0
+    assert json.loads(rows[1]["votes"]) == ensemble["votes"]
+    assert rows[1]["split"] is True and rows[1]["short_circuited"] is False
+    # Keys outside the schema are kept rather than dropped
+    assert json.loads(rows[1]["extra"]) == {"camera": "line-1"}
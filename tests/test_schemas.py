@@ -0,0 +1,31 @@
+import os
+
+import pytest
+
+from schemas import assessment_from_text
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "spark_plug_analysis_results")
+
+def sample(name: str) -> str:
+    with open(os.path.join(RESULTS_DIR, name)) as f:
+        return f.read()
+
+@pytest.mark.parametrize("name, expected", [
+    ("focused_analysis_result.txt", "PASS"),
+    ("refined_analysis_result.txt", "FAIL"),
+    ("strict_analysis_result.txt", "FAIL"),
+])
+def test_saved_reports_parse_to_their_verdict(name, expected):
+    assert assessment_from_text(sample(name)) == expected
+
+@pytest.mark.parametrize("text, expected", [
+    ("Tip looks fine.\n\nOverall assessment: PASS", "PASS"),
+    ("Overall assessment is FAIL.\n\nOn reflection, **PASS**", "FAIL"),
+    ("No issues found.\n\n**PASS**", "PASS"),
+    ("Branding is smudged.\nFail.", "FAIL"),
+    ("Everything checks out, so the plug is a PASS.", "PASS"),
+    ("The plug would pass, probably.", "FAIL"),
+    ("", "FAIL"),
+])
+def test_assessment_fallbacks(text, expected):
+    assert assessment_from_text(text) == expected